@@ -0,0 +1,91 @@
+import contextlib
+import os
+import tempfile
+
+import get_routes
+import helpers.logs
+import utilities.collector
+import utilities.session_pool
+from benchmarks.fake_device import FakeFleet
+from benchmarks.harness import timed, record
+from helpers.commands import RunCommand
+from utilities.collector import DeviceCollector
+from utilities.parser_pool import ParserPool
+from utilities.session_pool import SessionPool
+
+"""
+    End to end collection benchmark: collect, parse and save every device in a fleet of fake devices
+    through the same collect_round get_routes.py runs, with the SSH stage replaced by FakeFleet.  Run from
+    the repository root with:
+
+        python -m benchmarks.bench_collection
+"""
+
+DEVICES = 20
+SIZES = (1_000, 10_000)
+CONNECT_LATENCY = 0.2
+COMMAND_LATENCY = 0.05
+
+
+@contextlib.contextmanager
+def fake_fleet(fleet: FakeFleet):
+    # Swap Netmiko's ConnectHandler for the fleet's and run inside a scratch directory, since the
+    # snapshots are written to routes/ under the working directory.  The fake output is not worth keeping,
+    # so raw output capture is switched off for the run
+    originals = (utilities.collector.ConnectHandler, utilities.session_pool.ConnectHandler, os.getcwd(),
+                 helpers.logs.CAPTURE_RAW_OUTPUT)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        utilities.collector.ConnectHandler = fleet.connect_handler
+        utilities.session_pool.ConnectHandler = fleet.connect_handler
+        helpers.logs.CAPTURE_RAW_OUTPUT = False
+        os.chdir(tmp)
+
+        try:
+            yield
+        finally:
+            (utilities.collector.ConnectHandler, utilities.session_pool.ConnectHandler, cwd,
+             helpers.logs.CAPTURE_RAW_OUTPUT) = originals
+            os.chdir(cwd)
+
+
+def run(sizes=SIZES, devices: int = DEVICES, platform: str = "cisco_nxos"):
+
+    results = []
+    command = RunCommand.show_routes()
+
+    for count in sizes:
+        fleet = FakeFleet.synthetic(devices, platform, count, command=command,
+                                    connect_latency=CONNECT_LATENCY, command_latency=COMMAND_LATENCY)
+        device_list = fleet.device_list(platform)
+
+        with fake_fleet(fleet), ParserPool() as parser_pool:
+
+            # One device at a time is how get_routes.py used to run
+            if count == min(sizes):
+                collector = DeviceCollector(max_workers=1, parser=None)
+                _, elapsed = timed(get_routes.collect_round, device_list, command, collector, parser_pool)
+                results.append(record("collection", f"sequential/{devices}x{count}", elapsed))
+
+            collector = DeviceCollector(max_workers=devices, parser=None)
+            _, elapsed = timed(get_routes.collect_round, device_list, command, collector, parser_pool)
+            results.append(record("collection", f"concurrent/{devices}x{count}", elapsed))
+
+            # A watch mode round once the pooled sessions are already open
+            with SessionPool() as session_pool:
+                get_routes.collect_round(device_list, command, collector, parser_pool, worker=session_pool.collect)
+                _, elapsed = timed(get_routes.collect_round, device_list, command, collector, parser_pool,
+                                   worker=session_pool.collect)
+                results.append(record("collection", f"pooled/{devices}x{count}", elapsed))
+
+    return results
+
+
+def main():
+
+    for result in run():
+        print(f"{result['case']:<28} {result['seconds']:8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import contextlib
+import io
+import json
+import pathlib
+import tempfile
+
+from benchmarks.harness import timed, record
+from benchmarks.synthetic import parsed_routes, migrate
+from utilities.route_handler import ProcessRoutes
+
+"""
+    Measures ProcessRoutes.compare_routes end to end, loading the JSON files included.  Run from the
+    repository root with:
+
+        python -m benchmarks.bench_compare_routes
+"""
+
+SIZES = (1_000, 10_000, 100_000)
+
+
+def run(sizes=SIZES):
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = pathlib.Path(tmp)
+
+        for count in sizes:
+            original = parsed_routes(count, vrfs=4)
+            (tmp / "original.json").write_text(json.dumps(original))
+            (tmp / "migrated.json").write_text(json.dumps(migrate(original)))
+
+            # compare_routes prints every missing route, keep that off the benchmark output
+            with contextlib.redirect_stdout(io.StringIO()):
+                _, elapsed = timed(ProcessRoutes().compare_routes, "bench", tmp / "original.json", tmp / "migrated.json")
+
+            results.append(record("compare_routes", str(count), elapsed))
+
+    return results
+
+
+def main():
+
+    for result in run():
+        print(f"{result['case']:<12} {result['seconds']:8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import pathlib
+import subprocess
+import sys
+
+from benchmarks.harness import record
+
+"""
+    Measures how long each CLI command takes to import, in a fresh interpreter every time so nothing is
+    already cached in sys.modules.  The interpreter's own startup is not included.  Run from the
+    repository root with:
+
+        python -m benchmarks.bench_import
+"""
+
+SIZES = ("diff", "report", "collect")
+REPEAT = 5
+
+ROOT = pathlib.Path(__file__).parent.parent
+
+# Run in the child interpreter: import the command's module and print the time taken and the heavy
+# dependencies that came with it
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+import cli
+cli.load({command!r})
+elapsed = time.perf_counter() - start
+heavy = [name for name in ("netmiko", "paramiko", "ntc_templates", "icmplib", "dotenv", "tenacity") if name in sys.modules]
+print(elapsed, ",".join(heavy))
+"""
+
+
+def import_time(command: str):
+    """
+    import_time The fastest of REPEAT imports of a command in a new interpreter
+
+    Returns:
+        tuple: (seconds, list of heavy dependencies imported), seconds is None if the import failed
+    """
+
+    best = None
+    heavy = []
+
+    for _ in range(REPEAT):
+        completed = subprocess.run([sys.executable, "-c", _PROBE.format(command=command)], cwd=ROOT,
+                                   capture_output=True, text=True)
+        if completed.returncode:
+            return None, []
+
+        seconds, _, modules = completed.stdout.strip().partition(" ")
+        best = float(seconds) if best is None else min(best, float(seconds))
+        heavy = [module for module in modules.split(",") if module]
+
+    return best, heavy
+
+
+def run(sizes=SIZES):
+
+    results = []
+
+    for command in sizes:
+        seconds, heavy = import_time(command)
+        if seconds is None:
+            # collect needs the full requirements.txt installed
+            continue
+        results.append(record("import", command, seconds, heavy=heavy))
+
+    return results
+
+
+def main():
+
+    for result in run():
+        print(f"{result['case']:<10} {result['seconds'] * 1000:8.1f}ms  {', '.join(result['heavy']) or 'no heavy dependencies'}")
+
+
+if __name__ == "__main__":
+    main()
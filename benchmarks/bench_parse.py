@@ -0,0 +1,37 @@
+from ntc_templates.parse import parse_output
+
+from benchmarks.harness import timed, record
+from benchmarks.synthetic import show_ip_route
+
+"""
+    Measures NTC templates parse_output on synthetic show ip route output for both platforms.  Run from
+    the repository root with:
+
+        python -m benchmarks.bench_parse
+"""
+
+SIZES = (1_000, 10_000, 100_000)
+PLATFORMS = ("cisco_ios", "cisco_nxos")
+
+
+def run(sizes=SIZES):
+
+    results = []
+
+    for platform in PLATFORMS:
+        for count in sizes:
+            output = show_ip_route(platform, count)
+            parsed, elapsed = timed(parse_output, platform=platform, command="show ip route", data=output)
+            results.append(record("parse", f"{platform}/{count}", elapsed, bytes=len(output), routes=len(parsed)))
+
+    return results
+
+
+def main():
+
+    for result in run():
+        print(f"{result['case']:<24} {result['seconds']:8.3f}s {result['routes']:>8} routes")
+
+
+if __name__ == "__main__":
+    main()
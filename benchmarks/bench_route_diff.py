@@ -0,0 +1,51 @@
+from benchmarks.harness import timed, record
+from benchmarks.synthetic import parsed_routes, migrate
+from utilities.route_diff import diff_routes, semantic_diff
+
+"""
+    Compares the hash-indexed diff engine with the list scan compare_routes used to do, and measures the
+    extra cost of the semantic comparison with its aggregation sweep.  Run from the
+    repository root with:
+
+        python -m benchmarks.bench_route_diff
+"""
+
+SIZES = (1_000, 10_000, 100_000)
+
+
+def legacy_missing(original: list, migrated: list):
+    # The original compare_routes loop, kept here only to have something to measure against
+    return [route for route in original if route not in migrated]
+
+
+def run(sizes=SIZES):
+
+    results = []
+
+    for count in sizes:
+        original = parsed_routes(count, vrfs=4)
+        migrated = migrate(original)
+
+        diff, indexed = timed(diff_routes, original, migrated)
+        results.append(record("route_diff", f"indexed/{count}", indexed, **diff.summary()))
+
+        diff, semantic = timed(semantic_diff, original, migrated)
+        results.append(record("route_diff", f"semantic/{count}", semantic, **diff.summary()))
+
+        # The list scan grows with the product of the two table sizes, past a few thousand routes
+        # it takes minutes so only time it up to 10k routes
+        if count <= 10_000:
+            _, legacy = timed(legacy_missing, original, migrated)
+            results.append(record("route_diff", f"legacy/{count}", legacy))
+
+    return results
+
+
+def main():
+
+    for result in run():
+        print(f"{result['case']:<20} {result['seconds']:10.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import csv
+import pathlib
+import tempfile
+
+from benchmarks.harness import timed, record
+from benchmarks.synthetic import parsed_routes
+from utilities.route_table import RouteTable
+from utilities.snapshot_writer import SnapshotWriter
+
+"""
+    Measures the snapshot writer against the per-route DictWriter loop get_routes.py used to run, on
+    large Nexus style tables.  Run from the repository root with:
+
+        python -m benchmarks.bench_snapshot_writer
+"""
+
+SIZES = (10_000, 100_000)
+
+NXOS_FIELDS = ["vrf", "protocol", "type", "network", "mask", "distance", "metric", "nexthop_ip", "nexthop_if"]
+
+
+def legacy_write(path: pathlib.Path, routes: list):
+    # The original loop: a new DictWriter and a header for every single route
+    with open(path, "w") as csv_file:
+        for route in routes:
+            writer = csv.DictWriter(csv_file, fieldnames=NXOS_FIELDS)
+            writer.writeheader()
+            writer.writerow({field: route[field] for field in NXOS_FIELDS})
+    return path
+
+
+def snapshot_write(path: pathlib.Path, routes, compress: bool = False):
+    with SnapshotWriter(path, "cisco_nxos", compress=compress) as writer:
+        writer.write_many(routes)
+    return writer.path
+
+
+def run(sizes=SIZES):
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = pathlib.Path(tmp)
+
+        for count in sizes:
+            routes = parsed_routes(count, vrfs=8)
+            table = RouteTable.from_parsed(routes)
+
+            for name, function, args in (
+                ("legacy", legacy_write, (tmp / "legacy.csv", routes)),
+                ("writer_dict", snapshot_write, (tmp / "dict.csv", routes)),
+                ("writer_table", snapshot_write, (tmp / "table.csv", table)),
+                ("writer_gzip", snapshot_write, (tmp / "gzip.csv", routes, True)),
+            ):
+                path, elapsed = timed(function, *args)
+                results.append(record("snapshot_writer", f"{name}/{count}", elapsed, bytes=path.stat().st_size))
+
+    return results
+
+
+def main():
+
+    for result in run():
+        print(f"{result['case']:<24} {result['seconds']:8.3f}s {result['bytes'] / 1e6:8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
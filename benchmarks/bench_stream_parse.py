@@ -0,0 +1,103 @@
+import pathlib
+import tempfile
+import tracemalloc
+
+from ntc_templates.parse import parse_output
+
+from benchmarks.fake_device import FakeConnection, FakeDevice
+from benchmarks.harness import timed, record
+from benchmarks.synthetic import show_ip_route
+from helpers.commands import RunCommand
+from utilities.route_table import Route, RouteTable
+from utilities.snapshot_store import encode_routes
+from utilities.snapshot_writer import SnapshotWriter
+from utilities.stream_collection import ChannelReader
+from utilities.stream_parser import parser_for
+
+"""
+    Compares the peak memory and time of saving one device's routes the usual way (send_command,
+    parse_output, RouteTable, then the CSV and binary snapshot) with the streaming path, which parses the
+    output as it is read off the channel and writes each route straight out.  The device's output is
+    generated before measuring starts, so only what each path allocates is counted.  Run from the
+    repository root with:
+
+        python -m benchmarks.bench_stream_parse
+"""
+
+SIZES = (10_000, 50_000)
+PLATFORMS = ("cisco_nxos", "cisco_ios")
+
+
+def buffered(connection: FakeConnection, platform: str, command: str, path: pathlib.Path):
+
+    raw_output = connection.send_command(command)
+    route_table = RouteTable.from_parsed(parse_output(platform=platform, command=command, data=raw_output))
+
+    with SnapshotWriter(path, platform) as writer:
+        writer.write_many(route_table)
+
+    return len(encode_routes(route_table))
+
+
+def streamed(connection: FakeConnection, platform: str, command: str, path: pathlib.Path):
+
+    parse = parser_for(platform)
+
+    with SnapshotWriter(path, platform) as writer:
+
+        def routes():
+            for entry in parse(ChannelReader(connection, command).lines()):
+                writer.write(entry)
+                yield Route.from_dict(entry)
+
+        return len(encode_routes(routes()))
+
+
+def peak_memory(function, *args):
+    """
+    peak_memory The most memory allocated at once while function ran
+
+    Returns:
+        int: Bytes
+    """
+
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes=SIZES):
+
+    results = []
+    command = RunCommand.show_routes()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp) / "routes.csv"
+
+        for platform in PLATFORMS:
+            for count in sizes:
+                output = show_ip_route(platform, count)
+                connection = FakeConnection(FakeDevice("bench", {command: output}, connect_latency=0, command_latency=0))
+
+                for name, function in (("buffered", buffered), ("streamed", streamed)):
+                    size, elapsed = timed(function, connection, platform, command, path)
+                    peak = peak_memory(function, connection, platform, command, path)
+                    results.append(record("stream_parse", f"{name}/{platform}/{count}", elapsed,
+                                          peak_mb=round(peak / 2 ** 20, 2), output_mb=round(len(output) / 2 ** 20, 2),
+                                          snapshot_bytes=size))
+
+    return results
+
+
+def main():
+
+    for result in run():
+        print(f"{result['case']:<36} {result['seconds']:10.3f}s {result['peak_mb']:10.1f}MB peak "
+              f"({result['output_mb']:.1f}MB of output)")
+
+
+if __name__ == "__main__":
+    main()
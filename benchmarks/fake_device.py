@@ -0,0 +1,171 @@
+import threading
+import time
+
+from benchmarks.synthetic import show_ip_route
+
+"""
+    A stand-in for a Netmiko connection that replays recorded (or synthetic) command output with
+    configurable latency, so the collection path can be measured without real routers.  FakeConnectHandler
+    takes the same keyword arguments as Netmiko's ConnectHandler and can be swapped in for it
+"""
+
+
+class FakeDevice():
+    """
+    FakeDevice What one device looks like to the collector: its hostname, the output it returns for each
+    command and how slow it is
+
+    Attributes:
+        hostname (str): Returned in the prompt
+        outputs (dict): command -> output.  Commands not listed return an empty string
+        connect_latency (float): Seconds the SSH handshake, auth and enable take
+        command_latency (float): Seconds before a command starts returning output
+        bytes_per_second (float): Simulated management link speed.  None for no limit
+    """
+
+    def __init__(self, hostname: str, outputs: dict, connect_latency: float = 0.5, command_latency: float = 0.05,
+                 bytes_per_second: float = None):
+
+        self.hostname = hostname
+        self.outputs = outputs
+        self.connect_latency = connect_latency
+        self.command_latency = command_latency
+        self.bytes_per_second = bytes_per_second
+
+
+class FakeConnection():
+    """
+    FakeConnection Implements the parts of the Netmiko connection API the collector, session pool and
+    streaming collection use
+    """
+
+    RETURN = "\n"
+
+    # Most a read_channel returns at once, the size of paramiko's receive buffer
+    CHUNK_SIZE = 65535
+
+    def __init__(self, device: FakeDevice):
+
+        self.device = device
+        self.alive = True
+        self.commands = []
+
+        # What write_channel has queued up for read_channel: the pieces and how far into the current one
+        # the reads have got.  The output is sliced, never copied whole
+        self._channel = []
+        self._offset = 0
+
+        time.sleep(device.connect_latency)
+
+    def enable(self):
+        return ""
+
+    def find_prompt(self):
+        return f"{self.device.hostname}#"
+
+    def send_command(self, command: str, read_timeout: float = None, **kwargs):
+
+        if not self.alive:
+            raise OSError("Socket is closed")
+
+        output = self.device.outputs.get(command, "")
+        delay = self.device.command_latency
+        if self.device.bytes_per_second:
+            delay += len(output) / self.device.bytes_per_second
+
+        time.sleep(delay)
+        self.commands.append(command)
+        return output
+
+    def write_channel(self, data: str):
+
+        if not self.alive:
+            raise OSError("Socket is closed")
+
+        command = data.strip()
+        time.sleep(self.device.command_latency)
+        self.commands.append(command)
+        self._channel = [f"{command}\n", self.device.outputs.get(command, ""), f"\n{self.find_prompt()}"]
+        self._offset = 0
+
+    def read_channel(self):
+
+        while self._channel and self._offset >= len(self._channel[0]):
+            self._channel.pop(0)
+            self._offset = 0
+
+        if not self._channel:
+            return ""
+
+        chunk = self._channel[0][self._offset:self._offset + self.CHUNK_SIZE]
+        self._offset += len(chunk)
+
+        if self.device.bytes_per_second:
+            time.sleep(len(chunk) / self.device.bytes_per_second)
+
+        return chunk
+
+    def is_alive(self):
+        return self.alive
+
+    def disconnect(self):
+        self.alive = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disconnect()
+
+
+class FakeFleet():
+    """
+    FakeFleet A set of FakeDevices keyed by host address with a ConnectHandler compatible factory
+
+        fleet = FakeFleet.synthetic(50, "cisco_nxos", routes=10_000)
+        utilities.collector.ConnectHandler = fleet.connect_handler
+    """
+
+    def __init__(self):
+
+        self.devices = {}
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def synthetic(cls, count: int, platform: str, routes: int, command: str = "show ip route", **latency):
+        """
+        synthetic A fleet of count devices, each returning a synthetic table of the given size for command
+
+        Args:
+            count (int): Number of devices
+            platform (str): cisco_ios or cisco_nxos
+            routes (int): Routes per device
+            command (str): The command the devices answer
+            **latency: Passed to FakeDevice, e.g. connect_latency=0.2
+
+        Returns:
+            FakeFleet: The fleet
+        """
+
+        fleet = cls()
+
+        # Every device gets the same table, generating it once keeps large fleets cheap to set up
+        output = show_ip_route(platform, routes)
+
+        for i in range(count):
+            fleet.add(f"198.18.{i >> 8}.{i & 0xFF}", FakeDevice(f"bench-{i:04d}", {command: output}, **latency))
+
+        return fleet
+
+    def add(self, host: str, device: FakeDevice):
+        self.devices[host] = device
+
+    def device_list(self, platform: str):
+        return [(host, platform) for host in self.devices]
+
+    def connect_handler(self, host: str, **kwargs):
+        # Same keyword arguments as Netmiko's ConnectHandler, everything but the host is ignored
+        with self._lock:
+            self.connections += 1
+        return FakeConnection(self.devices[host])
@@ -0,0 +1,105 @@
+import json
+import pathlib
+import platform
+import time
+from datetime import datetime
+
+"""
+    Shared helpers for the benchmarks: timing, recording results and comparing a run with a saved
+    baseline so regressions stand out
+"""
+
+RESULTS_DIR = pathlib.Path(__file__).parent / "results"
+BASELINE = RESULTS_DIR / "baseline.json"
+
+
+def timed(function, *args, repeat: int = 1, **kwargs):
+    """
+    timed Runs function repeat times and keeps the fastest, which is the least disturbed by whatever
+    else the machine is doing
+
+    Returns:
+        tuple: (result of the last call, fastest time in seconds)
+    """
+
+    best = None
+    result = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return result, best
+
+
+def record(benchmark: str, case: str, seconds: float, **extra):
+    """
+    record One benchmark measurement
+
+    Args:
+        benchmark (str): The benchmark, e.g. route_diff
+        case (str): What was measured, e.g. indexed/100000
+        seconds (float): How long it took
+        **extra: Anything else worth keeping, e.g. bytes written
+
+    Returns:
+        dict: The measurement
+    """
+
+    return dict(extra, benchmark=benchmark, case=case, seconds=round(seconds, 6))
+
+
+def save_results(results: list, path=None):
+    """
+    save_results Writes a run to benchmarks/results, named by timestamp unless a path is given
+
+    Returns:
+        Path: Where the results were written
+    """
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    path = pathlib.Path(path) if path else RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+
+    with open(path, "w") as file:
+        json.dump({
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }, file, indent=2)
+
+    return path
+
+
+def load_results(path):
+    with open(path, "r") as file:
+        return json.load(file)["results"]
+
+
+def compare(results: list, baseline: list, threshold: float = 0.2):
+    """
+    compare Lines up a run with a baseline run
+
+    Args:
+        results (list): This run's measurements
+        baseline (list): The baseline's measurements
+        threshold (float): Slowdown ratio over which a case is flagged, 0.2 is 20% slower
+
+    Returns:
+        list: (benchmark, case, baseline seconds, seconds, change ratio, regressed) per case in both runs
+    """
+
+    previous = {(result["benchmark"], result["case"]): result["seconds"] for result in baseline}
+    rows = []
+
+    for result in results:
+        key = (result["benchmark"], result["case"])
+        if key not in previous or not previous[key]:
+            continue
+
+        change = result["seconds"] / previous[key] - 1
+        rows.append((result["benchmark"], result["case"], previous[key], result["seconds"], change, change > threshold))
+
+    return rows
@@ -0,0 +1,75 @@
+import argparse
+import importlib
+
+from benchmarks.harness import BASELINE, compare, load_results, save_results
+
+"""
+    Runs the benchmark suite, saves the results under benchmarks/results and compares them with the saved
+    baseline.  From the repository root:
+
+        python -m benchmarks.run                   # everything
+        python -m benchmarks.run --only parse      # one benchmark
+        python -m benchmarks.run --quick           # smallest sizes only
+        python -m benchmarks.run --save-baseline   # make this run the baseline
+"""
+
+BENCHMARKS = {
+    "route_diff": "benchmarks.bench_route_diff",
+    "snapshot_writer": "benchmarks.bench_snapshot_writer",
+    "parse": "benchmarks.bench_parse",
+    "compare_routes": "benchmarks.bench_compare_routes",
+    "collection": "benchmarks.bench_collection",
+    "import": "benchmarks.bench_import",
+    "stream_parse": "benchmarks.bench_stream_parse",
+}
+
+
+def parse_args(argv=None):
+
+    parser = argparse.ArgumentParser(description="Run the Route-Table-Diff benchmarks")
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS), help="Run only this benchmark")
+    parser.add_argument("--quick", action="store_true", help="Run only the smallest size of each benchmark")
+    parser.add_argument("--save-baseline", action="store_true", help="Save this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown flagged as a regression, 0.2 = 20%%")
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+
+    args = parse_args(argv)
+    results = []
+
+    for name in args.only or BENCHMARKS:
+        try:
+            module = importlib.import_module(BENCHMARKS[name])
+        except ImportError as e:
+            # parse and collection need the full requirements.txt installed
+            print(f"{name:<16} skipped: {e}")
+            continue
+
+        sizes = module.SIZES[:1] if args.quick else module.SIZES
+        print(f"{name:<16} running {', '.join(str(size) for size in sizes)}")
+
+        for result in module.run(sizes):
+            print(f"    {result['case']:<32} {result['seconds']:10.4f}s")
+            results.append(result)
+
+    path = save_results(results, BASELINE if args.save_baseline else None)
+    print(f"\nResults saved to {path}")
+
+    if args.save_baseline or not BASELINE.is_file():
+        return 0
+
+    rows = compare(results, load_results(BASELINE), args.threshold)
+    regressions = [row for row in rows if row[5]]
+
+    print(f"\nCompared with baseline ({len(rows)} cases, {len(regressions)} regressions)")
+    for benchmark, case, before, after, change, regressed in rows:
+        print(f"    {benchmark + '/' + case:<44} {before:10.4f}s -> {after:10.4f}s {change:+7.1%}{'  <-- slower' if regressed else ''}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,174 @@
+import random
+
+"""
+    Synthetic routing tables for the benchmarks.  parsed_routes looks like what NTC templates
+    parse_output returns so it can be fed straight into the code being measured, ios_show_ip_route and
+    nxos_show_ip_route produce the raw command output a device would send
+"""
+
+PROTOCOLS = ("O", "B", "S", "D", "C")
+
+
+def parsed_routes(count: int, vrfs: int = 1, seed: int = 0):
+    """
+    parsed_routes Generates a list of route dictionaries shaped like the cisco_nxos parse_output
+    result.  Every tenth route is given a second next hop so ECMP entries are represented
+
+    Args:
+        count (int): Number of prefixes to generate
+        vrfs (int): Number of vrfs to spread the prefixes across
+        seed (int): Seed for the random generator so runs are repeatable
+
+    Returns:
+        list: Route dictionaries
+    """
+
+    rng = random.Random(seed)
+    routes = []
+
+    for i in range(count):
+        network = f"10.{(i >> 16) & 0xFF}.{(i >> 8) & 0xFF}.{i & 0xFF}"
+        vrf = "default" if vrfs == 1 else f"VRF{i % vrfs}"
+        protocol = rng.choice(PROTOCOLS)
+        route = {
+            "vrf": vrf,
+            "protocol": protocol,
+            "type": "",
+            "network": network,
+            "mask": "32",
+            "distance": "110",
+            "metric": str(rng.randint(1, 100)),
+            "nexthop_ip": f"192.168.{i % 250}.1",
+            "nexthop_if": f"Ethernet1/{i % 48 + 1}",
+            "uptime": "1w2d",
+        }
+        routes.append(route)
+
+        if i % 10 == 0:
+            routes.append(dict(route, nexthop_ip=f"192.168.{i % 250}.2", nexthop_if=f"Ethernet2/{i % 48 + 1}"))
+
+    return routes
+
+
+def migrate(routes: list, remove: float = 0.01, change: float = 0.01, add: float = 0.01, seed: int = 1):
+    """
+    migrate Produces a "post-migration" copy of a table with a share of routes removed, changed
+    and added, so diffs have something to find
+
+    Args:
+        routes (list): The original routes
+        remove (float): Share of routes to drop
+        change (float): Share of routes to give a new metric
+        add (float): Share of new routes to add
+
+    Returns:
+        list: The migrated routes
+    """
+
+    rng = random.Random(seed)
+    migrated = []
+
+    for route in routes:
+        roll = rng.random()
+        if roll < remove:
+            continue
+        if roll < remove + change:
+            route = dict(route, metric=str(int(route["metric"]) + 1000))
+        migrated.append(route)
+
+    for i in range(int(len(routes) * add)):
+        migrated.append(dict(routes[0], network=f"172.{(i >> 16) & 0xFF}.{(i >> 8) & 0xFF}.{i & 0xFF}"))
+
+    return migrated
+
+
+# Codes header IOS prints ahead of the routes
+_IOS_CODES = """Codes: L - local, C - connected, S - static, R - RIP, M - mobile, B - BGP
+       D - EIGRP, EX - EIGRP external, O - OSPF, IA - OSPF inter area
+       N1 - OSPF NSSA external type 1, N2 - OSPF NSSA external type 2
+       E1 - OSPF external type 1, E2 - OSPF external type 2
+       i - IS-IS, su - IS-IS summary, L1 - IS-IS level-1, L2 - IS-IS level-2
+       ia - IS-IS inter area, * - candidate default, U - per-user static route
+       o - ODR, P - periodic downloaded static route, H - NHRP, l - LISP
+       + - replicated route, % - next hop override
+
+Gateway of last resort is 192.168.0.1 to network 0.0.0.0
+
+S*    0.0.0.0/0 [1/0] via 192.168.0.1
+"""
+
+_NXOS_HEADER = """IP Route Table for VRF "{vrf}"
+'*' denotes best ucast next-hop
+'**' denotes best mcast next-hop
+'[x/y]' denotes [preference/metric]
+'%<string>' in via output denotes VRF <string>
+"""
+
+
+def _network(i: int):
+    # /24s counted up through 10.0.0.0/8 and on into 11.0.0.0/8 and beyond
+    return f"{10 + (i >> 16)}.{(i >> 8) & 0xFF}.{i & 0xFF}.0"
+
+
+def ios_show_ip_route(count: int, seed: int = 0):
+    """
+    ios_show_ip_route Raw cisco_ios show ip route output with count OSPF /24s.  Every tenth route has
+    a second ECMP next hop on a continuation line
+
+    Returns:
+        str: The command output
+    """
+
+    rng = random.Random(seed)
+    lines = [_IOS_CODES]
+
+    for i in range(count):
+        if i % 256 == 0:
+            lines.append(f"      {10 + (i >> 16)}.{(i >> 8) & 0xFF}.0.0/16 is subnetted, {min(256, count - i)} subnets")
+
+        metric = rng.randint(2, 200)
+        lines.append(f"O        {_network(i)}/24 [110/{metric}] via 192.168.{i % 250}.1, 1w2d, GigabitEthernet0/{i % 4}")
+
+        if i % 10 == 0:
+            lines.append(f"                 [110/{metric}] via 192.168.{i % 250}.2, 1w2d, GigabitEthernet1/{i % 4}")
+
+    return "\n".join(lines) + "\n"
+
+
+def nxos_show_ip_route(count: int, vrfs: int = 1, seed: int = 0):
+    """
+    nxos_show_ip_route Raw cisco_nxos show ip route output with count OSPF /24s spread across vrfs.
+    Every tenth route has a second ECMP next hop
+
+    Returns:
+        str: The command output
+    """
+
+    rng = random.Random(seed)
+    sections = []
+    per_vrf = -(-count // vrfs)
+
+    for v in range(vrfs):
+        vrf = "default" if v == 0 else f"VRF{v}"
+        lines = [_NXOS_HEADER.format(vrf=vrf)]
+
+        for i in range(v * per_vrf, min(count, (v + 1) * per_vrf)):
+            metric = rng.randint(2, 200)
+            paths = 2 if i % 10 == 0 else 1
+            lines.append(f"{_network(i)}/24, ubest/mbest: {paths}/0")
+            for path in range(1, paths + 1):
+                lines.append(f"    *via 192.168.{i % 250}.{path}, Eth{path}/{i % 48 + 1}, [110/{metric}], 1w2d, ospf-1, intra")
+
+        sections.append("\n".join(lines))
+
+    return "\n\n".join(sections) + "\n"
+
+
+def show_ip_route(platform: str, count: int, seed: int = 0):
+    """
+    show_ip_route Raw show ip route output for either supported platform
+    """
+
+    if platform == "cisco_nxos":
+        return nxos_show_ip_route(count, vrfs=4, seed=seed)
+    return ios_show_ip_route(count, seed=seed)
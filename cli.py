@@ -0,0 +1,58 @@
+import argparse
+import importlib
+import sys
+
+"""
+    Single entry point for the tool:
+
+        python cli.py collect [--watch 300] [--include tag:core] ...     get_routes.py
+        python cli.py diff [--migrated 3] [--json report.json] ...       diff_routes.py
+        python cli.py report [--host core1] [--prefix 10.1.0.0/24] ...   diff_routes.py --timeline
+
+    Each command's module is only imported once the command is known, so diff and report never load
+    netmiko, paramiko, ntc_templates or icmplib and start straight away on a machine without network
+    access.  "python cli.py <command> --help" lists a command's own options
+"""
+
+# command -> (module, arguments put in front of the user's, description)
+COMMANDS = {
+    "collect": ("get_routes", [], "Collect the routing table of every device in the inventory"),
+    "diff": ("diff_routes", [], "Compare each host's original snapshot with a migrated one"),
+    "report": ("diff_routes", ["--timeline"], "Show each host's change history across its snapshots"),
+}
+
+
+def load(command: str):
+    """
+    load Imports the module that runs a command
+
+    Returns:
+        module: The command's module, which has a main(argv)
+    """
+
+    return importlib.import_module(COMMANDS[command][0])
+
+
+def parse_args(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description="Collect and compare routing tables",
+        epilog="\n".join(f"  {name:<8} {description}" for name, (_, _, description) in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("command", choices=list(COMMANDS), help="What to do, see below")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="Options for the command")
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+
+    args = parse_args(argv)
+    _, prefix, _ = COMMANDS[args.command]
+
+    return load(args.command).main(prefix + args.args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -28,3 +28,24 @@ class GetCredentials():
     def netlab_enable():
         return os.environ.get("NETLAB_ENABLE")
 
+    @staticmethod
+    def profile(name: str = None):
+        """
+        profile Credentials for a named profile, read from <NAME>_USER, <NAME>_PASSWD and <NAME>_ENABLE
+        in the .env file, e.g. DC_USER for the "dc" profile.  Anything a profile does not set falls back to
+        the NETLAB_ credentials, as does the default (None) profile
+
+        Returns:
+            tuple: (username, password, enable password)
+        """
+
+        defaults = (GetCredentials.netlab_user(), GetCredentials.netlab_passwd(), GetCredentials.netlab_enable())
+
+        if not name:
+            return defaults
+
+        prefix = name.upper().replace("-", "_")
+        values = (os.environ.get(f"{prefix}_USER"), os.environ.get(f"{prefix}_PASSWD"), os.environ.get(f"{prefix}_ENABLE"))
+
+        return tuple(value if value is not None else default for value, default in zip(values, defaults))
+
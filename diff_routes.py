@@ -0,0 +1,85 @@
+import argparse
+import time
+
+from helpers.logs import logging, setup_logging
+from utilities.fleet_diff import diff_fleet, format_summary, write_report
+from utilities.route_diff import IGNORABLE_FIELDS
+from utilities.route_timeline import fleet_timeline
+
+
+def parse_args(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description="Compare the original routing table of every host under routes/ with a migrated snapshot"
+    )
+    parser.add_argument("--routes-dir", default="routes", help="Directory get_routes.py saved the snapshots in")
+    parser.add_argument("--migrated", type=int, default=None,
+                        help="Migrated snapshot number to compare, e.g. 3 for _migrated_003.  Latest by default")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes.  One per CPU by default")
+    parser.add_argument("--json", dest="json_path", default=None, help="Write the full report to this JSON file")
+    parser.add_argument("--semantic", action="store_true",
+                        help="Compare what the routes do: ECMP order and interface name forms are ignored and prefixes "
+                             "still reached through a summary route with the same next hops are reported as covered")
+    parser.add_argument("--ignore", action="append", default=[], choices=IGNORABLE_FIELDS,
+                        help="With --semantic, do not compare this field.  May be repeated")
+    parser.add_argument("--timeline", action="store_true",
+                        help="Show each host's change history across all of its snapshots instead of a single comparison")
+    parser.add_argument("--host", dest="hosts", action="append", default=None,
+                        help="Limit the timeline to this host.  May be repeated")
+    parser.add_argument("--prefix", dest="prefixes", action="append", default=[], metavar="[VRF:]PREFIX",
+                        help="With --timeline, report when this prefix was added, removed or changed.  May be repeated")
+
+    return parser.parse_args(argv)
+
+
+def print_timeline(reports: list):
+
+    for report in reports:
+        if "error" in report:
+            print(f"{report['host']}: error: {report['error']}")
+            continue
+
+        print(report["render"])
+
+        for status in report["prefixes"]:
+            state = "present" if status["present"] else f"gone since {status['last_removed'] or 'the original'}"
+            print(f"    {status['prefix']}: {state}, {status['flaps']} flaps, {status['changes']} changes")
+            for event in status["history"]:
+                fields = f" ({', '.join(event['fields'])})" if event.get("fields") else ""
+                print(f"        {event['snapshot']:<16} {event['timestamp']}  {event['event']}{fields}")
+
+
+def main(argv=None):
+
+    args = parse_args(argv)
+    setup_logging()
+    start = time.perf_counter()
+
+    if args.timeline:
+        # Timelines are kept per host and only extended with the snapshots taken since the last run
+        reports = fleet_timeline(args.routes_dir, hosts=args.hosts, prefixes=args.prefixes, max_workers=args.workers)
+        print_timeline(reports)
+
+        if args.json_path:
+            write_report(reports, args.json_path)
+
+        logging.info(f"Timeline of {len(reports)} hosts took {time.perf_counter() - start:.2f} seconds")
+        return 0
+
+    # Only the JSON report needs the individual routes, skip shipping them back from the workers otherwise
+    result = diff_fleet(args.routes_dir, migrated=args.migrated, max_workers=args.workers,
+                        details=args.json_path is not None, semantic=args.semantic or bool(args.ignore), ignore=args.ignore)
+
+    print(format_summary(result))
+
+    if args.json_path:
+        write_report(result, args.json_path)
+
+    logging.info(f"Fleet diff of {result['totals']['hosts']} hosts took {time.perf_counter() - start:.2f} seconds")
+
+    # Non-zero exit when any host lost routes, so the diff can gate a change window script
+    return 1 if result["totals"]["removed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
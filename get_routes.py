@@ -1,161 +1,309 @@
+import argparse
 import time
 import pathlib
-import csv
-
-from netmiko import ConnectHandler, NetmikoTimeoutException, NetmikoAuthenticationException
-from ntc_templates.parse import parse_output
-from datetime import datetime
 
 from helpers.constants import Constant
 from helpers.validation import ip4_validate
-from helpers.ping import ip4_ping
-from helpers.open_hosts_file import open_device_list
-from helpers.logs import logging
+from helpers.ping import ReachabilityCheck
+from helpers.inventory import Inventory
+from helpers.logs import logging, setup_logging
+from helpers.metrics import metrics
 from helpers.commands import RunCommand
-from credentials.credentials import GetCredentials
-
-# Set a starting timer.  Mainly for initial testing
-START_TIME = time.time()
-TIMESTAMP = datetime.now().strftime("%m-%d-%Y_T%H:%M:%S")
-
-# The first log entry when the application starts will deliniate when it
-# has started and the root directory in which the script is running
-
-logging.info("#" * 25 + " Application Starting " + "#" * 25)
-logging.info(f"Working Directory: {Constant.script_path()}\n")
-
-# Loop through the file containg the devices to be connected to and create the connection
-# profile
-for device in open_device_list(Constant.devices_list() / "devices.txt"):
-
-    # As a sanity check validate that the IP address is, in fact, a valid IP address then
-    # ping it to see if it can be reached.  If either fails, abort the process
-    if ip4_validate(device[0]) and ip4_ping(device[0]):
-
-        device_ssh_connection = {
-            "host": device[0],
-            "device_type": device[1],
-            "username": GetCredentials.netlab_user(),
-            "password": GetCredentials.netlab_passwd(),
-            "secret": GetCredentials.netlab_enable()
-        }
-
-        logging.info(f"Created SSH Connection profile for {device[0]}")
-
-        try:
-
-            # Only running a single command
-            command = RunCommand.show_routes()
-
-            # Connect to the device
-            with ConnectHandler(**device_ssh_connection) as ssh_connection:
-                
-                # Activate enable mode
-                ssh_connection.enable()
-                # Grab the hostname.  Assumes the name at the command prompt is the hostname
-                hostname = ssh_connection.find_prompt()[:-1]
-                # Store the raw output of the command run in a variable
-                raw_output = ssh_connection.send_command(command)
-
-                logging.info(f"Console Output for {device[0]} running command: {command}\n\n{raw_output}")
-
-                # Parse the command output into a format that is easier to work with.  Making the platform and
-                # command dynamic, we automatically get the correct template output which is helpful later when 
-                # the output is written to a CSV file.
-                parsed_output = parse_output(platform=device[1], command=command, data=raw_output)
-
-                ###################################################################################
-                # Above here, the code is pretty universal across different use cases since we are
-                # merely setting up the connection and then connecting to the devices.  Below this
-                # is where the processing of the output begins.
-                ###################################################################################
-
-                # Save the routes in a separate directory with subdirectories named after the hostname
-                # If it were just one or two devices it would probably not matter, but since there
-                # may potentially be several, lets structure things so they are easy to find
-                #
-                # Create that structure here
-                tables_dir = pathlib.Path.cwd() / f"routes/{hostname}"
-                tables_dir.mkdir(parents=True, exist_ok=True)
-
-                # Because, ultimately, we want to compare the routes as they are now with post-migration routes
-                # We need to separately identify the first run from all others.  Here we check if the first run
-                # file exists (ending in _original_routes.csv), then we check if there are any subsequent files
-                # (ending in _migrated_xxx.csv).  If they do exist, loop through until we can create a unique
-                # filename with the next number increment.
-                if pathlib.Path(tables_dir / f"{hostname}_original_routes.csv").is_file():
-                    i = 1
-                    while pathlib.Path(tables_dir / f"{hostname}_migrated_{i:03d}.csv").is_file():
-                        i += 1
-                    csv_filename = f"{hostname}_migrated_{i:03d}.csv"
+from utilities.collector import DeviceCollector, collect_device
+from utilities.parse_cache import ParseCache
+from utilities.parser_pool import ParserPool
+from utilities.retry import LatencyTracker, RetryScheduler
+from utilities.route_table import RouteTable
+from utilities.scoped_collection import ScopedCollection
+from utilities.session_pool import SessionPool
+from utilities.snapshot_store import SnapshotStore
+from utilities.snapshot_writer import SnapshotWriter
+from utilities.stream_collection import StreamingCollection
+
+# Collection settings.  The collector works on up to MAX_WORKERS devices at a time, gives each device
+# DEVICE_TIMEOUT seconds to connect and return its output and stops waiting on the run as a whole
+# after RUN_DEADLINE seconds (None means no limit)
+MAX_WORKERS = 20
+DEVICE_TIMEOUT = 60
+RUN_DEADLINE = None
+
+# Worker processes used to parse the collected output.  None uses one per CPU
+PARSE_WORKERS = None
+
+# Keep parsed output in routes/.parse_cache so a device whose routing table has not changed since the
+# last run is not parsed again
+USE_PARSE_CACHE = True
+
+# gzip the route snapshots.  Nexus tables compress very well and the diff tooling reads either form
+COMPRESS_SNAPSHOTS = False
+
+# Watch mode keeps the SSH sessions open between rounds.  Sessions older than SESSION_MAX_AGE seconds are
+# replaced even if they are still up (None keeps them for as long as they last)
+SESSION_MAX_AGE = None
+
+# Devices that time out or error are tried RETRY_ATTEMPTS times with a randomised exponential backoff and,
+# if they still fail, run through the collector again REQUEUE_PASSES times once the rest are done.  With
+# ADAPTIVE_TIMEOUTS each device's timeout follows its observed latency, kept in routes/.latency.json
+RETRY_ATTEMPTS = 3
+REQUEUE_PASSES = 1
+ADAPTIVE_TIMEOUTS = True
+
+# Settings for the pre-flight reachability check.  "icmp" pings every device, "tcp" attempts a connection
+# to the SSH port instead, which is useful where ICMP is filtered on the management network
+REACHABILITY_METHOD = "icmp"
+
+
+def save_snapshot(result):
+    """
+    save_snapshot Saves the routes from one device's result as its next snapshot, both as a CSV and in
+    the host's binary snapshot store
+
+    Args:
+        result (DeviceResult): A successful, parsed result from the collector
+    """
+
+    hostname = result.hostname
+
+    # Fold the parsed output into a RouteTable.  It holds the routes far more compactly than the list of
+    # dictionaries from NTC templates and sorts them by vrf and prefix
+    with metrics.stage(result.host, "build_table"):
+        route_table = RouteTable.from_parsed(result.parsed_output)
+    metrics.set(result.host, "routes", len(route_table))
+    logging.info(f"Built route table for {hostname} with {len(route_table)} routes in vrfs {route_table.vrfs}")
+
+    ###################################################################################
+    # Above here, the code is pretty universal across different use cases since we are
+    # merely setting up the connection and then connecting to the devices.  Below this
+    # is where the processing of the output begins.
+    ###################################################################################
+
+    # Save the routes in a separate directory with subdirectories named after the hostname
+    # If it were just one or two devices it would probably not matter, but since there
+    # may potentially be several, lets structure things so they are easy to find
+    #
+    # Create that structure here
+    tables_dir = pathlib.Path.cwd() / f"routes/{hostname}"
+    tables_dir.mkdir(parents=True, exist_ok=True)
+
+    # Because, ultimately, we want to compare the routes as they are now with post-migration routes
+    # We need to separately identify the first run from all others.  The host's snapshot store keeps a
+    # manifest of every snapshot taken, so the next name (original_routes, then migrated_001,
+    # migrated_002, ...) comes straight from it
+    store = SnapshotStore(hostname)
+    snapshot_name = store.next_name()
+    csv_filename = f"{hostname}_{snapshot_name}.csv"
+
+    try:
+        # The columns come from the snapshot writer's schema registry based on the device type, so the
+        # Nexus vrf column is only written for Nexus devices
+        with metrics.stage(result.host, "write"):
+            with SnapshotWriter(tables_dir / csv_filename, result.device_type, compress=COMPRESS_SNAPSHOTS) as writer:
+                writer.write_many(route_table)
+                # Entries the table could not index still go in the CSV, only the binary snapshot is
+                # limited to IPv4 routes
+                writer.write_many(route_table.skipped)
+
+            logging.info(f"Created {writer.path.name} with {writer.count} routes in {tables_dir}")
+
+            # Alongside the CSV, save the binary snapshot the diff tooling loads
+            store.add(route_table, snapshot_name)
+
+    except OSError as e:
+        logging.error(f"There was an error when trying to write {csv_filename} for {hostname}: {e}")
+
+
+def valid_devices(inventory, include=None, exclude=None):
+    """
+    valid_devices Streams the devices the include and exclude selectors pick out of the inventory and, as a
+    sanity check, drops any whose IP address is not, in fact, a valid IP address
+
+    Args:
+        inventory (Inventory): The device inventory
+        include (list): Selectors a device must match one of
+        exclude (list): Selectors that drop a device
+
+    Yields:
+        Device: One per valid device
+    """
+
+    for device in inventory.devices(include=include, exclude=exclude):
+
+        if ip4_validate(device.host):
+            yield device
+        else:
+            logging.error(f"Failed to create a connection profile for {device.host}")
+
+
+def collect_round(devices, command, collector, parser_pool, worker=collect_device, scheduler=None):
+    """
+    collect_round Collects, parses and saves the routes of every device once
+
+    Args:
+        devices (iterable): The reachable (host, device_type) pairs, read as the collector gets to them
+        command (str): The command to run
+        collector (DeviceCollector): Runs the SSH stage
+        parser_pool (ParserPool): Runs the parsing stage
+        worker (callable): Passed to the collector.  A SessionPool's collect reuses open sessions
+        scheduler (RetryScheduler): Retries failed devices and re-queues them at the end of the round
+    """
+
+    if scheduler is not None:
+        results = scheduler.collect(collector, devices, command, worker=worker)
+    else:
+        results = collector.collect(devices, command, worker=worker)
+
+    # Results come back as each device finishes, so the files for fast devices are written while the
+    # slow ones are still being worked on.  Streamed results were saved by the worker as they were read
+    for result in parser_pool.parse_results(results):
+
+        if result.ok and result.snapshot is None:
+            save_snapshot(result)
+
+    if scheduler is not None:
+        scheduler.summary()
+    else:
+        collector.summary()
+
+
+def parse_args(argv=None):
+
+    parser = argparse.ArgumentParser(description="Collect the routing table of every device in devices.txt")
+    parser.add_argument("--watch", type=float, default=None, metavar="SECONDS",
+                        help="Keep the sessions open and collect again every SECONDS until interrupted")
+    parser.add_argument("--rounds", type=int, default=None, help="Stop watching after this many rounds")
+    parser.add_argument("--scoped", action="store_true",
+                        help="Only pull the vrfs whose route count changed since the previous snapshot")
+    parser.add_argument("--prefix", dest="prefixes", action="append", default=None, metavar="[VRF:]PREFIX",
+                        help="Only refresh this prefix and its subnets (implies --scoped).  May be repeated")
+    parser.add_argument("--stream", action="store_true",
+                        help="Parse the output as it is read and write the snapshot straight from it, keeping memory "
+                             "flat for very large tables")
+    parser.add_argument("--inventory", default=None, metavar="PATH",
+                        help="Inventory file, CSV or YAML (default: devices.txt)")
+    parser.add_argument("--include", action="append", default=None, metavar="SELECTOR",
+                        help="Only collect devices matching SELECTOR, e.g. tag:core, type:cisco_nxos or host:10.1.*.  May be repeated")
+    parser.add_argument("--exclude", action="append", default=None, metavar="SELECTOR",
+                        help="Skip devices matching SELECTOR.  May be repeated")
+    parser.add_argument("--metrics-json", default=None, metavar="PATH",
+                        help="Write the per-device, per-stage timings of the run to PATH as JSON")
+    parser.add_argument("--metrics-prom", default=None, metavar="PATH",
+                        help="Write the run metrics to PATH in the Prometheus text format (for the textfile collector)")
+
+    args = parser.parse_args(argv)
+
+    # Scoped collection stitches the unchanged vrfs back in from the previous snapshot, which needs the
+    # whole parsed table in hand
+    if args.stream and (args.scoped or args.prefixes):
+        parser.error("--stream cannot be combined with --scoped or --prefix")
+
+    return args
+
+
+def main(argv=None):
+
+    args = parse_args(argv)
+    setup_logging()
+
+    # Set a starting timer.  Mainly for initial testing
+    START_TIME = time.time()
+
+    # The first log entry when the application starts will deliniate when it
+    # has started and the root directory in which the script is running
+
+    logging.info("#" * 25 + " Application Starting " + "#" * 25)
+    logging.info(f"Working Directory: {Constant.script_path()}\n")
+
+    # The devices are streamed out of the inventory straight into the collector.  They are probed a batch
+    # at a time as they are read, so the first reachable devices are being collected while the rest of the
+    # inventory is still being probed, and the device list is never built in full
+    inventory = Inventory(args.inventory or Constant.devices_list() / "devices.txt")
+    reachability = ReachabilityCheck(method=REACHABILITY_METHOD)
+
+    def reachable_devices():
+        # A fresh pass over the inventory for every round.  The reachability results are cached, so in watch
+        # mode a host is only probed in the first round
+        return reachability.reachable(valid_devices(inventory, args.include, args.exclude))
+
+    # Only running a single command
+    command = RunCommand.show_routes()
+
+    parse_cache = ParseCache() if USE_PARSE_CACHE else None
+
+    # The collector only fetches the raw output.  Parsing is handed to a pool of worker processes so it
+    # runs on every core while the collector is still waiting on slower devices
+    collector = DeviceCollector(max_workers=MAX_WORKERS, device_timeout=DEVICE_TIMEOUT, deadline=RUN_DEADLINE, parser=None)
+
+    # Transient timeouts and errors are retried rather than leaving a gap in the snapshots
+    tracker = LatencyTracker(pathlib.Path.cwd() / "routes/.latency.json") if ADAPTIVE_TIMEOUTS else None
+    scheduler = RetryScheduler(attempts=RETRY_ATTEMPTS, requeue_passes=REQUEUE_PASSES, tracker=tracker)
+
+    with ParserPool(max_workers=PARSE_WORKERS, cache=parse_cache) as parser_pool:
+
+        # Scoped collection checks each vrf's route count first and only pulls what changed since the
+        # previous snapshot, stitching the rest back in from that snapshot
+        scoped = args.scoped or args.prefixes
+        parser = parse_cache.parse if parse_cache else None
+
+        if args.watch is None:
+            if scoped:
+                worker = ScopedCollection(prefixes=args.prefixes, parser=parser).collect
+            elif args.stream:
+                # Very large tables are parsed as they are read and written straight to the snapshot
+                worker = StreamingCollection(compress=COMPRESS_SNAPSHOTS).collect
+            else:
+                worker = collect_device
+            collect_round(reachable_devices(), command, collector, parser_pool, worker=worker, scheduler=scheduler)
+
+        else:
+            # Watch mode.  The session pool keeps every device's session open between rounds, health
+            # checks it before each use and reconnects if it has dropped, so after the first round a
+            # poll costs only the command round trip
+            with SessionPool(timeout=DEVICE_TIMEOUT, max_age=SESSION_MAX_AGE) as session_pool:
+                if scoped:
+                    worker = ScopedCollection(session_pool=session_pool, prefixes=args.prefixes, parser=parser).collect
+                elif args.stream:
+                    worker = StreamingCollection(session_pool=session_pool, compress=COMPRESS_SNAPSHOTS).collect
                 else:
-                    csv_filename = f"{hostname}_original_routes.csv"
+                    worker = session_pool.collect
+
+                completed = 0
 
                 try:
-                    with open(pathlib.Path(tables_dir / csv_filename), "w") as csv_file:
-
-                        for route in parsed_output:
-
-                            # since the dictionary keys are different for typical Cisco routers and Nexus devices, we grab the device type
-                            # (device[1]) from the host lists file and use the appropriate key/value pairs depending on the device
-                            if device[1] == "cisco_nxos":
-
-                                field_names = ["vrf", "protocol", "type", "network", "mask", "distance", "metric", "nexthop_ip", "nexthop_if"]
-                                writer = csv.DictWriter(csv_file, fieldnames=field_names)
-                                writer.writeheader()
-
-                                writer.writerow({
-                                    "vrf": route["vrf"],
-                                    "protocol": route["protocol"],
-                                    "type": route["type"],
-                                    "network": route["network"],
-                                    "mask": route["mask"],
-                                    "distance": route["distance"],
-                                    "metric": route["metric"],
-                                    "nexthop_ip": route["nexthop_ip"],
-                                    "nexthop_if": route["nexthop_if"]
-                                })
-
-                            elif device[1] == "cisco_ios":
-
-                                field_names = ["protocol", "type", "network", "mask", "distance", "metric", "nexthop_ip", "nexthop_if"]
-                                writer = csv.DictWriter(csv_file, fieldnames=field_names)
-                                writer.writeheader()
-
-                                writer.writerow({
-                                    "protocol": route["protocol"],
-                                    "type": route["type"],
-                                    "network": route["network"],
-                                    "mask": route["mask"],
-                                    "distance": route["distance"],
-                                    "metric": route["metric"],
-                                    "nexthop_ip": route["nexthop_ip"],
-                                    "nexthop_if": route["nexthop_if"]
-                                })
-
-
-                        logging.info(f"Created {csv_filename} in {tables_dir}")
-
-                except ValueError:
-
-                    # If the field names don't match names in the writerow action, it will throw a ValueError
-                    logging.error(
-                        f"There was an error when trying to write to the CSV file.\n \
-                        If it contains only the header row, check the writerow field names"
-                        )
-
-        except NetmikoAuthenticationException:
-            logging.error(f"Authentication failed. Invalid username or password for {device[0]}. Please verify your credentials")
-        except NetmikoTimeoutException:
-            logging.error(f"Connection time out for {device[0]}")
-        except ValueError:
-            logging.error(f"Failed to enter privilege mode! Please check the enable password for device {device[0]}")
+                    while args.rounds is None or completed < args.rounds:
+                        round_start = time.monotonic()
+                        logging.info(f"Starting collection round {completed + 1}")
 
-    else:
-        logging.error(f"Failed to create a connection profile for {device[0]}")
-        continue
+                        collect_round(reachable_devices(), command, collector, parser_pool, worker=worker, scheduler=scheduler)
+                        completed += 1
+
+                        if args.rounds is not None and completed >= args.rounds:
+                            break
+
+                        time.sleep(max(0.0, args.watch - (time.monotonic() - round_start)))
+
+                except KeyboardInterrupt:
+                    logging.info(f"Watch mode stopped after {completed} rounds")
+
+    reachability.summary()
+
+    if parse_cache:
+        parse_cache.summary()
+
+    # Where the time went, per stage across every device
+    metrics.summary()
+
+    if args.metrics_json:
+        metrics.to_json(args.metrics_json)
+    if args.metrics_prom:
+        metrics.to_prometheus(args.metrics_prom)
+
+    END_TIME = time.time()
+
+    logging.info("#" * 25 + " Application Finished " + "#" * 25)
+    logging.info(f"Script Execution took {END_TIME - START_TIME} seconds")
 
-END_TIME = time.time()
 
-logging.info("#" * 25 + " Application Finished " + "#" * 25)
-logging.info(f"Script Execution took {END_TIME - START_TIME} seconds")
\ No newline at end of file
+# The parsing stage runs in worker processes, which on some platforms re-import this script.  Guarding
+# the entry point keeps them from starting a collection run of their own
+if __name__ == "__main__":
+    main()
@@ -25,4 +25,44 @@ class RunCommand():
 
     @staticmethod
     def show_up_interfaces():
-        return "show ip interface brief | i up"
\ No newline at end of file
+        return "show ip interface brief | i up"
+
+class ScopedCommand():
+    """
+    ScopedCommand Commands that narrow show ip route down to a single vrf, a single prefix or just the
+    route counts.  Unlike RunCommand these need the platform since IOS and NX-OS put the vrf keyword in
+    different places
+
+    Returns:
+        str: show vrf
+        str: show ip route vrf NAME
+        str: show ip route vrf NAME summary (IOS) / show ip route summary vrf NAME (NX-OS)
+        str: show ip route vrf NAME 10.1.0.0 255.255.0.0 longer-prefixes (IOS) /
+             show ip route 10.1.0.0/16 longer-prefixes vrf NAME (NX-OS)
+    """
+
+    @staticmethod
+    def show_vrfs(platform: str):
+        return "show vrf"
+
+    @staticmethod
+    def show_routes_vrf(platform: str, vrf: str):
+        if vrf == "default" and platform != "cisco_nxos":
+            return "show ip route"
+        return f"show ip route vrf {vrf}"
+
+    @staticmethod
+    def show_routes_summary(platform: str, vrf: str):
+        if platform == "cisco_nxos":
+            return f"show ip route summary vrf {vrf}"
+        if vrf == "default":
+            return "show ip route summary"
+        return f"show ip route vrf {vrf} summary"
+
+    @staticmethod
+    def show_routes_prefix(platform: str, vrf: str, network: str, prefixlen: int, mask: str):
+        if platform == "cisco_nxos":
+            return f"show ip route {network}/{prefixlen} longer-prefixes vrf {vrf}"
+        if vrf == "default":
+            return f"show ip route {network} {mask} longer-prefixes"
+        return f"show ip route vrf {vrf} {network} {mask} longer-prefixes"
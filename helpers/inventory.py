@@ -0,0 +1,256 @@
+import csv
+import fnmatch
+import pathlib
+
+from helpers.logs import logging
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+"""
+    Device inventory.  Devices are read from a CSV (devices.txt is one) or a YAML file and yielded one at
+    a time, so filtering a 10k device inventory down to a handful of devices never builds the full list.
+
+    CSV, with or without a header row.  Without one the columns are host, device_type, profile, tags:
+
+        10.0.100.5,cisco_ios
+        10.0.200.1,cisco_nxos,dc,core;site-a
+
+    YAML:
+
+        groups:
+          core:
+            device_type: cisco_nxos
+            profile: dc
+        devices:
+          - host: 10.0.200.1
+            groups: [core]
+            tags: [site-a]
+          - host: 10.0.100.5
+            device_type: cisco_ios
+
+    A device takes its device_type and profile from its first group that sets them unless it sets them
+    itself.  Groups are also tags, so tag:core selects every device in the core group.  A YAML inventory
+    is loaded in one go, it is small next to the routing tables, and its devices are then yielded one at
+    a time like the CSV's
+"""
+
+CSV_COLUMNS = ("host", "device_type", "profile", "tags")
+
+SELECTORS = ("tag", "group", "type", "profile", "host")
+
+
+class Device(tuple):
+    """
+    Device A (host, device_type) pair with the inventory details attached.  Being a tuple, it can be
+    used anywhere the plain pairs are, e.g. the collector and the reachability check
+    """
+
+    def __new__(cls, host: str, device_type: str, profile: str = None, tags=()):
+        device = super().__new__(cls, (host, device_type))
+        device.profile = profile
+        device.tags = frozenset(tags)
+        return device
+
+    def __getnewargs__(self):
+        # So a Device survives pickling on its way to a worker process
+        return self[0], self[1], self.profile, self.tags
+
+    @property
+    def host(self):
+        return self[0]
+
+    @property
+    def device_type(self):
+        return self[1]
+
+    def matches(self, selector: str):
+        """
+        matches Tests the device against one selector:
+
+            tag:core            the device has the tag (or is in the group) core
+            group:core          the same as tag:core
+            type:cisco_nxos     the device type
+            profile:dc          the credentials profile
+            host:10.0.*         the host, shell style wildcards allowed
+            10.0.*              a bare selector matches a tag or the host
+
+        Returns:
+            bool: True if the device matches
+        """
+
+        kind, _, value = selector.partition(":")
+
+        if not value:
+            return any(fnmatch.fnmatch(tag, kind) for tag in self.tags) or fnmatch.fnmatch(self.host, kind)
+        if kind in ("tag", "group"):
+            return any(fnmatch.fnmatch(tag, value) for tag in self.tags)
+        if kind == "type":
+            return fnmatch.fnmatch(self.device_type, value)
+        if kind == "profile":
+            return self.profile == value
+        if kind == "host":
+            return fnmatch.fnmatch(self.host, value)
+
+        raise ValueError(f"Unknown inventory selector {selector!r}, expected one of {', '.join(SELECTORS)}")
+
+    def __repr__(self):
+        return f"Device(host={self.host!r}, device_type={self.device_type!r}, profile={self.profile!r}, tags={sorted(self.tags)})"
+
+
+def _split_tags(value):
+    # Tags in a CSV cell are separated by semicolons, spaces or pipes.  YAML gives a list already
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [tag for tag in value.replace("|", ";").replace(" ", ";").split(";") if tag]
+    return [str(tag) for tag in value]
+
+
+class Inventory():
+    """
+    Inventory Streams the devices from an inventory file
+
+        Methods:
+
+            devices - Yields the devices, filtered and de-duplicated
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str|Path): A .csv/.txt or .yml/.yaml inventory file
+
+        Raises:
+            ImportError: For a YAML inventory when PyYAML is not installed
+        """
+
+        self.path = pathlib.Path(path)
+
+        # Checked up front rather than when the devices are read, where it would look like an empty inventory
+        if self.path.suffix.lower() in (".yml", ".yaml") and yaml is None:
+            raise ImportError(f"reading the YAML inventory {self.path} needs PyYAML, pip install -r requirements.txt")
+        self.duplicates = 0
+        self.skipped = 0
+
+    def devices(self, include=None, exclude=None):
+        """
+        devices Yields every device matching at least one include selector (all devices when there are
+        none) and no exclude selector, see Device.matches.  A host listed more than once is only yielded
+        the first time.  Each device carries its credentials profile to the collector
+
+        Args:
+            include (list): Selectors a device must match one of
+            exclude (list): Selectors that drop a device
+
+        Yields:
+            Device: One per selected host
+        """
+
+        include = list(include or ())
+        exclude = list(exclude or ())
+
+        for selector in include + exclude:
+            kind, _, value = selector.partition(":")
+            if value and kind not in SELECTORS:
+                raise ValueError(f"Unknown inventory selector {selector!r}, expected one of {', '.join(SELECTORS)}")
+
+        seen = set()
+        selected = 0
+
+        self.duplicates = self.skipped = 0
+
+        try:
+            for device in self._read():
+                if include and not any(device.matches(selector) for selector in include):
+                    continue
+                if any(device.matches(selector) for selector in exclude):
+                    continue
+
+                if device.host in seen:
+                    self.duplicates += 1
+                    logging.error(f"{device.host} is listed more than once in {self.path.name}, keeping the first entry")
+                    continue
+                seen.add(device.host)
+
+                selected += 1
+                yield device
+
+        except OSError as e:
+            logging.error(f"Unable to open the inventory {self.path}: {e}")
+            return
+
+        logging.info(f"Selected {selected} devices from {self.path.name} ({self.duplicates} duplicates, {self.skipped} invalid lines skipped)")
+
+    def _read(self):
+        if self.path.suffix.lower() in (".yml", ".yaml"):
+            return self._read_yaml()
+        return self._read_csv()
+
+    def _read_csv(self):
+
+        with open(self.path, "r", newline="") as file:
+            rows = csv.reader(line for line in file if line.strip() and not line.lstrip().startswith("#"))
+            columns = CSV_COLUMNS
+
+            for number, row in enumerate(rows, 1):
+                row = [field.strip() for field in row]
+
+                if number == 1 and row[0].lower() == "host":
+                    columns = tuple(field.lower() for field in row)
+                    continue
+
+                fields = dict(zip(columns, row))
+
+                if not fields.get("host") or not fields.get("device_type"):
+                    self.skipped += 1
+                    logging.error(f"Skipping row {number} of {self.path.name}, expected host,device_type: {','.join(row)}")
+                    continue
+
+                yield Device(fields["host"], fields["device_type"], fields.get("profile") or None,
+                             _split_tags(fields.get("tags")))
+
+    def _read_yaml(self):
+
+        with open(self.path, "r") as file:
+            # The C loader is several times faster on large inventories when libyaml is available
+            try:
+                data = yaml.load(file, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+            except yaml.YAMLError as e:
+                raise OSError(f"not a valid YAML inventory, {e}")
+
+        data = data or {}
+        if not isinstance(data, dict):
+            raise OSError("not a valid YAML inventory, expected a mapping with groups and devices")
+
+        groups = data.get("groups") or {}
+
+        for entry in data.get("devices") or ():
+            device = self._yaml_device(entry, groups)
+            if device is not None:
+                yield device
+
+    def _yaml_device(self, entry, groups: dict):
+
+        if not isinstance(entry, dict) or not entry.get("host"):
+            self.skipped += 1
+            logging.error(f"Skipping inventory entry without a host in {self.path.name}: {entry}")
+            return None
+
+        member_of = _split_tags(entry.get("groups"))
+        settings = [entry] + [groups.get(group) or {} for group in member_of]
+
+        device_type = next((item["device_type"] for item in settings if item.get("device_type")), None)
+        profile = next((item["profile"] for item in settings if item.get("profile")), None)
+        tags = member_of + _split_tags(entry.get("tags"))
+        for group in member_of:
+            tags += _split_tags((groups.get(group) or {}).get("tags"))
+
+        if not device_type:
+            self.skipped += 1
+            logging.error(f"Skipping {entry['host']} in {self.path.name}, it has no device_type")
+            return None
+
+        return Device(str(entry["host"]), device_type, profile, tags)
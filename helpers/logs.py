@@ -1,14 +1,235 @@
+import atexit
+import datetime
+import gzip
+import json
 import logging
+import os
+import pathlib
+import queue
+import re
 
 """
     Configure the logger
+
+    Nothing is configured on import.  The entry points (cli.py, get_routes.py, diff_routes.py) call
+    setup_logging() once they know they are going to run, so importing a module for an offline diff or a
+    benchmark does not open application.log or start any threads.
+
+    Log calls only put the record on a queue.  A listener thread does the formatting and the writing, so
+    a slow disk or console never holds up the collection threads:
+
+        worker threads --> QueueHandler --> queue --> QueueListener --> console (text)
+                                                                    --> application.log (JSON lines, rotated)
+
+    Worker processes forked from this one, e.g. by the parser pool, do not open application.log themselves.
+    Their records go back over a multiprocessing queue to a listener in the parent, which hands each one
+    to the parent's logger of the same name, so every line is written by the one process:
+
+        forked worker --> QueueHandler --> multiprocessing queue --> QueueListener (parent) --> logger
+
+    The raw output of the devices does not go in application.log.  capture_raw_output hands it to a second
+    listener which writes one gzip file per device and command under routes/.raw_output/<host>/
 """
 
-# Configure the logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] (%(module)s):\n Message: %(message)s',
-    handlers=[
-        logging.FileHandler("application.log", "a"),
-        logging.StreamHandler()
-    ])
\ No newline at end of file
+LOG_FILE = "application.log"
+
+# application.log is rotated once it reaches LOG_MAX_BYTES, keeping LOG_BACKUPS old files
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5
+
+CONSOLE_FORMAT = '%(asctime)s [%(levelname)s] (%(module)s):\n Message: %(message)s'
+
+# Raw command output is saved under RAW_OUTPUT_DIR, keeping the newest RAW_OUTPUT_KEEP files per device.
+# Set CAPTURE_RAW_OUTPUT to False to not keep it at all
+CAPTURE_RAW_OUTPUT = True
+RAW_OUTPUT_DIR = pathlib.Path("routes") / ".raw_output"
+RAW_OUTPUT_KEEP = 20
+
+# The attributes every LogRecord has.  Anything else on a record came in through extra= and is written
+# as a field of the structured record
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    JsonFormatter Formats a record as one JSON object per line.  Fields passed with extra=, e.g.
+
+        logging.info("Collected routes", extra={"host": host, "routes": count})
+
+    become keys of the object, so the log can be filtered by host or stage with jq instead of grep
+    """
+
+    def format(self, record):
+
+        data = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "module": record.module,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and name not in data:
+                data[name] = value
+
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(data, default=str)
+
+
+class RawOutputHandler(logging.Handler):
+    """
+    RawOutputHandler Writes the raw_output carried by a record to a gzip file of its own, named after the
+    host, the time and the command.  Older files beyond RAW_OUTPUT_KEEP for the same host are removed
+    """
+
+    def __init__(self, directory=RAW_OUTPUT_DIR, keep: int = RAW_OUTPUT_KEEP):
+        super().__init__()
+        # Resolved now, like the log file, so the files land in the same place whatever the working
+        # directory is by the time the listener gets to them
+        self.directory = pathlib.Path(directory).resolve()
+        self.keep = keep
+
+    def emit(self, record):
+
+        try:
+            host_dir = self.directory / str(record.host)
+            host_dir.mkdir(parents=True, exist_ok=True)
+
+            timestamp = datetime.datetime.fromtimestamp(record.created).strftime("%Y%m%dT%H%M%S_%f")
+            command = re.sub(r"[^A-Za-z0-9]+", "_", record.command).strip("_")
+            path = host_dir / f"{record.host}_{timestamp}_{command}.txt.gz"
+
+            # Level 1 is plenty for CLI output and keeps the listener well ahead of the collectors
+            with gzip.open(path, "wt", compresslevel=1) as file:
+                file.write(record.raw_output)
+
+            if self.keep:
+                # The timestamp in the name makes name order the same as age order
+                artifacts = sorted(host_dir.glob(f"{record.host}_*.txt.gz"))
+                for old in artifacts[:-self.keep]:
+                    os.remove(old)
+
+        except Exception:
+            self.handleError(record)
+
+
+class _ParentHandler(logging.Handler):
+    """
+    _ParentHandler Hands a record that came from a forked worker to the parent's logger of the same name,
+    which puts it on the parent's own queues as if it had been logged there
+    """
+
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+_listeners = []
+
+# Where forked workers send their records.  Created by setup_logging, before any worker is forked
+_worker_queue = None
+
+# Raw output never reaches the root logger's handlers, even before setup_logging has run
+_raw_logger = logging.getLogger("raw_output")
+_raw_logger.propagate = False
+
+
+def setup_logging(level=logging.INFO, log_file: str = LOG_FILE):
+    """
+    setup_logging Puts a QueueHandler on the root logger and starts the listener threads that write the
+    console, the rotating application.log and the raw output files.  Calling it again does nothing
+
+    Args:
+        level (int): Root log level
+        log_file (str): Path of the structured log file
+    """
+
+    global _worker_queue
+
+    if _listeners:
+        return
+
+    # Imported here rather than at the top, they pull in socket and pickle which an offline diff never needs
+    import logging.handlers
+    import multiprocessing
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+
+    log_file_handler = logging.handlers.RotatingFileHandler(log_file, "a", maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+    log_file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    _listeners.append(logging.handlers.QueueListener(log_queue, console, log_file_handler))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+
+    # Raw output goes through its own queue so compressing a large routing table never delays the
+    # ordinary log lines behind it
+    raw_queue = queue.SimpleQueue()
+    _listeners.append(logging.handlers.QueueListener(raw_queue, RawOutputHandler()))
+
+    _raw_logger.handlers = [logging.handlers.QueueHandler(raw_queue)]
+    _raw_logger.setLevel(logging.INFO)
+
+    # The records of forked workers come back through a queue that works across processes
+    _worker_queue = multiprocessing.Queue()
+    _listeners.append(logging.handlers.QueueListener(_worker_queue, _ParentHandler()))
+
+    for listener in _listeners:
+        listener.start()
+
+    # Flush whatever is still queued when the interpreter exits
+    atexit.register(stop_logging)
+
+
+def _send_to_parent():
+    # A forked worker process, e.g. from the parser pool, inherits the queue handlers but not the listener
+    # threads.  Rather than start listeners of its own, which would open application.log a second time and
+    # lose whatever is still queued when the worker exits, it sends its records to the parent's listener
+    if not _listeners:
+        return
+
+    import logging.handlers
+
+    _listeners.clear()
+
+    handler = logging.handlers.QueueHandler(_worker_queue)
+    logging.getLogger().handlers = [handler]
+    _raw_logger.handlers = [handler]
+
+
+def stop_logging():
+    """
+    stop_logging Waits for the listener threads to write out everything queued and stops them
+    """
+
+    while _listeners:
+        _listeners.pop().stop()
+
+
+def capture_raw_output(host: str, command: str, raw_output: str, hostname: str = None):
+    """
+    capture_raw_output Keeps a device's raw command output as a compressed file under RAW_OUTPUT_DIR
+    instead of writing it to the log.  Only the size is logged
+
+    Args:
+        host (str): The IP/hostname the output came from
+        command (str): The command that was run
+        raw_output (str): The output
+        hostname (str): The device's hostname, when known
+    """
+
+    fields = {"host": host, "hostname": hostname, "command": command, "bytes": len(raw_output)}
+
+    logging.info(f"Received {len(raw_output)} bytes from {host} running command: {command}", extra=fields, stacklevel=2)
+
+    if CAPTURE_RAW_OUTPUT and _raw_logger.handlers:
+        _raw_logger.info("raw output", extra=dict(fields, raw_output=raw_output))
+
+
+os.register_at_fork(after_in_child=_send_to_parent)
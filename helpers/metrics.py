@@ -0,0 +1,248 @@
+import contextlib
+import json
+import os
+import pathlib
+import threading
+import time
+
+from helpers.logs import logging
+
+"""
+    Lightweight run metrics.  Code anywhere in the collection path times its stages with
+
+        with metrics.stage(host, "connect"):
+            ...
+
+    and records counts with metrics.add(host, "bytes_received", n) or metrics.set(host, "routes", n).
+    Stages that cover the whole run rather than one device, such as the reachability sweep, are recorded
+    with a host of None.  They count towards the stage summary but are not reported as a device.
+    At the end of a run the per-stage timings are summarised with percentiles and can be exported as JSON
+    or in the Prometheus text format for the node exporter's textfile collector
+"""
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values: list, pct: float):
+    """
+    percentile Linear interpolation between the closest ranks, the same as numpy's default
+
+    Args:
+        values (list): Sorted samples
+        pct (float): 0 to 100
+
+    Returns:
+        float: The percentile, 0.0 when there are no samples
+    """
+
+    if not values:
+        return 0.0
+
+    rank = (len(values) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+class Metrics():
+    """
+    Metrics Collects per-device, per-stage timings and counters.  Safe to use from the collector's worker
+    threads
+
+        Methods:
+
+            stage - Context manager that times a stage for a host, or for the run with host None
+
+            record - Records a stage timing measured elsewhere
+
+            run - Run level stage timings
+
+            add - Adds to a counter for a host, e.g. bytes received
+
+            set - Sets a value for a host, e.g. number of routes
+
+            summary - Logs and returns percentiles per stage
+
+            to_json - Writes everything to a JSON file
+
+            to_prometheus - Writes everything in the Prometheus text format
+    """
+
+    def __init__(self):
+
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._samples = {}
+            self._values = {}
+            self._started = time.time()
+
+    @contextlib.contextmanager
+    def stage(self, host: str, name: str):
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(host, name, time.perf_counter() - start)
+
+    def record(self, host: str, name: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault((host, name), []).append(seconds)
+
+    def add(self, host: str, name: str, value: float = 1):
+        with self._lock:
+            self._values[(host, name)] = self._values.get((host, name), 0) + value
+
+    def set(self, host: str, name: str, value: float):
+        with self._lock:
+            self._values[(host, name)] = value
+
+    def stages(self):
+        """
+        stages Every sample grouped by stage across all hosts
+
+        Returns:
+            dict: stage -> sorted list of seconds
+        """
+
+        grouped = {}
+        with self._lock:
+            for (_, name), samples in self._samples.items():
+                grouped.setdefault(name, []).extend(samples)
+
+        return {name: sorted(samples) for name, samples in grouped.items()}
+
+    def devices(self):
+        """
+        devices Per-host view: the total seconds spent in each stage and every counter
+
+        Returns:
+            dict: host -> {"stages": {stage: seconds}, "values": {name: value}}
+        """
+
+        devices = {}
+        with self._lock:
+            for (host, name), samples in self._samples.items():
+                if host is not None:
+                    devices.setdefault(host, {"stages": {}, "values": {}})["stages"][name] = round(sum(samples), 6)
+            for (host, name), value in self._values.items():
+                if host is not None:
+                    devices.setdefault(host, {"stages": {}, "values": {}})["values"][name] = value
+
+        return devices
+
+    def run(self):
+        """
+        run The stages recorded for the run as a whole rather than a device
+
+        Returns:
+            dict: stage -> total seconds
+        """
+
+        with self._lock:
+            return {name: round(sum(samples), 6) for (host, name), samples in self._samples.items() if host is None}
+
+    def summary(self, log: bool = True):
+        """
+        summary Count, mean, percentiles and max for every stage
+
+        Args:
+            log (bool): Also log a line per stage
+
+        Returns:
+            dict: stage -> statistics
+        """
+
+        summary = {}
+
+        for name, samples in sorted(self.stages().items()):
+            stats = {
+                "count": len(samples),
+                "sum": round(sum(samples), 6),
+                "mean": round(sum(samples) / len(samples), 6),
+                "max": round(samples[-1], 6),
+            }
+            for pct in PERCENTILES:
+                stats[f"p{pct}"] = round(percentile(samples, pct), 6)
+            summary[name] = stats
+
+            if log:
+                logging.info(f"Stage {name:<14} n={stats['count']:<5} mean={stats['mean']:.3f}s "
+                             f"p50={stats['p50']:.3f}s p90={stats['p90']:.3f}s p99={stats['p99']:.3f}s max={stats['max']:.3f}s")
+
+        return summary
+
+    def to_json(self, path):
+        """
+        to_json Writes the stage summary and the per-device detail to a JSON file
+        """
+
+        data = {
+            "started": self._started,
+            "finished": time.time(),
+            "stages": self.summary(log=False),
+            "run": self.run(),
+            "devices": self.devices(),
+        }
+
+        _write_atomic(path, json.dumps(data, indent=2))
+        logging.info(f"Wrote run metrics to {path}")
+
+    def to_prometheus(self, path, prefix: str = "route_collection"):
+        """
+        to_prometheus Writes the metrics in the Prometheus text exposition format.  The file is replaced
+        atomically so the node exporter never reads it half written
+        """
+
+        lines = [
+            f"# HELP {prefix}_stage_seconds Time spent in each collection stage across all devices",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+
+        for name, samples in sorted(self.stages().items()):
+            for pct in PERCENTILES:
+                lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="{pct / 100}"}} {percentile(samples, pct):.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {sum(samples):.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {len(samples)}')
+
+        lines.append(f"# HELP {prefix}_run_stage_seconds Time spent in stages that cover the whole run")
+        lines.append(f"# TYPE {prefix}_run_stage_seconds gauge")
+        for name, seconds in sorted(self.run().items()):
+            lines.append(f'{prefix}_run_stage_seconds{{stage="{name}"}} {seconds:.6f}')
+
+        devices = self.devices()
+
+        lines.append(f"# HELP {prefix}_device_stage_seconds Time spent in each stage per device")
+        lines.append(f"# TYPE {prefix}_device_stage_seconds gauge")
+        for host, detail in sorted(devices.items()):
+            for name, seconds in sorted(detail["stages"].items()):
+                lines.append(f'{prefix}_device_stage_seconds{{host="{host}",stage="{name}"}} {seconds:.6f}')
+
+        names = sorted({name for detail in devices.values() for name in detail["values"]})
+        for name in names:
+            lines.append(f"# TYPE {prefix}_device_{name} gauge")
+            for host, detail in sorted(devices.items()):
+                if name in detail["values"]:
+                    lines.append(f'{prefix}_device_{name}{{host="{host}"}} {detail["values"][name]}')
+
+        lines.append(f"# TYPE {prefix}_last_run_timestamp_seconds gauge")
+        lines.append(f"{prefix}_last_run_timestamp_seconds {time.time():.0f}")
+
+        _write_atomic(path, "\n".join(lines) + "\n")
+        logging.info(f"Wrote Prometheus metrics to {path}")
+
+
+def _write_atomic(path, text: str):
+    path = pathlib.Path(path)
+    temp_path = path.with_name(path.name + ".tmp")
+    with open(temp_path, "w") as file:
+        file.write(text)
+    os.replace(temp_path, path)
+
+
+# The run wide instance the collection code records into
+metrics = Metrics()
@@ -1,5 +1,10 @@
+import asyncio
+import itertools
+import time
+
 import icmplib
 from helpers.logs import logging
+from helpers.metrics import metrics
 
 def ip4_ping(ip4_addr: str, packets: int = 2):
     """
@@ -21,3 +26,233 @@ def ip4_ping(ip4_addr: str, packets: int = 2):
     else:
         logging.info(f"{ip4_addr} responded to ping and is reachable. Avg. Response Time: {ping_ip.avg_rtt}")
         return True
+
+
+class Reachability():
+    """
+    Reachability The outcome of probing a single host, whether by ICMP or a TCP connect
+
+    Attributes:
+        address (str): The host that was probed
+        is_alive (bool): True if at least one probe was answered
+        rtts (list): Round trip times in milliseconds of the answered probes
+        packets_sent (int): Number of probes sent
+    """
+
+    def __init__(self, address: str, is_alive: bool, rtts: list = None, packets_sent: int = 0):
+
+        self.address = address
+        self.is_alive = is_alive
+        self.rtts = rtts or []
+        self.packets_sent = packets_sent
+
+    @property
+    def min_rtt(self):
+        return round(min(self.rtts), 3) if self.rtts else 0.0
+
+    @property
+    def avg_rtt(self):
+        return round(sum(self.rtts) / len(self.rtts), 3) if self.rtts else 0.0
+
+    @property
+    def max_rtt(self):
+        return round(max(self.rtts), 3) if self.rtts else 0.0
+
+    def __repr__(self):
+        return f"Reachability(address={self.address!r}, is_alive={self.is_alive}, avg_rtt={self.avg_rtt})"
+
+
+class ReachabilityCheck():
+    """
+    ReachabilityCheck A pre-flight stage that probes devices in concurrent batches instead of pinging one
+    host at a time in the main loop.  Each batch costs roughly one probe interval no matter how many
+    devices are in it.  Results are cached for the life of the object so a host is only ever probed once
+    per run
+
+        Methods:
+
+            check - Probes any hosts not already in the cache and returns results for all of them
+
+            reachable - Yields the devices that answered, probing them a batch at a time as they are read
+
+            live - Filters a device list down to the devices that answered
+
+            summary - Logs reachable/unreachable counts and RTT stats
+    """
+
+    ICMP = "icmp"
+    TCP = "tcp"
+
+    def __init__(self, method: str = "icmp", count: int = 2, interval: float = 0.5, timeout: float = 2,
+                 port: int = 22, concurrency: int = 50):
+        """
+        Args:
+            method (str): "icmp" to ping with icmplib or "tcp" to attempt a TCP connect to port
+            count (int): Probes sent to each host
+            interval (float): Seconds between probes to the same host
+            timeout (float): Seconds to wait for each probe to be answered
+            port (int): Port used by the TCP probe, SSH by default
+            concurrency (int): The most hosts probed at the same time
+        """
+
+        if method not in (ReachabilityCheck.ICMP, ReachabilityCheck.TCP):
+            raise ValueError(f"Unknown reachability method: {method}")
+        if count < 1:
+            raise ValueError("count must be at least 1")
+
+        self.method = method
+        self.count = count
+        self.interval = interval
+        self.timeout = timeout
+        self.port = port
+        self.concurrency = concurrency
+        self.cache = {}
+
+    def check(self, hosts):
+        """
+        check Probes every host not already in the cache
+
+        Args:
+            hosts (iterable): IP addresses to probe
+
+        Returns:
+            dict: host -> Reachability for every host asked about
+        """
+
+        hosts = list(dict.fromkeys(hosts))
+        pending = [host for host in hosts if host not in self.cache]
+
+        if pending:
+            start = time.monotonic()
+
+            if self.method == ReachabilityCheck.ICMP:
+                results = self._icmp(pending)
+            else:
+                results = asyncio.run(self._tcp(pending))
+
+            self.cache.update(results)
+            elapsed = time.monotonic() - start
+            logging.info(f"Probed {len(pending)} hosts ({self.method}) in {elapsed:.2f} seconds")
+
+            # The hosts are probed concurrently, so the stage is the time for the whole sweep and belongs to
+            # the run rather than any one host.  Each host's round trip time is kept against the host
+            metrics.record(None, "ping", elapsed)
+            for host, result in results.items():
+                if result.is_alive:
+                    metrics.set(host, "ping_rtt_ms", result.avg_rtt)
+
+        return {host: self.cache[host] for host in hosts}
+
+    def reachable(self, devices, batch_size: int = None):
+        """
+        reachable Reads the devices a batch at a time, probes each batch concurrently and yields the ones
+        whose host answered.  The devices are never all held at once, so the first reachable devices can be
+        on their way to the collector while the rest of the inventory is still being read and probed
+
+            collector.collect(reachability.reachable(inventory.devices()), command)
+
+        Args:
+            devices (iterable): (host, device_type) pairs
+            batch_size (int): Devices probed together.  Defaults to the concurrency
+
+        Yields:
+            tuple: The reachable (host, device_type) pairs, in their original order
+        """
+
+        devices = iter(devices)
+        batch_size = batch_size or self.concurrency
+
+        while True:
+            batch = list(itertools.islice(devices, batch_size))
+            if not batch:
+                return
+
+            results = self.check(device[0] for device in batch)
+
+            for device in batch:
+                result = results[device[0]]
+
+                if result.is_alive:
+                    logging.info(f"{device[0]} is reachable. Avg. Response Time: {result.avg_rtt}")
+                    yield device
+                else:
+                    logging.info(f"{device[0]} is not responding. {len(result.rtts)} of {result.packets_sent} probes answered")
+
+    def live(self, devices):
+        """
+        live Filters (host, device_type) pairs down to the ones whose host answered
+
+        Args:
+            devices (iterable): (host, device_type) pairs
+
+        Returns:
+            list: The reachable (host, device_type) pairs, in their original order
+        """
+
+        return list(self.reachable(devices))
+
+    def summary(self):
+        """
+        summary Logs how many of the probed hosts answered along with the spread of round trip times
+
+        Returns:
+            dict: reachable and unreachable counts and min/avg/max RTT over the reachable hosts
+        """
+
+        alive = [result for result in self.cache.values() if result.is_alive]
+        averages = [result.avg_rtt for result in alive]
+
+        stats = {
+            "reachable": len(alive),
+            "unreachable": len(self.cache) - len(alive),
+            "min_rtt": min(averages) if averages else 0.0,
+            "avg_rtt": round(sum(averages) / len(averages), 3) if averages else 0.0,
+            "max_rtt": max(averages) if averages else 0.0,
+        }
+
+        logging.info(f"Reachability summary: {stats}")
+        return stats
+
+    def _icmp(self, hosts: list):
+        # multiping runs the pings on an asyncio loop and returns the hosts in the order they were given
+        responses = icmplib.multiping(hosts, count=self.count, interval=self.interval, timeout=self.timeout,
+                                      concurrent_tasks=self.concurrency, privileged=False)
+
+        return {
+            host: Reachability(host, response.is_alive, list(response.rtts), response.packets_sent)
+            for host, response in zip(hosts, responses)
+        }
+
+    async def _tcp(self, hosts: list):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def probe(host):
+            rtts = []
+            sent = 0
+
+            async with semaphore:
+                for attempt in range(self.count):
+                    if attempt:
+                        await asyncio.sleep(self.interval)
+
+                    sent += 1
+
+                    start = time.perf_counter()
+                    try:
+                        _, writer = await asyncio.wait_for(asyncio.open_connection(host, self.port), self.timeout)
+                    except (OSError, asyncio.TimeoutError):
+                        continue
+
+                    rtts.append((time.perf_counter() - start) * 1000)
+                    writer.close()
+                    try:
+                        await writer.wait_closed()
+                    except OSError:
+                        pass
+
+                    # One answered connect is enough to know SSH is listening
+                    break
+
+            return host, Reachability(host, bool(rtts), rtts, sent)
+
+        return dict(await asyncio.gather(*(probe(host) for host in hosts)))
@@ -0,0 +1,330 @@
+import time
+import concurrent.futures
+
+from netmiko import ConnectHandler, NetmikoTimeoutException, NetmikoAuthenticationException
+from ntc_templates.parse import parse_output
+
+from helpers.logs import logging, capture_raw_output
+from helpers.metrics import metrics
+from credentials.credentials import GetCredentials
+
+
+class DeviceResult():
+    """
+    DeviceResult A simple container for the outcome of collecting routes from a single device.  The
+    collector hands one of these back for every device it was given, successful or not, so the caller
+    can report on the whole run instead of digging through the log
+
+    Status values:
+        success - connected, ran the command and parsed the output
+        auth_failed - the username or password was rejected
+        enable_failed - could not enter privilege mode
+        timeout - the device did not answer within the per-device timeout
+        deadline - the global deadline was reached before the device was finished
+        error - anything else that went wrong
+    """
+
+    SUCCESS = "success"
+    AUTH_FAILED = "auth_failed"
+    ENABLE_FAILED = "enable_failed"
+    TIMEOUT = "timeout"
+    DEADLINE = "deadline"
+    ERROR = "error"
+
+    def __init__(self, host: str, device_type: str, status: str, hostname: str = None, command: str = None,
+                 raw_output: str = None, parsed_output: list = None, error: str = None, elapsed: float = 0.0,
+                 attempts: int = 1, snapshot: dict = None):
+
+        self.host = host
+        self.device_type = device_type
+        self.status = status
+        self.hostname = hostname
+        self.command = command
+        self.raw_output = raw_output
+        self.parsed_output = parsed_output
+        self.error = error
+        self.elapsed = elapsed
+        # Set by the retry scheduler when the device needed more than one try
+        self.attempts = attempts
+        # The manifest entry when the worker saved the snapshot itself, see StreamingCollection
+        self.snapshot = snapshot
+
+    @property
+    def ok(self):
+        return self.status == DeviceResult.SUCCESS
+
+    def __repr__(self):
+        return f"DeviceResult(host={self.host!r}, status={self.status!r}, elapsed={self.elapsed:.2f})"
+
+
+def connection_profile(host: str, device_type: str, timeout: float = 60, profile: str = None):
+    """
+    connection_profile Builds the Netmiko connection dictionary for a device.  The per-device timeout is
+    applied to the TCP connect, the authentication and the banner so a single unresponsive device cannot
+    hold a worker forever
+
+    Args:
+        host (str): The IP/hostname of the device
+        device_type (str): The Netmiko device type, e.g. cisco_ios or cisco_nxos
+        timeout (float): Seconds to wait on the connection before giving up
+        profile (str): The device's credentials profile from the inventory, see GetCredentials.profile
+
+    Returns:
+        dict: Keyword arguments for Netmiko's ConnectHandler
+    """
+
+    # The inventory can give a device its own credentials profile, otherwise the NETLAB_ ones are used
+    username, password, secret = GetCredentials.profile(profile)
+
+    return {
+        "host": host,
+        "device_type": device_type,
+        "username": username,
+        "password": password,
+        "secret": secret,
+        "conn_timeout": timeout,
+        "auth_timeout": timeout,
+        "banner_timeout": timeout,
+    }
+
+
+def failed_result(host: str, device_type: str, command: str, error: Exception, start: float, activity: str = "Collection"):
+    """
+    failed_result Turns an exception raised while working on a device into a logged DeviceResult with
+    the matching status.  Every collection worker ends in this so a failure reads the same whichever
+    worker hit it
+
+    Args:
+        host (str): The IP/hostname of the device
+        device_type (str): The Netmiko device type
+        command (str): The command being run
+        error (Exception): What was raised
+        start (float): time.monotonic() when work on the device started
+        activity (str): What was being done, for the log message of unexpected errors
+
+    Returns:
+        DeviceResult: The failed result
+    """
+
+    elapsed = time.monotonic() - start
+
+    if isinstance(error, NetmikoAuthenticationException):
+        logging.error(f"Authentication failed. Invalid username or password for {host}. Please verify your credentials")
+        return DeviceResult(host, device_type, DeviceResult.AUTH_FAILED, command=command,
+                            error="authentication failed", elapsed=elapsed)
+
+    if isinstance(error, NetmikoTimeoutException):
+        logging.error(f"Connection time out for {host}")
+        return DeviceResult(host, device_type, DeviceResult.TIMEOUT, command=command,
+                            error="connection timed out", elapsed=elapsed)
+
+    # Netmiko raises a ValueError when enable() does not reach the privileged prompt
+    if isinstance(error, ValueError):
+        logging.error(f"Failed to enter privilege mode! Please check the enable password for device {host}")
+        return DeviceResult(host, device_type, DeviceResult.ENABLE_FAILED, command=command,
+                            error="failed to enter privilege mode", elapsed=elapsed)
+
+    logging.error(f"{activity} from {host} failed with error message: {error}")
+    return DeviceResult(host, device_type, DeviceResult.ERROR, command=command, error=str(error), elapsed=elapsed)
+
+
+def collect_device(host: str, device_type: str, command: str, timeout: float = 60, parser=parse_output, profile: str = None):
+    """
+    collect_device Connects to a single device, enters enable mode, runs the command and parses the
+    output with NTC templates.  This is the same pipeline get_routes.py used to run inline, pulled out
+    so it can be handed to a worker thread.  Exceptions are caught here and turned into a status
+    so one bad device never takes down the rest of the run
+
+    Args:
+        host (str): The IP/hostname of the device
+        device_type (str): The Netmiko device type
+        command (str): The command to run, typically RunCommand.show_routes()
+        timeout (float): Per-device timeout in seconds
+        parser (callable): Called as parser(platform=, command=, data=).  Defaults to parse_output, a
+        ParseCache's parse method can be used instead.  None skips parsing, see ParserPool
+        profile (str): The device's credentials profile.  None uses the NETLAB_ credentials
+
+    Returns:
+        DeviceResult: The outcome for this device
+    """
+
+    start = time.monotonic()
+
+    try:
+        with metrics.stage(host, "connect"):
+            ssh_connection = ConnectHandler(**connection_profile(host, device_type, timeout, profile))
+
+        with ssh_connection:
+
+            # Activate enable mode
+            with metrics.stage(host, "enable"):
+                ssh_connection.enable()
+            # Grab the hostname.  Assumes the name at the command prompt is the hostname
+            hostname = ssh_connection.find_prompt()[:-1]
+            # Store the raw output of the command run in a variable
+            with metrics.stage(host, "send_command"):
+                raw_output = ssh_connection.send_command(command, read_timeout=timeout)
+
+        metrics.add(host, "bytes_received", len(raw_output))
+
+        # The output itself is kept as a compressed file per device rather than written to the log
+        capture_raw_output(host, command, raw_output, hostname)
+
+        # Parse the command output into a format that is easier to work with.  Making the platform and
+        # command dynamic, we automatically get the correct template output.  With no parser the raw
+        # output is handed back as is for a separate parsing stage
+        parsed_output = None
+        if parser is not None:
+            with metrics.stage(host, "parse"):
+                parsed_output = parser(platform=device_type, command=command, data=raw_output)
+
+    except Exception as e:
+        return failed_result(host, device_type, command, e, start)
+
+    return DeviceResult(host, device_type, DeviceResult.SUCCESS, hostname=hostname, command=command,
+                        raw_output=raw_output, parsed_output=parsed_output, elapsed=time.monotonic() - start)
+
+
+class DeviceCollector():
+    """
+    DeviceCollector Fans the connect/enable/send_command/parse pipeline out across a bounded pool of
+    worker threads.  The work is almost entirely waiting on SSH handshakes and prompts, so threads are
+    plenty and the wall-clock time of a run is governed by the slowest device rather than the number
+    of devices
+
+        Methods:
+
+            collect - Yields a DeviceResult for each device as it finishes
+
+            summary - Logs and returns a count of results by status
+    """
+
+    def __init__(self, max_workers: int = 10, device_timeout: float = 60, deadline: float = None, parser=parse_output):
+        """
+        Args:
+            max_workers (int): The most devices that will be worked on at the same time
+            device_timeout (float): Seconds allowed for any one device's connection and command
+            deadline (float): Seconds allowed for the whole run.  None means no limit
+            parser (callable): Handed to the worker to parse the raw output, see collect_device
+        """
+
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+
+        self.max_workers = max_workers
+        self.device_timeout = device_timeout
+        self.deadline = deadline
+        self.parser = parser
+        self.results = []
+
+    def collect(self, devices, command: str, worker=collect_device):
+        """
+        collect Hands the devices to the worker pool as they are read and yields results in the order they
+        complete.  Devices are read only as fast as the workers take them, so results for the first devices
+        come back while the rest are still being read (and probed, see ReachabilityCheck.reachable).  The
+        global deadline counts from the call, reading the devices included.  Once it passes, any device
+        being worked on is reported with a deadline status and devices not yet read are left unread
+
+        Args:
+            devices (iterable): Inventory Devices or plain (host, device_type) pairs
+            command (str): The command to run on every device
+            worker (callable): The function run per device, called as worker(host, device_type, command,
+            timeout, parser, profile).  Defaults to collect_device
+
+        Yields:
+            DeviceResult: One per device read
+        """
+
+        self.results = []
+
+        deadline = time.monotonic() + self.deadline if self.deadline is not None else None
+        devices = iter(devices)
+        exhausted = False
+        submitted = 0
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        # Futures not yet yielded, in the order they were submitted.  One device is kept queued behind each
+        # worker so a worker that finishes never waits on the next device being read
+        pending = {}
+
+        logging.info(f"Collecting with {self.max_workers} workers")
+
+        try:
+            while True:
+                while not exhausted and len(pending) < self.max_workers * 2:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        break
+
+                    device = next(devices, None)
+                    if device is None:
+                        exhausted = True
+                        break
+
+                    host, device_type = device
+                    # Plain pairs have no profile and connect with the default credentials
+                    profile = getattr(device, "profile", None)
+                    future = executor.submit(worker, host, device_type, command, self.device_timeout, self.parser, profile)
+                    pending[future] = (host, device_type)
+                    submitted += 1
+
+                if not pending and exhausted:
+                    break
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                done = set()
+                if pending and (remaining is None or remaining > 0):
+                    done, _ = concurrent.futures.wait(pending, timeout=remaining, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                if not done:
+                    # Nothing finished before the deadline
+                    break
+
+                for future in done:
+                    del pending[future]
+                    result = future.result()
+                    metrics.record(result.host, "device_total", result.elapsed)
+                    self.results.append(result)
+                    yield result
+
+            if pending or not exhausted:
+                unread = "" if exhausted else " and the rest of the devices were not read"
+                logging.error(f"Global deadline of {self.deadline} seconds reached before all devices finished.  "
+                              f"{len(pending)} devices were still being worked on{unread}")
+
+                for future, (host, device_type) in pending.items():
+                    if future.done() and not future.cancelled():
+                        # Finished in the moment between the deadline and now, keep the result
+                        result = future.result()
+                    else:
+                        future.cancel()
+                        result = DeviceResult(host, device_type, DeviceResult.DEADLINE, command=command,
+                                              error="global deadline reached", elapsed=self.deadline)
+                    self.results.append(result)
+                    yield result
+
+            logging.info(f"Collected from {submitted} devices")
+
+        finally:
+            # Do not wait on threads still stuck in a handshake past the deadline.  They will fall
+            # out on their own once the per-device timeout expires
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def summary(self):
+        """
+        summary Logs how each device fared in the last run
+
+        Returns:
+            dict: Number of devices per status
+        """
+
+        counts = {}
+        for result in self.results:
+            counts[result.status] = counts.get(result.status, 0) + 1
+
+        logging.info(f"Collection summary: {counts}")
+
+        for result in self.results:
+            if not result.ok:
+                logging.info(f"\t {result.host} ({result.device_type}): {result.status} - {result.error}")
+
+        return counts
@@ -0,0 +1,225 @@
+import concurrent.futures
+import json
+import os
+import pathlib
+import re
+
+from helpers.logs import logging
+from utilities.route_diff import diff_routes, semantic_diff
+from utilities.snapshot_store import Snapshot, SnapshotStore
+from utilities.snapshot_writer import read_snapshot
+
+"""
+    Compares the snapshots of every host under routes/ in one pass.  Each host's original snapshot is
+    paired with its latest (or a chosen) migrated snapshot and the hosts are compared in parallel worker
+    processes, giving one summary for the whole fleet
+"""
+
+ORIGINAL = "original_routes"
+
+# Matches the snapshot CSVs get_routes.py writes, e.g. core1_migrated_004.csv.gz
+_CSV_PATTERN = re.compile(r"_(original_routes|migrated_(\d{3,}))\.csv(\.gz)?$")
+
+
+def find_snapshots(host_dir: pathlib.Path):
+    """
+    find_snapshots Lists the snapshots available for a host, from its manifest and from any CSV files
+    in the directory.  The binary snapshot is preferred where both exist as it loads faster, unless the
+    CSV has entries the binary snapshot left out (see SnapshotStore.add), or the manifest does not say
+
+    Args:
+        host_dir (Path): The host's directory under routes/
+
+    Returns:
+        dict: snapshot name -> ("rts", Path) or ("csv", Path)
+    """
+
+    snapshots = {}
+
+    with os.scandir(host_dir) as entries:
+        for entry in entries:
+            match = _CSV_PATTERN.search(entry.name)
+            if match:
+                snapshots[match.group(1)] = ("csv", pathlib.Path(entry.path))
+
+    store = SnapshotStore(host_dir.name, host_dir.parent)
+    for snapshot in store.snapshots:
+        # Entries that are not IPv4 routes are only in the CSV, and comparing without them would miss
+        # their changes
+        if snapshot.get("skipped", 1) and snapshot["name"] in snapshots:
+            continue
+        snapshots[snapshot["name"]] = ("rts", store.directory / snapshot["file"])
+
+    return snapshots
+
+
+def latest_migrated(snapshots: dict):
+    """
+    latest_migrated The name of the highest numbered migrated snapshot, None if there are none
+    """
+
+    migrated = [name for name in snapshots if name.startswith("migrated_")]
+    return max(migrated, key=lambda name: int(name.split("_")[1])) if migrated else None
+
+
+def load_routes(kind: str, path: pathlib.Path):
+    """
+    load_routes Reads a snapshot's routes, either from a binary snapshot or a CSV
+
+    Returns:
+        list: The routes
+    """
+
+    if kind == "rts":
+        with Snapshot(path) as snapshot:
+            return list(snapshot.routes())
+
+    return list(read_snapshot(path))
+
+
+def compare_host(host_dir, migrated: int = None, details: bool = True, semantic: bool = False, ignore=()):
+    """
+    compare_host Compares a host's original snapshot with a migrated one.  Runs in a worker process, so
+    every failure is returned as part of the result rather than raised
+
+    Args:
+        host_dir (str|Path): The host's directory under routes/
+        migrated (int): The migrated snapshot number to compare.  The latest when None
+        details (bool): Include the full list of differences, not just the counts
+        semantic (bool): Use semantic_diff, so summarised prefixes are reported as covered
+        ignore (iterable): With semantic, fields not to compare
+
+    Returns:
+        dict: host, the snapshot names compared, summary counts and optionally the diff, or an error
+    """
+
+    host_dir = pathlib.Path(host_dir)
+    report = {"host": host_dir.name}
+
+    try:
+        snapshots = find_snapshots(host_dir)
+        migrated_name = latest_migrated(snapshots) if migrated is None else f"migrated_{migrated:03d}"
+
+        if ORIGINAL not in snapshots:
+            report["error"] = "no original snapshot"
+            return report
+        if migrated_name is None or migrated_name not in snapshots:
+            report["error"] = f"no {migrated_name or 'migrated'} snapshot"
+            return report
+
+        report["original"] = ORIGINAL
+        report["migrated"] = migrated_name
+
+        original_routes, migrated_routes = load_routes(*snapshots[ORIGINAL]), load_routes(*snapshots[migrated_name])
+
+        if semantic:
+            diff = semantic_diff(original_routes, migrated_routes, ignore=ignore)
+        else:
+            diff = diff_routes(original_routes, migrated_routes)
+
+        report["summary"] = diff.summary()
+        if details:
+            report["diff"] = diff.to_dict()
+
+    except (OSError, ValueError, KeyError) as e:
+        report["error"] = str(e)
+
+    return report
+
+
+def host_directories(routes_dir):
+    """
+    host_directories Every host directory under routes/.  Hidden directories such as the parse cache
+    are skipped
+
+    Returns:
+        list: Host directory paths, sorted by hostname
+    """
+
+    routes_dir = pathlib.Path(routes_dir)
+
+    if not routes_dir.is_dir():
+        logging.error(f"{routes_dir} does not exist.  Run get_routes.py to collect some snapshots first")
+        return []
+
+    return sorted(path for path in routes_dir.iterdir() if path.is_dir() and not path.name.startswith("."))
+
+
+def diff_fleet(routes_dir="routes", migrated: int = None, max_workers: int = None, details: bool = True,
+               semantic: bool = False, ignore=()):
+    """
+    diff_fleet Compares every host under routes_dir in parallel
+
+    Args:
+        routes_dir (str|Path): The directory get_routes.py saves snapshots in
+        migrated (int): The migrated snapshot number to compare for every host.  The latest when None
+        max_workers (int): Worker processes.  Defaults to the number of CPUs
+        details (bool): Include the full list of differences for each host
+        semantic (bool): Compare on what the routes do, see semantic_diff
+        ignore (iterable): With semantic, fields not to compare
+
+    Returns:
+        dict: "hosts" with a report per host and "totals" summed across the fleet
+    """
+
+    hosts = host_directories(routes_dir)
+    reports = []
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(compare_host, str(host), migrated, details, semantic, tuple(ignore)) for host in hosts]
+
+        for future in futures:
+            reports.append(future.result())
+
+    totals = {"hosts": len(reports), "failed": 0, "added": 0, "removed": 0, "changed": 0, "unchanged": 0}
+    if semantic:
+        totals["covered"] = 0
+
+    for report in reports:
+        if "error" in report:
+            totals["failed"] += 1
+            logging.error(f"Could not compare {report['host']}: {report['error']}")
+            continue
+        for field in report["summary"]:
+            totals[field] += report["summary"][field]
+
+    logging.info(f"Fleet diff summary: {totals}")
+
+    return {"totals": totals, "hosts": reports}
+
+
+def format_summary(result: dict):
+    """
+    format_summary A plain text table of per-host counts for the console
+
+    Returns:
+        str: The table
+    """
+
+    # The covered column is only there for a semantic diff
+    fields = [field for field in ("added", "removed", "changed", "covered") if field in result["totals"]]
+
+    lines = [f"{'host':<30} {'compared':<16} " + " ".join(f"{field:>8}" for field in fields)]
+
+    for report in result["hosts"]:
+        if "error" in report:
+            lines.append(f"{report['host']:<30} {'error: ' + report['error']}")
+            continue
+        summary = report["summary"]
+        lines.append(f"{report['host']:<30} {report['migrated']:<16} " + " ".join(f"{summary[field]:>8}" for field in fields))
+
+    totals = result["totals"]
+    lines.append(f"{'total (' + str(totals['hosts']) + ' hosts)':<30} {'':<16} " + " ".join(f"{totals[field]:>8}" for field in fields))
+
+    return "\n".join(lines)
+
+
+def write_report(result: dict, path):
+    """
+    write_report Saves the fleet diff (or the timeline reports) as JSON for other tooling to pick up
+    """
+
+    with open(path, "w") as file:
+        json.dump(result, file, indent=2)
+
+    logging.info(f"Wrote fleet diff report to {path}")
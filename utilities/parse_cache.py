@@ -0,0 +1,184 @@
+import collections
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import threading
+
+from ntc_templates.parse import parse_output
+
+from helpers.logs import logging
+
+"""
+    A content addressed cache for parse_output results.  TextFSM parsing of a large Nexus table is a
+    noticeable share of the CPU spent per device and, during a change window, most devices return exactly
+    the same output run after run.  The cache key is a hash of the platform, command and raw output so a
+    hit is only possible when the text is byte for byte identical
+"""
+
+
+class ParseCache():
+    """
+    ParseCache Stores parsed command output on disk under routes/.parse_cache, one gzip compressed JSON
+    file per entry.  Entries are evicted least recently used first once the cache holds more than
+    max_entries files or max_bytes on disk.  Safe to share between the collector's worker threads
+
+        Methods:
+
+            parse - Drop in replacement for parse_output that consults the cache first
+
+            get - Returns a cached result or None
+
+            put - Stores a result
+
+            summary - Logs and returns the hit/miss counters
+    """
+
+    def __init__(self, directory=None, max_entries: int = 2000, max_bytes: int = 512 * 1024 * 1024):
+        """
+        Args:
+            directory (str|Path): Where the cache lives.  Defaults to routes/.parse_cache in the working directory
+            max_entries (int): The most results kept
+            max_bytes (int): The most disk space used by the cache
+        """
+
+        self.directory = pathlib.Path(directory) if directory else pathlib.Path.cwd() / "routes" / ".parse_cache"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._entries = self._load_index()
+        self._bytes = sum(self._entries.values())
+
+    @staticmethod
+    def key(platform: str, command: str, data: str):
+        """
+        key The cache key for a piece of command output
+
+        Returns:
+            str: sha256 hex digest of platform, command and output
+        """
+
+        digest = hashlib.sha256()
+        for part in (platform, command, data):
+            digest.update(part.encode("utf-8", "surrogateescape"))
+            digest.update(b"\0")
+
+        return digest.hexdigest()
+
+    def parse(self, platform: str, command: str, data: str):
+        """
+        parse Same arguments and result as ntc_templates parse_output, but returns the stored result when
+        this exact output has been parsed before
+        """
+
+        key = self.key(platform, command, data)
+        parsed = self.get(key)
+
+        if parsed is None:
+            parsed = parse_output(platform=platform, command=command, data=data)
+            self.put(key, parsed)
+
+        return parsed
+
+    def get(self, key: str):
+
+        path = self._path(key)
+
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+
+        try:
+            with gzip.open(path, "rt") as file:
+                parsed = json.load(file)
+        except (OSError, ValueError):
+            # Removed or corrupted behind our back, treat it as a miss and let it be stored again
+            with self._lock:
+                self._bytes -= self._entries.pop(key, 0)
+                self.misses += 1
+            return None
+
+        # Keep the file times current so the LRU order survives a restart
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        with self._lock:
+            self.hits += 1
+
+        return parsed
+
+    def put(self, key: str, parsed: list):
+
+        path = self._path(key)
+        temp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+
+        try:
+            with gzip.open(temp_path, "wt", compresslevel=1) as file:
+                json.dump(parsed, file, separators=(",", ":"))
+            os.replace(temp_path, path)
+            size = path.stat().st_size
+        except OSError as e:
+            logging.error(f"Unable to write parse cache entry {path.name}: {e}")
+            return
+
+        with self._lock:
+            self._bytes += size - self._entries.get(key, 0)
+            self._entries[key] = size
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def summary(self):
+        """
+        summary Logs the cache counters for the run
+
+        Returns:
+            dict: hits, misses, evictions, entries and bytes on disk
+        """
+
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+        logging.info(f"Parse cache summary: {stats}")
+        return stats
+
+    def _path(self, key: str):
+        return self.directory / f"{key}.json.gz"
+
+    def _load_index(self):
+        # Oldest first, so the front of the ordered dict is always the next thing to evict
+        entries = []
+        for path in self.directory.glob("*.json.gz"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.name[:-len(".json.gz")], stat.st_size))
+
+        return collections.OrderedDict((key, size) for _, key, size in sorted(entries))
+
+    def _evict(self):
+        # Called with the lock held
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
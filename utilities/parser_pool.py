@@ -0,0 +1,177 @@
+import concurrent.futures
+import os
+import queue
+import threading
+import time
+
+from ntc_templates.parse import parse_output
+
+from helpers.logs import logging
+from helpers.metrics import metrics
+from utilities.collector import DeviceResult
+
+"""
+    The parsing stage.  The collector's threads spend their time waiting on SSH, while TextFSM parsing is
+    pure CPU and, run in the main interpreter, is serialised on one core by the GIL.  Handing the raw
+    output to a process pool lets parsing use every core on the jump host and carry on while the
+    collector is still waiting on slower devices
+"""
+
+
+def _parse(platform: str, command: str, data: str):
+    # Runs in the worker processes.  Module level so it can be pickled.  The time is measured here and
+    # sent back with the result since metrics recorded in a worker process would never reach the parent
+    start = time.perf_counter()
+    parsed = parse_output(platform=platform, command=command, data=data)
+    return parsed, time.perf_counter() - start
+
+
+# Marks the end of the collector's results on the output queue
+_DONE = object()
+
+
+class ParserPool():
+    """
+    ParserPool Parses DeviceResults from the collector in a pool of worker processes
+
+    Use as a context manager so the worker processes are shut down:
+
+        with ParserPool() as parser_pool:
+            for result in parser_pool.parse_results(collector.collect(devices, command)):
+                ...
+
+        Methods:
+
+            parse_results - Parses results as they arrive and yields them as parsing finishes
+
+            close - Shuts down the worker processes
+    """
+
+    def __init__(self, max_workers: int = None, cache=None):
+        """
+        Args:
+            max_workers (int): Worker processes.  Defaults to the number of CPUs
+            cache (ParseCache): Checked before output is sent to a worker and updated with every new result
+        """
+
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.cache = cache
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def parse_results(self, results):
+        """
+        parse_results Feeds results to the pool from a background thread while yielding parsed results
+        as they complete, so collection and parsing overlap.  Results that failed collection, were
+        already parsed or were streamed straight to a snapshot are passed straight through
+
+        Args:
+            results (iterable): DeviceResults, typically DeviceCollector.collect(..., parser=None)
+
+        If the caller stops reading early, or raises, the feeder stops taking results once the one it is
+        waiting on arrives, closes the results generator (so the collector cancels whatever it has not
+        started) and cancels the parses still queued
+
+        Yields:
+            DeviceResult: With parsed_output filled in, or an error status if parsing failed
+        """
+
+        output = queue.Queue()
+        stop = threading.Event()
+        feeder = threading.Thread(target=self._feed, args=(results, output, stop), daemon=True)
+        feeder.start()
+
+        expected = None
+        received = 0
+
+        try:
+            while expected is None or received < expected:
+                item = output.get()
+
+                if isinstance(item, tuple) and item[0] is _DONE:
+                    expected = item[1]
+                    continue
+
+                received += 1
+                yield item
+
+        finally:
+            stop.set()
+
+        feeder.join()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _feed(self, results, output: queue.Queue, stop: threading.Event):
+        # Runs in the feeder thread.  Every result produces exactly one item on the queue, either straight
+        # away or from a future's callback, and the total is sent last so the consumer knows when to stop
+        count = 0
+        futures = []
+
+        try:
+            for result in results:
+
+                if stop.is_set():
+                    break
+
+                if not result.ok or result.parsed_output is not None or result.snapshot is not None:
+                    output.put(result)
+                    count += 1
+                    continue
+
+                key = None
+                if self.cache is not None:
+                    key = self.cache.key(result.device_type, result.command, result.raw_output)
+                    parsed = self.cache.get(key)
+                    if parsed is not None:
+                        metrics.add(result.host, "parse_cache_hits")
+                        result.parsed_output = parsed
+                        output.put(result)
+                        count += 1
+                        continue
+
+                future = self._executor.submit(_parse, result.device_type, result.command, result.raw_output)
+                futures.append(future)
+                future.add_done_callback(lambda future, result=result, key=key: output.put(self._finish(result, future, key)))
+                count += 1
+
+        except Exception as e:
+            logging.error(f"Parsing stage stopped early with error message: {e}")
+
+        finally:
+            if stop.is_set():
+                # Nobody is reading any more.  Closing the generator runs the collector's cleanup, which
+                # cancels the devices not yet started, and parses not yet running are dropped
+                close = getattr(results, "close", None)
+                if close is not None:
+                    close()
+                for future in futures:
+                    future.cancel()
+
+            output.put((_DONE, count))
+
+    def _finish(self, result: DeviceResult, future: concurrent.futures.Future, key: str):
+
+        if future.cancelled():
+            # Dropped because the caller stopped reading, there is no one to report it to
+            return result
+
+        try:
+            result.parsed_output, seconds = future.result()
+            metrics.record(result.host, "parse", seconds)
+        except Exception as e:
+            logging.error(f"Parsing output from {result.host} failed with error message: {e}")
+            result.status = DeviceResult.ERROR
+            result.error = f"parse failed: {e}"
+            return result
+
+        if key is not None:
+            self.cache.put(key, result.parsed_output)
+
+        return result
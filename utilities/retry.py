@@ -0,0 +1,281 @@
+import json
+import os
+import pathlib
+import threading
+import time
+
+from tenacity import Retrying, retry_if_result, stop_after_attempt, wait_random_exponential
+
+from helpers.logs import logging
+from helpers.metrics import metrics
+from utilities.collector import DeviceResult
+
+"""
+    Retries for flaky devices.  Failures are retried at two levels:
+
+        in the worker       a device that times out or errors is tried again straight away, after an
+                            exponential backoff with jitter, up to a few attempts
+        at the end          whatever still failed once the rest of the fleet is done is put through the
+                            collector again, so a full collection completes in one pass without polling
+                            the healthy devices a second time
+
+    Each device's timeout follows its observed latency: a device that normally answers in 5 seconds is
+    given up on well before the default, and one that takes 80 seconds to return a large table gets
+    longer than the default rather than timing out on every run
+"""
+
+# Statuses worth trying again.  A rejected password or enable secret will not fix itself and retrying
+# it only risks locking the account
+RETRYABLE = (DeviceResult.TIMEOUT, DeviceResult.ERROR)
+
+
+class LatencyTracker():
+    """
+    LatencyTracker Keeps a moving average of how long each device takes and derives its timeout from it.
+    Saved between runs so the first round of a new run already has the timeouts of the last one
+
+        Methods:
+
+            observe - Records how long a successful collection took
+
+            timeout_for - The timeout to use for a device
+
+            save - Writes the averages to disk
+    """
+
+    def __init__(self, path=None, alpha: float = 0.3, factor: float = 3.0, min_timeout: float = 10,
+                 max_timeout: float = 300):
+        """
+        Args:
+            path (str|Path): Where the averages are kept between runs.  None keeps them in memory only
+            alpha (float): Weight of the newest sample in the moving average
+            factor (float): The timeout is this many times the average latency
+            min_timeout (float): Never time out sooner than this
+            max_timeout (float): Never wait longer than this
+        """
+
+        self.path = pathlib.Path(path) if path else None
+        self.alpha = alpha
+        self.factor = factor
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+
+        self._lock = threading.Lock()
+        self._latency = self._load()
+
+    def observe(self, host: str, seconds: float):
+        with self._lock:
+            previous = self._latency.get(host)
+            self._latency[host] = seconds if previous is None else self.alpha * seconds + (1 - self.alpha) * previous
+
+    def timeout_for(self, host: str, default: float):
+        """
+        timeout_for The device's average latency times factor, kept between min_timeout and max_timeout.
+        Devices not seen before get the default
+        """
+
+        with self._lock:
+            latency = self._latency.get(host)
+
+        if latency is None:
+            return default
+
+        return min(self.max_timeout, max(self.min_timeout, latency * self.factor))
+
+    def save(self):
+        if self.path is None:
+            return
+
+        with self._lock:
+            data = json.dumps({host: round(latency, 3) for host, latency in self._latency.items()})
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(temp_path, "w") as file:
+            file.write(data)
+        os.replace(temp_path, self.path)
+
+    def _load(self):
+        if self.path is None:
+            return {}
+
+        try:
+            with open(self.path, "r") as file:
+                return {host: float(latency) for host, latency in json.load(file).items()}
+        except FileNotFoundError:
+            return {}
+        except (ValueError, AttributeError):
+            logging.error(f"{self.path} could not be read, starting with the default timeouts")
+            return {}
+
+
+class RetryScheduler():
+    """
+    RetryScheduler Wraps a collector worker with retries and adaptive timeouts and re-queues whatever
+    still failed at the end of the run
+
+        scheduler = RetryScheduler(tracker=LatencyTracker("routes/.latency.json"))
+        for result in scheduler.collect(collector, devices, command, worker=collect_device):
+            ...
+
+        Methods:
+
+            wrap - A worker that retries the given worker
+
+            collect - Runs the collector, then re-queues the failures
+
+            summary - Logs how many devices needed retries
+    """
+
+    def __init__(self, attempts: int = 3, requeue_passes: int = 1, backoff: float = 1, max_backoff: float = 30,
+                 tracker: LatencyTracker = None, retry_on=RETRYABLE):
+        """
+        Args:
+            attempts (int): Tries per device within a pass, the first included
+            requeue_passes (int): How many times the failures are run through the collector again at the
+            end of the run
+            backoff (float): Base of the exponential backoff in seconds.  The wait is random between 0 and
+            backoff * 2 ** attempt so devices that failed together do not all retry together
+            max_backoff (float): Longest wait between attempts
+            tracker (LatencyTracker): Adapts each device's timeout.  None uses the collector's timeout
+            retry_on (tuple): DeviceResult statuses to retry
+        """
+
+        self.attempts = attempts
+        self.requeue_passes = requeue_passes
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.tracker = tracker
+        self.retry_on = tuple(retry_on)
+
+        self.results = []
+        self.requeued = {}
+
+    def wrap(self, worker):
+        """
+        wrap Builds a worker with the same signature as collect_device that retries the given one
+
+        Returns:
+            callable: The retrying worker
+        """
+
+        def retrying_worker(host: str, device_type: str, command: str, timeout: float = 60, parser=None, profile: str = None):
+
+            timeout = self.tracker.timeout_for(host, timeout) if self.tracker else timeout
+            max_timeout = self.tracker.max_timeout if self.tracker else timeout * 3
+            attempt_timeout = timeout
+
+            def attempt():
+                return worker(host, device_type, command, attempt_timeout, parser, profile)
+
+            def before_sleep(retry_state):
+                nonlocal attempt_timeout
+                result = retry_state.outcome.result()
+
+                # A device that timed out is given longer on the next attempt
+                if result.status == DeviceResult.TIMEOUT:
+                    attempt_timeout = min(attempt_timeout * 1.5, max_timeout)
+
+                metrics.add(host, "retries")
+                logging.info(f"Retrying {host} after {result.status} (attempt {retry_state.attempt_number} of "
+                             f"{self.attempts}) in {retry_state.next_action.sleep:.1f} seconds")
+
+            retrying = Retrying(
+                stop=stop_after_attempt(self.attempts),
+                wait=wait_random_exponential(multiplier=self.backoff, max=self.max_backoff),
+                retry=retry_if_result(lambda result: result.status in self.retry_on),
+                before_sleep=before_sleep,
+                # Once out of attempts, hand back the last failed result rather than raising RetryError
+                retry_error_callback=lambda retry_state: retry_state.outcome.result(),
+            )
+
+            result = retrying(attempt)
+            result.attempts = retrying.statistics.get("attempt_number", 1)
+
+            if result.ok and self.tracker:
+                self.tracker.observe(host, result.elapsed)
+
+            return result
+
+        return retrying_worker
+
+    def collect(self, collector, devices, command: str, worker):
+        """
+        collect Runs every device through the collector with the retrying worker, yielding results as they
+        finish.  Devices that still failed with a retryable status are held back and run through the
+        collector again once the rest are done, and only their final result is yielded
+
+        Args:
+            collector (DeviceCollector): Runs the workers
+            devices (iterable): (host, device_type) pairs.  Read as the collector gets to them, only the
+            failed ones are kept for the next pass
+            command (str): The command to run
+            worker (callable): The worker to retry, e.g. collect_device or SessionPool.collect
+
+        Yields:
+            DeviceResult: One per device
+        """
+
+        self.results = []
+        self.requeued = {}
+
+        retrying_worker = self.wrap(worker)
+        pending = devices
+        devices_by_host = {}
+
+        def track(devices):
+            # Remembers each device as the collector takes it, so a failed one can be queued again
+            for device in devices:
+                devices_by_host[device[0]] = device
+                yield device
+
+        for requeue in range(self.requeue_passes + 1):
+            if requeue:
+                # Give the failed devices a moment before going back to them
+                wait = min(self.max_backoff, self.backoff * 2 ** requeue)
+                logging.info(f"Re-queueing {len(pending)} failed devices in {wait:.0f} seconds (pass {requeue} of {self.requeue_passes})")
+                time.sleep(wait)
+
+            failed = []
+
+            for result in collector.collect(track(pending), command, worker=retrying_worker):
+                device = devices_by_host.pop(result.host)
+
+                if result.status in self.retry_on and requeue < self.requeue_passes:
+                    failed.append(device)
+                    continue
+
+                if requeue:
+                    self.requeued[result.host] = result.status
+                self.results.append(result)
+                yield result
+
+            pending = failed
+            if not pending:
+                break
+
+        if self.tracker:
+            self.tracker.save()
+
+    def summary(self):
+        """
+        summary Logs the outcome of the whole run, re-queued devices included
+
+        Returns:
+            dict: Number of devices per status
+        """
+
+        counts = {}
+        for result in self.results:
+            counts[result.status] = counts.get(result.status, 0) + 1
+
+        retried = [result for result in self.results if result.attempts > 1]
+
+        logging.info(f"Run summary after retries: {counts}.  {len(retried)} devices needed more than one attempt, "
+                     f"{len(self.requeued)} were re-queued at the end of the run")
+
+        for result in self.results:
+            if not result.ok:
+                logging.info(f"\t {result.host} ({result.device_type}): {result.status} - {result.error}")
+
+        return counts
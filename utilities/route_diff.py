@@ -0,0 +1,464 @@
+import functools
+import re
+
+from utilities.route_table import parse_prefix
+
+"""
+    Hash-indexed comparison of two routing tables.  Routes are keyed on (vrf, network, mask) so both
+    tables can be indexed once and compared in linear time instead of scanning one list for every
+    entry in the other.
+
+    semantic_diff compares what the routes do rather than how they are written: interface names are
+    canonicalised, chosen fields can be ignored and a prefix that disappeared but is still reached the
+    same way through a new summary route is reported as covered rather than missing
+"""
+
+# The attributes that, when they differ between two tables for the same prefix, mark a route as changed
+COMPARED_FIELDS = ("protocol", "distance", "metric", "nexthops")
+
+
+def route_key(route: dict):
+    """
+    route_key Builds the key a route is indexed on.  IOS output has no vrf column so those routes
+    land in the "default" vrf, the same as Nexus reports for the global table
+
+    Args:
+        route (dict): A single route as returned by NTC templates parse_output or read back from a CSV
+
+    Returns:
+        tuple: (vrf, network, mask)
+    """
+
+    return (route.get("vrf") or "default", route.get("network", ""), str(route.get("mask", "")))
+
+
+def index_routes(routes):
+    """
+    index_routes Folds a list of routes into a dictionary keyed on route_key.  NTC templates emit one
+    row per next hop, so ECMP routes arrive as several rows for the same prefix.  Those rows are merged
+    here into a single entry with a set of (nexthop_ip, nexthop_if) pairs
+
+    Args:
+        routes (iterable): Routes as returned by NTC templates parse_output
+
+    Returns:
+        dict: route_key -> {"protocol", "distance", "metric", "nexthops"}
+    """
+
+    index = {}
+
+    for route in routes:
+        key = route_key(route)
+        nexthop = (route.get("nexthop_ip", ""), route.get("nexthop_if", ""))
+
+        entry = index.get(key)
+        if entry is None:
+            index[key] = {
+                "protocol": route.get("protocol", ""),
+                "distance": str(route.get("distance", "")),
+                "metric": str(route.get("metric", "")),
+                "nexthops": {nexthop},
+            }
+        else:
+            entry["nexthops"].add(nexthop)
+
+    for entry in index.values():
+        entry["nexthops"] = frozenset(entry["nexthops"])
+
+    return index
+
+
+class RouteDiff():
+    """
+    RouteDiff The result of comparing an original routing table with a migrated one
+
+    Attributes:
+        added (dict): route_key -> entry for prefixes only in the migrated table
+        removed (dict): route_key -> entry for prefixes only in the original table
+        changed (dict): route_key -> (original entry, migrated entry) for prefixes in both tables
+        whose protocol, distance, metric or next hops differ
+        unchanged (int): Number of prefixes identical in both tables
+    """
+
+    def __init__(self, added: dict, removed: dict, changed: dict, unchanged: int):
+
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.unchanged = unchanged
+
+    def __bool__(self):
+        # True when there is any difference at all, so "if diff:" reads naturally
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self):
+        return (f"RouteDiff(added={len(self.added)}, removed={len(self.removed)}, "
+                f"changed={len(self.changed)}, unchanged={self.unchanged})")
+
+    def summary(self):
+        """
+        summary Counts of each kind of difference
+
+        Returns:
+            dict: added, removed, changed and unchanged counts
+        """
+
+        return {
+            "added": len(self.added),
+            "removed": len(self.removed),
+            "changed": len(self.changed),
+            "unchanged": self.unchanged,
+        }
+
+    def changed_fields(self, key):
+        """
+        changed_fields Lists which of the compared attributes differ for a changed prefix
+
+        Args:
+            key (tuple): A route_key present in changed
+
+        Returns:
+            list: Names of the attributes that differ
+        """
+
+        before, after = self.changed[key]
+        return [field for field in COMPARED_FIELDS if before[field] != after[field]]
+
+    def to_dict(self):
+        """
+        to_dict A JSON friendly version of the diff, for reports and for anything calling the diff
+        engine from outside Python
+
+        Returns:
+            dict: summary plus lists of added, removed and changed routes
+        """
+
+        def describe(key, entry):
+            vrf, network, mask = key
+            return {
+                "vrf": vrf,
+                "network": network,
+                "mask": mask,
+                "protocol": entry["protocol"],
+                "distance": entry["distance"],
+                "metric": entry["metric"],
+                "nexthops": sorted([list(nexthop) for nexthop in entry["nexthops"]]),
+            }
+
+        return {
+            "summary": self.summary(),
+            "added": [describe(key, entry) for key, entry in sorted(self.added.items())],
+            "removed": [describe(key, entry) for key, entry in sorted(self.removed.items())],
+            "changed": [
+                {
+                    "before": describe(key, before),
+                    "after": describe(key, after),
+                    "fields": self.changed_fields(key),
+                }
+                for key, (before, after) in sorted(self.changed.items())
+            ],
+        }
+
+
+def diff_indexes(original: dict, migrated: dict):
+    """
+    diff_indexes Compares two indexes built with index_routes.  Each index is walked once and every
+    lookup is a hash lookup, so the cost is linear in the size of the two tables
+
+    Args:
+        original (dict): Index of the pre-migration table
+        migrated (dict): Index of the post-migration table
+
+    Returns:
+        RouteDiff: The differences between the two tables
+    """
+
+    added = {}
+    removed = {}
+    changed = {}
+    unchanged = 0
+
+    for key, entry in original.items():
+        other = migrated.get(key)
+        if other is None:
+            removed[key] = entry
+        elif entry != other:
+            changed[key] = (entry, other)
+        else:
+            unchanged += 1
+
+    for key, entry in migrated.items():
+        if key not in original:
+            added[key] = entry
+
+    return RouteDiff(added, removed, changed, unchanged)
+
+
+def diff_routes(original, migrated):
+    """
+    diff_routes Compares two routing tables as returned by NTC templates parse_output
+
+    Args:
+        original (iterable): The pre-migration routes
+        migrated (iterable): The post-migration routes
+
+    Returns:
+        RouteDiff: The differences between the two tables
+    """
+
+    return diff_indexes(index_routes(original), index_routes(migrated))
+
+
+# Fields semantic_diff can be told to ignore.  Ignoring nexthop_if compares next hops on their address
+# alone, which hides interface renames
+IGNORABLE_FIELDS = ("protocol", "distance", "metric", "nexthop_if")
+
+# Long interface names and the short form they are compared as, so Ethernet1/1 and Eth1/1 are the same.
+# IOS XR spells the faster Ethernet types HundredGigE, FortyGigE and TenGigE
+_INTERFACE_NAMES = (
+    ("hundredgigabitethernet", "hu"),
+    ("hundredgige", "hu"),
+    ("fortygigabitethernet", "fo"),
+    ("fortygige", "fo"),
+    ("tengigabitethernet", "te"),
+    ("tengige", "te"),
+    ("gigabitethernet", "gi"),
+    ("fastethernet", "fa"),
+    ("ethernet", "eth"),
+    ("port-channel", "po"),
+    ("loopback", "lo"),
+    ("tunnel", "tu"),
+    ("vlan", "vlan"),
+)
+
+# The shortest abbreviation accepted for a type.  Vl is Vlan even though the canonical form is longer
+_MIN_ABBREVIATION = 2
+
+_INTERFACE_PATTERN = re.compile(r"^([a-z-]+)\s*(.*)$")
+
+
+# A table has thousands of routes but only a handful of interfaces, so each name is worked out once
+@functools.lru_cache(maxsize=4096)
+def canonical_interface(name: str):
+    """
+    canonical_interface Lower cases an interface name and shortens its type, Ethernet1/1 -> eth1/1,
+    GigabitEthernet0/0 -> gi0/0.  Abbreviations (Eth, Gi, Po, ...) map to the same form.  The examples
+    are checked with python -m doctest -v utilities/route_diff.py
+
+        >>> canonical_interface("HundredGigE0/0/0/0") == canonical_interface("HundredGigabitEthernet0/0/0/0") == "hu0/0/0/0"
+        True
+        >>> canonical_interface("TenGigE0/0/0/1") == canonical_interface("Te0/0/0/1") == "te0/0/0/1"
+        True
+        >>> canonical_interface("Vl10") == canonical_interface("Vlan10") == "vlan10"
+        True
+        >>> canonical_interface("Ethernet1/1") == canonical_interface("Eth1/1") == "eth1/1"
+        True
+        >>> canonical_interface("Tunnel5"), canonical_interface("Port-channel1"), canonical_interface("Null0")
+        ('tu5', 'po1', 'null0')
+
+    Returns:
+        str: The canonical name
+    """
+
+    match = _INTERFACE_PATTERN.match(name.strip().lower())
+    if not match:
+        return name.strip().lower()
+
+    kind, number = match.groups()
+
+    for long_name, short_name in _INTERFACE_NAMES:
+        if long_name.startswith(kind) and len(kind) >= min(len(short_name), _MIN_ABBREVIATION) or kind == long_name:
+            return short_name + number
+
+    return kind + number
+
+
+def entry_normalizer(ignore=(), interface_map=None):
+    """
+    entry_normalizer Builds the function that puts an index_routes entry into the form semantic_diff
+    compares.  Ignored fields are blanked, interface names are canonicalised (after applying
+    interface_map) and ECMP next hops stay a set so their order never matters.  Most routes share a
+    few next hop sets, so each set is normalised once and reused
+
+    Args:
+        ignore (iterable): Names from IGNORABLE_FIELDS
+        interface_map (dict): Known renames, old interface name -> new, applied before comparing
+
+    Returns:
+        callable: entry -> normalised entry
+    """
+
+    interface_map = interface_map or {}
+    blanked = [field for field in ("protocol", "distance", "metric") if field in ignore]
+    drop_interface = "nexthop_if" in ignore
+    nexthop_cache = {}
+
+    def normalize_nexthops(nexthops):
+        if drop_interface:
+            return frozenset((nexthop_ip, "") for nexthop_ip, _ in nexthops)
+        return frozenset(
+            (nexthop_ip, canonical_interface(interface_map.get(nexthop_if, nexthop_if)) if nexthop_if else "")
+            for nexthop_ip, nexthop_if in nexthops
+        )
+
+    def normalize(entry: dict):
+        nexthops = nexthop_cache.get(entry["nexthops"])
+        if nexthops is None:
+            nexthops = nexthop_cache[entry["nexthops"]] = normalize_nexthops(entry["nexthops"])
+
+        normalized = dict(entry, nexthops=nexthops)
+        for field in blanked:
+            normalized[field] = ""
+        return normalized
+
+    return normalize
+
+
+class SemanticDiff(RouteDiff):
+    """
+    SemanticDiff A RouteDiff where prefixes that are gone but still reached through a summary route
+    with the same next hops are moved out of removed and into covered
+
+    Attributes:
+        covered (dict): route_key -> (the covering route_key, its entry)
+        ignored (tuple): The fields that were not compared
+    """
+
+    def __init__(self, added: dict, removed: dict, changed: dict, unchanged: int, covered: dict, ignored=()):
+
+        super().__init__(added, removed, changed, unchanged)
+        self.covered = covered
+        self.ignored = tuple(ignored)
+
+    def __repr__(self):
+        return (f"SemanticDiff(added={len(self.added)}, removed={len(self.removed)}, changed={len(self.changed)}, "
+                f"covered={len(self.covered)}, unchanged={self.unchanged})")
+
+    def summary(self):
+        summary = super().summary()
+        summary["covered"] = len(self.covered)
+        return summary
+
+    def to_dict(self):
+
+        data = super().to_dict()
+        data["ignored"] = list(self.ignored)
+        data["covered"] = [
+            {"vrf": vrf, "network": network, "mask": mask, "covered_by": f"{supernet[1]}/{supernet[2]}"}
+            for (vrf, network, mask), (supernet, _) in sorted(self.covered.items())
+        ]
+
+        return data
+
+
+def _prefix_ranges(keys):
+    # route_key -> (vrf, first address, prefix length, last address, key).  Keys that are not valid
+    # prefixes are left out and so can never be covered or cover anything
+    ranges = []
+
+    for key in keys:
+        vrf, network, mask = key
+        try:
+            start, prefixlen = parse_prefix(network, mask)
+        except (ValueError, OSError):
+            continue
+        ranges.append((vrf, start, prefixlen, start | (0xFFFFFFFF >> prefixlen), key))
+
+    return ranges
+
+
+def find_covered(removed: dict, migrated: dict, allow_default: bool = False):
+    """
+    find_covered Finds the removed prefixes that a less specific route in the migrated table still
+    covers with the same next hops.  Both sets of prefixes are turned into integer ranges and sorted by
+    vrf, first address and prefix length, then swept once.  Prefixes either nest or do not overlap at
+    all, so during the sweep a stack holds exactly the migrated routes that contain the current
+    address, innermost on top, and each removed prefix only has to look at that stack
+
+    Args:
+        removed (dict): route_key -> normalised entry of the prefixes that disappeared
+        migrated (dict): route_key -> normalised entry of the whole migrated table
+        allow_default (bool): Let the default route count as a summary.  Off by default since it
+        would cover everything
+
+    Returns:
+        dict: Covered route_key -> (covering route_key, its entry)
+    """
+
+    if not removed:
+        return {}
+
+    # The flag sorts migrated routes before removed ones that start at the same address with the same
+    # length, which cannot happen for real (the key would not have been removed) but keeps the order total
+    events = [(vrf, start, prefixlen, 0, end, key) for vrf, start, prefixlen, end, key in _prefix_ranges(migrated)]
+    events += [(vrf, start, prefixlen, 1, end, key) for vrf, start, prefixlen, end, key in _prefix_ranges(removed)]
+    events.sort()
+
+    covered = {}
+    stack = []
+    current_vrf = None
+
+    for vrf, start, prefixlen, is_removed, end, key in events:
+        if vrf != current_vrf:
+            stack = []
+            current_vrf = vrf
+
+        while stack and stack[-1][0] < start:
+            stack.pop()
+
+        if not is_removed:
+            if prefixlen or allow_default:
+                stack.append((end, key))
+            continue
+
+        nexthops = removed[key]["nexthops"]
+        for _, supernet in reversed(stack):
+            if migrated[supernet]["nexthops"] == nexthops:
+                covered[key] = (supernet, migrated[supernet])
+                break
+
+    return covered
+
+
+def semantic_diff(original, migrated, ignore=(), interface_map=None, aggregation: bool = True,
+                  allow_default: bool = False):
+    """
+    semantic_diff Compares two routing tables on what the routes do.  ECMP next hops are compared as a
+    set, interface names are canonicalised, ignored fields are not compared and, with aggregation, a
+    removed prefix that a remaining summary route reaches through the same next hops is reported as
+    covered rather than removed
+
+    Args:
+        original (iterable): The pre-migration routes
+        migrated (iterable): The post-migration routes
+        ignore (iterable): Fields not to compare, from IGNORABLE_FIELDS
+        interface_map (dict): Known interface renames, old name -> new name
+        aggregation (bool): Check removed prefixes for a covering summary route
+        allow_default (bool): Let the default route count as a covering summary
+
+    Raises:
+        ValueError: If a field to ignore is not one of IGNORABLE_FIELDS
+
+    Returns:
+        SemanticDiff: The differences that matter
+    """
+
+    ignore = tuple(ignore or ())
+    unknown = [field for field in ignore if field not in IGNORABLE_FIELDS]
+    if unknown:
+        raise ValueError(f"Cannot ignore {', '.join(unknown)}, choose from {', '.join(IGNORABLE_FIELDS)}")
+
+    # The renames describe the original table, the migrated one already uses the new names
+    normalize_original = entry_normalizer(ignore, interface_map)
+    normalize_migrated = entry_normalizer(ignore)
+
+    original = {key: normalize_original(entry) for key, entry in index_routes(original).items()}
+    migrated = {key: normalize_migrated(entry) for key, entry in index_routes(migrated).items()}
+
+    diff = diff_indexes(original, migrated)
+    covered = find_covered(diff.removed, migrated, allow_default) if aggregation else {}
+
+    for key in covered:
+        del diff.removed[key]
+
+    return SemanticDiff(diff.added, diff.removed, diff.changed, diff.unchanged, covered, ignore)
@@ -1,12 +1,29 @@
 import pathlib
 import json
-from termios import FF1
 
 from helpers.logs import logging
+from utilities.route_diff import diff_routes, semantic_diff
+from utilities.snapshot_store import SnapshotStore
+from utilities.route_table import RouteTable
 
 
 class ProcessRoutes():
 
+    @staticmethod
+    def build_table(routes: list):
+        """
+        build_table Builds a prefix indexed RouteTable from the list of dictionaries returned
+        by NTC templates parse_output or loaded from a saved JSON file
+
+        Args:
+            routes (list): The routes to index
+
+        Returns:
+            RouteTable: The indexed table
+        """
+
+        return RouteTable.from_parsed(routes)
+
     def save_routes(self, host: str, routes: list):
         """
         save_routes: A function that takes a routing table parsed through NTC 
@@ -22,9 +39,12 @@ class ProcessRoutes():
             host (str): Hostname of the device for which the routing table belongs
 
             routes (list): The list of dictionaries returned from NTC templates
-            parse_output
+            parse_output, or a RouteTable built from them
         """
 
+        if isinstance(routes, RouteTable):
+            routes = routes.to_dicts()
+
         try:
             # Try to get the stats of the file.  If it doesn't exist, it will raise an
             # exception
@@ -56,7 +76,7 @@ class ProcessRoutes():
         #         f.write(json.dumps(routes))
 
 
-    def compare_routes(self, host: str, original_file: str, migrated_file: str):
+    def compare_routes(self, host: str, original_file: str, migrated_file: str, semantic: bool = False, ignore=()):
         """
         compare_routes Compares the pre-migration and post-migration routing tables of a device for the purpose
         of identifying routes that did not come back afte the migration has completed.
@@ -70,14 +90,23 @@ class ProcessRoutes():
             migrated_file (str): The file that contains the routing table post-migration.  A list of dictionaries from
             the NTC template parsing in .json format
 
+            semantic (bool): Compare what the routes do rather than how they are written.  Interface names
+            are canonicalised and prefixes still reached through a summary route are reported as covered,
+            see semantic_diff
+
+            ignore (iterable): With semantic, fields not to compare, e.g. ("metric", "nexthop_if")
+
         Raises:
             FileExistsError: Error raised if either of the files required are not found
+
+        Returns:
+            RouteDiff: The added, removed and changed routes.  None if the files could not be found
         """
         
         try:
             # Clearly the files should exit, but you know what assume does to you
             # For the sake of sanity, let's make sure.  If not, raise an error
-            if not pathlib.Path(original_file).exists() and not pathlib.Path(migrated_file).exists():
+            if not pathlib.Path(original_file).exists() or not pathlib.Path(migrated_file).exists():
                 raise FileExistsError
             else:
                 # The files are present, open and load them for comparison
@@ -85,12 +114,99 @@ class ProcessRoutes():
                     original = json.load(f1)
                     migrated = json.load(f2)
 
-                    # The original file is the master file.  Loop through that file and look for routes
-                    # that are in it that are not in the migrated routes file
-                    for i in original:
-                        if i not in migrated:
-                            # For now, just print out the differences.  Needs work
-                            print(i)
+                # Both tables are indexed on (vrf, network, mask) so the comparison is a hash lookup
+                # per route rather than a scan of the migrated table for every original route
+                if semantic:
+                    diff = semantic_diff(original, migrated, ignore=ignore)
+                else:
+                    diff = diff_routes(original, migrated)
+
+                # The original file is the master file.  Print the routes that are in it but did not
+                # come back after the migration
+                for key, entry in sorted(diff.removed.items()):
+                    vrf, network, mask = key
+                    print(f"{host}: missing {vrf} {network}/{mask} via {sorted(entry['nexthops'])}")
+
+                for key in sorted(diff.changed):
+                    vrf, network, mask = key
+                    print(f"{host}: changed {vrf} {network}/{mask} ({', '.join(diff.changed_fields(key))})")
+
+                for key, (supernet, _) in sorted(getattr(diff, "covered", {}).items()):
+                    vrf, network, mask = key
+                    print(f"{host}: covered {vrf} {network}/{mask} by {supernet[1]}/{supernet[2]}")
+
+                logging.info(f"Compared routes for {host}: {diff.summary()}")
+
+                return diff
                         
         except FileExistsError:
             logging.error(f"{original_file} or {migrated_file} could not be found")
+
+
+    def check_coverage(self, host: str, original_file: str, migrated_file: str):
+        """
+        check_coverage Answers "is every original prefix still covered after the migration?".  A prefix
+        counts as covered if the migrated table has a route for it or for any supernet of it, which is
+        checked with a trie walk per prefix rather than a scan of the migrated table
+
+        Args:
+            host (str): The hostname of the device from which the routes were pulled
+
+            original_file (str): The pre-migration routes in .json format
+
+            migrated_file (str): The post-migration routes in .json format
+
+        Returns:
+            list: The original routes that are no longer covered.  None if the files could not be found
+        """
+
+        try:
+            if not pathlib.Path(original_file).exists() or not pathlib.Path(migrated_file).exists():
+                raise FileExistsError
+
+            with open(original_file, "r") as f1, open(migrated_file, "r") as f2:
+                original = self.build_table(json.load(f1))
+                migrated = self.build_table(json.load(f2))
+
+            uncovered = [route for route in original if not migrated.covers(route.prefix, route.vrf)]
+
+            for route in uncovered:
+                print(f"{host}: no longer covered {route.vrf} {route.prefix}")
+
+            logging.info(f"{host}: {len(uncovered)} of {len(original)} original routes are no longer covered")
+
+            return uncovered
+
+        except FileExistsError:
+            logging.error(f"{original_file} or {migrated_file} could not be found")
+
+    def compare_snapshots(self, host: str, original_id: int = 0, migrated_id: int = -1, root=None):
+        """
+        compare_snapshots Compares two snapshots from a host's snapshot store.  The snapshots are memory
+        mapped binary files so nothing has to be re-parsed to run the comparison
+
+        Args:
+            host (str): The hostname of the device, i.e. its directory under routes/
+
+            original_id (int): The snapshot to treat as the original.  The first snapshot by default
+
+            migrated_id (int): The snapshot to compare against it.  The latest by default
+
+            root (str): The directory holding the host directories.  routes/ by default
+
+        Returns:
+            RouteDiff: The added, removed and changed routes.  None if either snapshot does not exist
+        """
+
+        store = SnapshotStore(host, root)
+
+        try:
+            with store.load(original_id) as original, store.load(migrated_id) as migrated:
+                diff = diff_routes(original.routes(), migrated.routes())
+        except (KeyError, OSError, ValueError) as e:
+            logging.error(f"Unable to load snapshots for {host}: {e}")
+            return None
+
+        logging.info(f"Compared snapshots {original_id} and {migrated_id} for {host}: {diff.summary()}")
+
+        return diff
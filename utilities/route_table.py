@@ -0,0 +1,456 @@
+import socket
+import struct
+import sys
+
+from helpers.logs import logging
+
+"""
+    A compact, prefix indexed routing table.  Routes parsed by NTC templates arrive as dictionaries of
+    strings which are heavy to hold and can only be searched by scanning.  Here every route is a slotted
+    object with the prefix stored as integers and the repetitive strings (protocol, interface, vrf)
+    interned, and each vrf gets a path compressed binary trie so longest-prefix-match and containment
+    questions are answered by walking at most one node per prefix on the way down
+"""
+
+# The fields a Route knows about, in the order they are written out
+ROUTE_FIELDS = ("vrf", "protocol", "type", "network", "mask", "distance", "metric", "nexthop_ip", "nexthop_if")
+
+
+def ip_to_int(address: str):
+    """
+    ip_to_int Converts a dotted quad IPv4 address to an integer
+
+    Args:
+        address (str): e.g. 10.1.2.0
+
+    Returns:
+        int: The address as a 32 bit integer
+    """
+
+    return struct.unpack("!I", socket.inet_aton(address))[0]
+
+
+def int_to_ip(value: int):
+    """
+    int_to_ip Converts a 32 bit integer back to a dotted quad IPv4 address
+
+    Args:
+        value (int): The address as an integer
+
+    Returns:
+        str: e.g. 10.1.2.0
+    """
+
+    return socket.inet_ntoa(struct.pack("!I", value))
+
+
+def mask_to_prefixlen(mask):
+    """
+    mask_to_prefixlen Accepts a mask as a prefix length ("24", 24) or a dotted mask ("255.255.255.0")
+
+    Returns:
+        int: The prefix length
+    """
+
+    mask = str(mask).strip().lstrip("/")
+
+    if "." in mask:
+        return bin(ip_to_int(mask)).count("1")
+
+    prefixlen = int(mask)
+    if not 0 <= prefixlen <= 32:
+        raise ValueError(f"Invalid prefix length: {mask}")
+
+    return prefixlen
+
+
+def parse_prefix(prefix: str, mask=None):
+    """
+    parse_prefix Turns "10.1.2.0/24" (or "10.1.2.0" plus a mask) into an integer network and prefix
+    length.  Host bits are cleared so 10.1.2.5/24 becomes 10.1.2.0/24
+
+    Args:
+        prefix (str): The network, optionally with /prefixlen
+        mask (str): The mask, when not included in prefix.  A bare address is treated as a /32
+
+    Returns:
+        tuple: (network as int, prefix length)
+    """
+
+    if "/" in prefix:
+        prefix, mask = prefix.split("/", 1)
+
+    prefixlen = 32 if mask is None or mask == "" else mask_to_prefixlen(mask)
+    network = ip_to_int(prefix.strip())
+
+    return network & _netmask(prefixlen), prefixlen
+
+
+def _netmask(prefixlen: int):
+    return (0xFFFFFFFF << (32 - prefixlen)) & 0xFFFFFFFF
+
+
+def _to_int(value):
+    # Distance and metric are empty on connected and local routes
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _intern(value):
+    return sys.intern(str(value)) if value else ""
+
+
+class Route():
+    """
+    Route A single route.  The prefix is held as integers and the strings that repeat across a table
+    are interned so thousands of routes share a handful of string objects
+
+    Route can still be read like the dictionaries returned by parse_output (route["network"],
+    route.get("vrf")), so existing code that writes or compares routes keeps working with it
+    """
+
+    __slots__ = ("vrf", "protocol", "type", "network_int", "prefixlen", "distance_int", "metric_int",
+                 "nexthop_ip", "nexthop_if")
+
+    def __init__(self, network_int: int, prefixlen: int, vrf: str = "default", protocol: str = "", type: str = "",
+                 distance: int = None, metric: int = None, nexthop_ip: str = "", nexthop_if: str = ""):
+
+        self.network_int = network_int
+        self.prefixlen = prefixlen
+        self.vrf = _intern(vrf) or "default"
+        self.protocol = _intern(protocol)
+        self.type = _intern(type)
+        self.distance_int = distance
+        self.metric_int = metric
+        self.nexthop_ip = _intern(nexthop_ip)
+        self.nexthop_if = _intern(nexthop_if)
+
+    @classmethod
+    def from_dict(cls, route: dict):
+        """
+        from_dict Builds a Route from a dictionary as returned by parse_output or read from a CSV
+
+        Raises:
+            ValueError: If the network or mask cannot be parsed as IPv4
+        """
+
+        network, prefixlen = parse_prefix(route["network"], route.get("mask"))
+
+        return cls(network, prefixlen, vrf=route.get("vrf") or "default", protocol=route.get("protocol"),
+                   type=route.get("type"), distance=_to_int(route.get("distance")),
+                   metric=_to_int(route.get("metric")), nexthop_ip=route.get("nexthop_ip"),
+                   nexthop_if=route.get("nexthop_if"))
+
+    @property
+    def network(self):
+        return int_to_ip(self.network_int)
+
+    @property
+    def prefix(self):
+        return f"{self.network}/{self.prefixlen}"
+
+    def contains(self, network_int: int, prefixlen: int):
+        """
+        contains True if the given prefix falls inside this route's prefix
+        """
+
+        return prefixlen >= self.prefixlen and (network_int & _netmask(self.prefixlen)) == self.network_int
+
+    def __getitem__(self, field: str):
+
+        getter = _ROUTE_GETTERS.get(field)
+        if getter is None:
+            raise KeyError(field)
+
+        return getter(self)
+
+    def get(self, field: str, default=None):
+        getter = _ROUTE_GETTERS.get(field)
+        return default if getter is None else getter(self)
+
+    def to_dict(self):
+        return {field: self[field] for field in ROUTE_FIELDS}
+
+    def __eq__(self, other):
+        if not isinstance(other, Route):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in Route.__slots__)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, slot) for slot in Route.__slots__))
+
+    def __repr__(self):
+        return f"Route({self.vrf} {self.prefix} {self.protocol} via {self.nexthop_ip or self.nexthop_if})"
+
+
+# How each dictionary style field is read from a Route.  A lookup table rather than a chain of ifs since
+# the snapshot writer reads every field of every route
+_ROUTE_GETTERS = {
+    "vrf": lambda route: route.vrf,
+    "protocol": lambda route: route.protocol,
+    "type": lambda route: route.type,
+    "network": lambda route: int_to_ip(route.network_int),
+    "mask": lambda route: str(route.prefixlen),
+    "distance": lambda route: "" if route.distance_int is None else str(route.distance_int),
+    "metric": lambda route: "" if route.metric_int is None else str(route.metric_int),
+    "nexthop_ip": lambda route: route.nexthop_ip,
+    "nexthop_if": lambda route: route.nexthop_if,
+}
+
+
+class _TrieNode():
+    """
+    _TrieNode One node of a path compressed (Patricia) trie.  A node stands for a whole prefix rather
+    than a single bit, so only the prefixes in the table and the points where two of them branch apart
+    get a node, at most two per prefix however long the prefixes are.  The child followed is picked by
+    the first bit past the node's prefix length
+    """
+
+    __slots__ = ("network", "prefixlen", "zero", "one", "routes")
+
+    def __init__(self, network: int, prefixlen: int, route=None):
+        self.network = network
+        self.prefixlen = prefixlen
+        self.zero = None
+        self.one = None
+        # Most prefixes have a single next hop, so a lone Route is held as is and only ECMP prefixes get a
+        # tuple.  None for a node that only marks a branch point
+        self.routes = route
+
+    def all_routes(self):
+        routes = self.routes
+        if routes is None:
+            return ()
+        return routes if type(routes) is tuple else (routes,)
+
+    def contains(self, network: int, prefixlen: int):
+        return prefixlen >= self.prefixlen and (network & _netmask(self.prefixlen)) == self.network
+
+    def child(self, network: int):
+        # The child on the side of network, by the first bit past this node's prefix
+        return self.one if (network >> (31 - self.prefixlen)) & 1 else self.zero
+
+    def set_child(self, node):
+        if (node.network >> (31 - self.prefixlen)) & 1:
+            self.one = node
+        else:
+            self.zero = node
+
+
+class RouteTable():
+    """
+    RouteTable A routing table indexed by a path compressed binary trie per vrf.  Inserting or looking
+    up a prefix walks at most one node per prefix bit, in practice far fewer, so every query below costs
+    O(prefix length) regardless of table size
+
+        Methods:
+
+            from_parsed - Builds a table from parse_output results
+
+            add - Adds a single Route
+
+            lookup - Longest-prefix-match for an address
+
+            exact - Routes for exactly the given prefix
+
+            covering - Routes whose prefix contains the given prefix
+
+            covers - True if some route contains the given prefix
+
+            subnets - Routes contained within the given prefix
+    """
+
+    def __init__(self, routes=None):
+
+        self._roots = {}
+        self._count = 0
+        # Entries from_parsed could not index, kept so they still reach the CSV snapshot
+        self.skipped = []
+
+        for route in routes or ():
+            self.add(route)
+
+    @classmethod
+    def from_parsed(cls, parsed_output):
+        """
+        from_parsed Builds a table from the list of dictionaries returned by parse_output.  Entries that
+        are not IPv4 routes cannot be indexed.  They are logged by prefix and kept, as they were parsed,
+        in the table's skipped list so whatever writes the table out can write them too
+
+        Args:
+            parsed_output (iterable): Route dictionaries
+
+        Returns:
+            RouteTable: The populated table
+        """
+
+        table = cls()
+
+        for route in parsed_output:
+            try:
+                table.add(route if isinstance(route, Route) else Route.from_dict(route))
+            except (KeyError, ValueError, OSError):
+                table.skipped.append(route)
+
+        if table.skipped:
+            prefixes = ", ".join(f"{route.get('network', '?')}/{route.get('mask', '?')}" for route in table.skipped)
+            logging.warning(f"{len(table.skipped)} entries could not be read as IPv4 routes and are not indexed: {prefixes}")
+
+        return table
+
+    def add(self, route: Route):
+
+        node = self._roots.get(route.vrf)
+        if node is None:
+            node = self._roots[route.vrf] = _TrieNode(0, 0)
+
+        network, prefixlen = route.network_int, route.prefixlen
+        self._count += 1
+
+        # Walk down through the nodes whose prefix contains the route's
+        while node.prefixlen < prefixlen:
+            child = node.child(network)
+
+            if child is None:
+                node.set_child(_TrieNode(network, prefixlen, route))
+                return
+
+            if not child.contains(network, prefixlen):
+                # The route and the child part ways somewhere along the edge between node and child.  The
+                # route's own node goes there if it contains the child, otherwise a branch node does
+                difference = network ^ child.network
+                common = min(32 - difference.bit_length(), prefixlen, child.prefixlen)
+
+                if common == prefixlen:
+                    branch = _TrieNode(network, prefixlen, route)
+                    branch.set_child(child)
+                else:
+                    branch = _TrieNode(network & _netmask(common), common)
+                    branch.set_child(child)
+                    branch.set_child(_TrieNode(network, prefixlen, route))
+
+                node.set_child(branch)
+                return
+
+            node = child
+
+        node.routes = node.all_routes() + (route,) if node.routes is not None else route
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for vrf in sorted(self._roots):
+            yield from self._walk(self._roots[vrf])
+
+    @property
+    def vrfs(self):
+        return sorted(self._roots)
+
+    def to_dicts(self):
+        return [route.to_dict() for route in self]
+
+    def lookup(self, address: str, vrf: str = "default"):
+        """
+        lookup Longest-prefix-match, i.e. the routes the device would use to forward to address
+
+        Args:
+            address (str): An IPv4 address
+            vrf (str): The vrf to look in
+
+        Returns:
+            list: The routes for the most specific matching prefix, empty if nothing matches
+        """
+
+        network, _ = parse_prefix(address)
+        best = []
+
+        for node in self._path(network, 32, vrf):
+            if node.routes is not None:
+                best = node.all_routes()
+
+        return list(best)
+
+    def exact(self, prefix: str, vrf: str = "default"):
+        """
+        exact The routes for exactly the given prefix (one per next hop for ECMP)
+        """
+
+        network, prefixlen = parse_prefix(prefix)
+
+        for node in self._path(network, prefixlen, vrf):
+            if node.prefixlen == prefixlen and node.routes is not None:
+                return list(node.all_routes())
+        return []
+
+    def covering(self, prefix: str, vrf: str = "default"):
+        """
+        covering Every route whose prefix contains the given prefix, least specific first.  Includes
+        routes for the prefix itself
+
+        Args:
+            prefix (str): e.g. 10.1.2.0/24
+            vrf (str): The vrf to look in
+
+        Returns:
+            list: The covering routes
+        """
+
+        network, prefixlen = parse_prefix(prefix)
+        routes = []
+
+        for node in self._path(network, prefixlen, vrf):
+            routes.extend(node.all_routes())
+
+        return routes
+
+    def covers(self, prefix: str, vrf: str = "default"):
+        """
+        covers Answers "is this prefix still reachable through some route in the table?"
+        """
+
+        network, prefixlen = parse_prefix(prefix)
+        return any(node.routes is not None for node in self._path(network, prefixlen, vrf))
+
+    def subnets(self, prefix: str, vrf: str = "default"):
+        """
+        subnets Every route contained within the given prefix, including the prefix itself
+        """
+
+        network, prefixlen = parse_prefix(prefix)
+        node = self._roots.get(vrf)
+
+        # Find the first node at or below the prefix.  Everything under it is inside the prefix
+        while node is not None and node.prefixlen < prefixlen:
+            if not node.contains(network, prefixlen):
+                return []
+            node = node.child(network)
+
+        if node is None or (node.network & _netmask(prefixlen)) != network:
+            return []
+        return list(self._walk(node))
+
+    def _path(self, network: int, prefixlen: int, vrf: str):
+        # Yields each node from the root down whose prefix contains the given one, least specific first
+        node = self._roots.get(vrf)
+
+        while node is not None and node.contains(network, prefixlen):
+            yield node
+            if node.prefixlen == prefixlen:
+                return
+            node = node.child(network)
+
+    def _walk(self, node: _TrieNode):
+        # Depth first, zero branch before one branch, so routes come out in address order
+        stack = [node]
+
+        while stack:
+            node = stack.pop()
+            if node.routes is not None:
+                yield from node.all_routes()
+            if node.one is not None:
+                stack.append(node.one)
+            if node.zero is not None:
+                stack.append(node.zero)
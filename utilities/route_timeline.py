@@ -0,0 +1,444 @@
+import concurrent.futures
+import datetime
+import gzip
+import json
+import os
+import pathlib
+
+from helpers.logs import logging
+from utilities.fleet_diff import ORIGINAL, find_snapshots, host_directories, load_routes
+from utilities.route_diff import diff_indexes, index_routes
+from utilities.snapshot_store import SnapshotStore
+
+"""
+    A per-host timeline of route changes across every snapshot of a change window.  Rather than comparing
+    each snapshot with the original from scratch, consecutive snapshots are diffed once and only the
+    deltas are kept, in routes/<host>/timeline.json.gz:
+
+        snapshot 0 (original_routes)    every route, as "added"
+        snapshot 1 (migrated_001)       what changed since snapshot 0
+        snapshot 2 (migrated_002)       what changed since snapshot 1
+        ...
+
+    When new snapshots appear only those are diffed, against the last state rebuilt from the deltas, so
+    the snapshots already in the timeline are never loaded again.  Loading the timeline indexes the
+    events by prefix, so the history of one prefix is a dictionary lookup
+"""
+
+TIMELINE = "timeline.json.gz"
+# Version 2 added the identity of each snapshot.  Older timelines are rebuilt
+FORMAT_VERSION = 2
+
+ADDED = "added"
+REMOVED = "removed"
+CHANGED = "changed"
+
+
+def snapshot_order(snapshots: dict):
+    """
+    snapshot_order The snapshot names in the order they were taken, the original first
+
+    Args:
+        snapshots (dict): As returned by find_snapshots
+
+    Returns:
+        list: Snapshot names
+    """
+
+    migrated = sorted((name for name in snapshots if name.startswith("migrated_")), key=lambda name: int(name.split("_")[1]))
+    return ([ORIGINAL] if ORIGINAL in snapshots else []) + migrated
+
+
+def snapshot_identities(host_dir: pathlib.Path, snapshots: dict):
+    """
+    snapshot_identities Something that changes whenever a snapshot's content does, so a snapshot re-taken
+    under the same name is noticed.  Binary snapshots use their manifest checksum, CSVs their size and
+    modification time
+
+    Args:
+        host_dir (Path): The host's directory under routes/
+        snapshots (dict): As returned by find_snapshots
+
+    Returns:
+        dict: snapshot name -> identity
+    """
+
+    checksums = {entry["file"]: entry["checksum"] for entry in SnapshotStore(host_dir.name, host_dir.parent).snapshots}
+    identities = {}
+
+    for name, (kind, path) in snapshots.items():
+        if kind == "rts" and path.name in checksums:
+            identities[name] = f"sha256:{checksums[path.name]}"
+        else:
+            stat = path.stat()
+            identities[name] = f"{kind}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    return identities
+
+
+def parse_prefix_query(prefix: str):
+    """
+    parse_prefix_query Reads "10.1.0.0/24" or "VRF:10.1.0.0/24" into the key routes are indexed on
+
+    Returns:
+        tuple: (vrf, network, mask)
+    """
+
+    vrf, _, prefix = prefix.rpartition(":")
+    network, _, mask = prefix.partition("/")
+
+    if not mask:
+        raise ValueError(f"{prefix} is not a prefix, expected network/length")
+
+    return vrf or "default", network, mask
+
+
+def _encode_entry(entry: dict):
+    return [entry["protocol"], entry["distance"], entry["metric"], sorted([list(nexthop) for nexthop in entry["nexthops"]])]
+
+
+def _decode_entry(data: list):
+    protocol, distance, metric, nexthops = data
+    return {"protocol": protocol, "distance": distance, "metric": metric, "nexthops": frozenset(tuple(nexthop) for nexthop in nexthops)}
+
+
+def _encode_key(key: tuple):
+    vrf, network, mask = key
+    return f"{vrf}:{network}/{mask}"
+
+
+class RouteTimeline():
+    """
+    RouteTimeline The change history of one host's routing table
+
+        Methods:
+
+            update - Diffs any snapshots not yet in the timeline and saves it
+
+            history - Every change to one prefix
+
+            status - Whether a prefix is present in the latest snapshot, when it was last removed and how often it flapped
+
+            flapping - Prefixes removed and added back within the window
+
+            state - The routing table as of a snapshot, rebuilt from the deltas
+
+            render - A compact text history for the console
+    """
+
+    def __init__(self, host_dir):
+        """
+        Args:
+            host_dir (str|Path): The host's directory under routes/
+        """
+
+        self.host_dir = pathlib.Path(host_dir)
+        self.host = self.host_dir.name
+        self.path = self.host_dir / TIMELINE
+
+        # One entry per snapshot: {"name", "identity", "timestamp", "added": {key: entry},
+        # "removed": {key: entry}, "changed": {key: (before, after)}}
+        self.snapshots = []
+        self._events = {}
+
+        self._load()
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    @property
+    def names(self):
+        return [snapshot["name"] for snapshot in self.snapshots]
+
+    def update(self):
+        """
+        update Adds the deltas for any snapshot taken since the timeline was last saved.  If the snapshots
+        on disk no longer start with the ones in the timeline (e.g. the original was re-taken) the timeline
+        is rebuilt.  Snapshots are matched on their content identity, see snapshot_identities, not just
+        their names
+
+        Returns:
+            int: The number of snapshots added
+        """
+
+        available = find_snapshots(self.host_dir)
+        order = snapshot_order(available)
+        identities = snapshot_identities(self.host_dir, available)
+
+        known = [(snapshot["name"], snapshot["identity"]) for snapshot in self.snapshots]
+        if [(name, identities[name]) for name in order[:len(known)]] != known:
+            logging.info(f"Snapshots for {self.host} no longer match its timeline, rebuilding it")
+            self.snapshots = []
+
+        pending = order[len(self.snapshots):]
+        if not pending:
+            return 0
+
+        # The newest state the timeline knows about, rebuilt from the deltas instead of loading the
+        # snapshot it came from
+        current = self.state()
+
+        for name in pending:
+            kind, path = available[name]
+            index = index_routes(load_routes(kind, path))
+            diff = diff_indexes(current, index)
+
+            self.snapshots.append({
+                "name": name,
+                "identity": identities[name],
+                "timestamp": datetime.datetime.fromtimestamp(path.stat().st_mtime).isoformat(timespec="seconds"),
+                ADDED: diff.added,
+                REMOVED: diff.removed,
+                CHANGED: diff.changed,
+            })
+            current = index
+
+        self._index_events()
+        self._save()
+
+        logging.info(f"Added {len(pending)} snapshots to the timeline of {self.host}")
+
+        return len(pending)
+
+    def state(self, snapshot: int = -1):
+        """
+        state The routing table as of a snapshot, replayed from the deltas
+
+        Args:
+            snapshot (int): Position in the timeline, the latest by default
+
+        Returns:
+            dict: route_key -> entry, the same shape as index_routes returns
+        """
+
+        if not self.snapshots:
+            return {}
+
+        stop = range(len(self.snapshots))[snapshot] + 1
+        table = {}
+
+        for delta in self.snapshots[:stop]:
+            for key in delta[REMOVED]:
+                del table[key]
+            table.update(delta[ADDED])
+            for key, (_, after) in delta[CHANGED].items():
+                table[key] = after
+
+        return table
+
+    def history(self, prefix: str):
+        """
+        history Every change to a prefix across the timeline
+
+        Args:
+            prefix (str): "10.1.0.0/24" or "VRF:10.1.0.0/24"
+
+        Returns:
+            list: {"snapshot", "timestamp", "event", "fields"} in the order they happened
+        """
+
+        key = parse_prefix_query(prefix)
+        history = []
+
+        for position, event in self._events.get(key, ()):
+            snapshot = self.snapshots[position]
+            record = {"snapshot": snapshot["name"], "timestamp": snapshot["timestamp"], "event": event}
+
+            if event == CHANGED:
+                before, after = snapshot[CHANGED][key]
+                record["fields"] = [field for field in before if before[field] != after[field]]
+
+            history.append(record)
+
+        return history
+
+    def status(self, prefix: str):
+        """
+        status Answers "is it there, when did it disappear and did it flap" for one prefix
+
+        Returns:
+            dict: present, first_seen, last_removed, flaps (times it came back after being removed) and changes
+        """
+
+        history = self.history(prefix)
+        events = [record["event"] for record in history]
+
+        removed = [record["snapshot"] for record in history if record["event"] == REMOVED]
+
+        return {
+            "prefix": prefix,
+            "present": bool(events) and events[-1] != REMOVED,
+            "first_seen": history[0]["snapshot"] if history else None,
+            "last_removed": removed[-1] if removed else None,
+            "flaps": sum(1 for before, after in zip(events, events[1:]) if before == REMOVED and after == ADDED),
+            "changes": events.count(CHANGED),
+        }
+
+    def flapping(self):
+        """
+        flapping Prefixes that were removed and later added back during the window
+
+        Returns:
+            dict: prefix text -> number of times it came back
+        """
+
+        flapping = {}
+
+        for key, events in self._events.items():
+            kinds = [event for _, event in events]
+            flaps = sum(1 for before, after in zip(kinds, kinds[1:]) if before == REMOVED and after == ADDED)
+            if flaps:
+                flapping[_encode_key(key)] = flaps
+
+        return flapping
+
+    def render(self, limit: int = 5):
+        """
+        render A compact change history: one line per snapshot with its counts and the first few
+        prefixes removed, followed by any flapping prefixes
+
+        Args:
+            limit (int): Prefixes listed per snapshot
+
+        Returns:
+            str: The history
+        """
+
+        lines = [f"{self.host}"]
+
+        for position, snapshot in enumerate(self.snapshots):
+            if position == 0:
+                lines.append(f"  {snapshot['name']:<16} {snapshot['timestamp']}  {len(snapshot[ADDED])} routes")
+                continue
+
+            counts = f"+{len(snapshot[ADDED])} -{len(snapshot[REMOVED])} ~{len(snapshot[CHANGED])}"
+            line = f"  {snapshot['name']:<16} {snapshot['timestamp']}  {counts:<18}"
+
+            removed = sorted(snapshot[REMOVED])
+            if removed:
+                shown = ", ".join(_encode_key(key) for key in removed[:limit])
+                line += f" removed {shown}" + (f" and {len(removed) - limit} more" if len(removed) > limit else "")
+
+            lines.append(line.rstrip())
+
+        flapping = self.flapping()
+        if flapping:
+            lines.append("  flapping: " + ", ".join(f"{prefix} ({count}x)" for prefix, count in sorted(flapping.items())))
+
+        return "\n".join(lines)
+
+    def _index_events(self):
+        # prefix -> [(snapshot position, event)], in order.  Built once so a prefix query does not scan
+        # every delta
+        events = {}
+
+        for position, snapshot in enumerate(self.snapshots):
+            for event in (REMOVED, ADDED, CHANGED):
+                for key in snapshot[event]:
+                    events.setdefault(key, []).append((position, event))
+
+        self._events = events
+
+    def _load(self):
+        try:
+            with gzip.open(self.path, "rt") as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.error(f"{self.path} could not be read, the timeline will be rebuilt: {e}")
+            return
+
+        if data.get("version") != FORMAT_VERSION:
+            return
+
+        for snapshot in data["snapshots"]:
+            self.snapshots.append({
+                "name": snapshot["name"],
+                "identity": snapshot["identity"],
+                "timestamp": snapshot["timestamp"],
+                ADDED: {parse_prefix_query(key): _decode_entry(entry) for key, entry in snapshot[ADDED].items()},
+                REMOVED: {parse_prefix_query(key): _decode_entry(entry) for key, entry in snapshot[REMOVED].items()},
+                CHANGED: {parse_prefix_query(key): (_decode_entry(before), _decode_entry(after))
+                          for key, (before, after) in snapshot[CHANGED].items()},
+            })
+
+        self._index_events()
+
+    def _save(self):
+        data = {
+            "version": FORMAT_VERSION,
+            "host": self.host,
+            "snapshots": [
+                {
+                    "name": snapshot["name"],
+                    "identity": snapshot["identity"],
+                    "timestamp": snapshot["timestamp"],
+                    ADDED: {_encode_key(key): _encode_entry(entry) for key, entry in snapshot[ADDED].items()},
+                    REMOVED: {_encode_key(key): _encode_entry(entry) for key, entry in snapshot[REMOVED].items()},
+                    CHANGED: {_encode_key(key): [_encode_entry(before), _encode_entry(after)]
+                              for key, (before, after) in snapshot[CHANGED].items()},
+                }
+                for snapshot in self.snapshots
+            ],
+        }
+
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with gzip.open(temp_path, "wt") as file:
+            json.dump(data, file)
+        os.replace(temp_path, self.path)
+
+
+def host_timeline(host_dir, prefixes=()):
+    """
+    host_timeline Brings a host's timeline up to date and answers the prefix queries.  Runs in a worker
+    process, so failures are returned rather than raised
+
+    Args:
+        host_dir (str|Path): The host's directory under routes/
+        prefixes (list): Prefixes to report the status and history of
+
+    Returns:
+        dict: host, the rendered history and a status with history per prefix, or an error
+    """
+
+    report = {"host": pathlib.Path(host_dir).name}
+
+    try:
+        timeline = RouteTimeline(host_dir)
+        timeline.update()
+
+        report["render"] = timeline.render()
+        report["prefixes"] = [dict(timeline.status(prefix), history=timeline.history(prefix)) for prefix in prefixes]
+
+    except (OSError, ValueError, KeyError) as e:
+        report["error"] = str(e)
+
+    return report
+
+
+def fleet_timeline(routes_dir="routes", hosts=None, prefixes=(), max_workers: int = None):
+    """
+    fleet_timeline Updates the timeline of every host (or the chosen ones) in parallel
+
+    Args:
+        routes_dir (str|Path): The directory get_routes.py saves snapshots in
+        hosts (list): Hostnames to limit the run to.  Every host when None
+        prefixes (list): Prefixes to query on every host
+        max_workers (int): Worker processes.  Defaults to the number of CPUs
+
+    Returns:
+        list: One host_timeline report per host
+    """
+
+    host_dirs = [path for path in host_directories(routes_dir) if not hosts or path.name in hosts]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(host_timeline, str(host_dir), list(prefixes)) for host_dir in host_dirs]
+        reports = [future.result() for future in futures]
+
+    for report in reports:
+        if "error" in report:
+            logging.error(f"Could not build the timeline for {report['host']}: {report['error']}")
+
+    return reports
@@ -0,0 +1,259 @@
+import contextlib
+import re
+import time
+
+from netmiko import ConnectHandler
+from ntc_templates.parse import parse_output
+
+from helpers.commands import RunCommand, ScopedCommand
+from helpers.logs import logging, capture_raw_output
+from helpers.metrics import metrics
+from utilities.collector import DeviceResult, connection_profile, failed_result
+from utilities.route_table import int_to_ip, parse_prefix
+from utilities.snapshot_store import SnapshotStore
+
+"""
+    Reduced-output collection.  Instead of pulling the whole of show ip route on every run, the route
+    count of each vrf is checked first and only the vrfs whose count moved since the previous snapshot are
+    pulled again.  Alternatively only chosen prefixes are refreshed.  Either way the partial results are
+    stitched back onto the previous snapshot so the saved table is always complete
+"""
+
+# IOS:   "Total           3           12          0           1020        2808"  (networks + subnets)
+_IOS_TOTAL = re.compile(r"^Total\s+(\d+)\s+(\d+)", re.MULTILINE)
+# NX-OS: "Total number of routes: 15"
+_NXOS_TOTAL = re.compile(r"Total number of routes:\s*(\d+)")
+
+_VRF_HEADERS = ("Name", "VRF-Name")
+
+
+def parse_route_count(output: str):
+    """
+    parse_route_count Pulls the total number of routes out of show ip route summary output
+
+    Args:
+        output (str): The raw summary output from IOS or NX-OS
+
+    Returns:
+        int: The route count, None if it could not be found
+    """
+
+    match = _NXOS_TOTAL.search(output)
+    if match:
+        return int(match.group(1))
+
+    match = _IOS_TOTAL.search(output)
+    if match:
+        return int(match.group(1)) + int(match.group(2))
+
+    return None
+
+
+def parse_vrf_names(output: str):
+    """
+    parse_vrf_names Reads the vrf names from show vrf.  The name is the first column on IOS and NX-OS;
+    lines with a single field are interface continuation lines on IOS and are skipped
+
+    Returns:
+        set: vrf names
+    """
+
+    names = set()
+
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) >= 2 and fields[0] not in _VRF_HEADERS:
+            names.add(fields[0])
+
+    return names
+
+
+def parse_prefix_scope(scope: str):
+    """
+    parse_prefix_scope Reads a prefix scope as given on the command line, "10.1.0.0/16" for the default
+    vrf or "VRFNAME:10.1.0.0/16"
+
+    Returns:
+        tuple: (vrf, network as int, prefix length)
+    """
+
+    vrf, _, prefix = scope.rpartition(":")
+    network, prefixlen = parse_prefix(prefix)
+
+    return vrf or "default", network, prefixlen
+
+
+class ScopedCollection():
+    """
+    ScopedCollection A DeviceCollector worker that pulls only what changed since the host's previous
+    snapshot.  Devices with no previous snapshot get a full pull of show ip route, the same as a normal
+    collection, and later runs stay within the vrfs of the previous snapshot so every snapshot of a host
+    covers the same vrfs
+
+    Counts are compared on prefixes, so a vrf where a next hop changed but the number of routes did not
+    is not pulled again.  Run a normal collection periodically (or use prefix scopes for the prefixes
+    being migrated) when that matters
+
+        Methods:
+
+            collect - Worker with the same signature and result as collect_device
+    """
+
+    def __init__(self, session_pool=None, root=None, prefixes=None, parser=None):
+        """
+        Args:
+            session_pool (SessionPool): Borrow sessions from this pool instead of connecting each time
+            root (str|Path): Where the snapshot stores live.  routes/ by default
+            prefixes (list): Prefix scopes (see parse_prefix_scope).  When given only these prefixes are
+            refreshed and the vrf counts are not checked
+            parser (callable): Parses each partial output, e.g. a ParseCache's parse.  parse_output by default
+        """
+
+        self.session_pool = session_pool
+        self.root = root
+        self.prefixes = [parse_prefix_scope(scope) for scope in prefixes or ()]
+        self.parser = parser or parse_output
+
+    def collect(self, host: str, device_type: str, command: str, timeout: float = 60, parser=None, profile: str = None):
+
+        start = time.monotonic()
+        parser = parser or self.parser
+
+        try:
+            with self._connection(host, device_type, timeout, profile) as (hostname, connection):
+                routes, received = self._collect_from(connection, host, hostname, device_type, timeout, parser)
+
+        except Exception as e:
+            return failed_result(host, device_type, command, e, start, "Scoped collection")
+
+        # The output is already parsed and stitched, so the parsing stage passes this result straight through
+        return DeviceResult(host, device_type, DeviceResult.SUCCESS, hostname=hostname, command=command,
+                            raw_output="\n".join(received), parsed_output=routes, elapsed=time.monotonic() - start)
+
+    @contextlib.contextmanager
+    def _connection(self, host: str, device_type: str, timeout: float, profile: str = None):
+
+        if self.session_pool is not None:
+            with self.session_pool.connection(host, device_type, profile, timeout) as session:
+                yield session
+            return
+
+        with metrics.stage(host, "connect"):
+            connection = ConnectHandler(**connection_profile(host, device_type, timeout, profile))
+
+        with connection:
+            # Activate enable mode
+            with metrics.stage(host, "enable"):
+                connection.enable()
+            # Grab the hostname.  Assumes the name at the command prompt is the hostname
+            yield connection.find_prompt()[:-1], connection
+
+    def _collect_from(self, connection, host: str, hostname: str, device_type: str, timeout: float, parser):
+
+        received = []
+
+        def run(command):
+            with metrics.stage(host, "send_command"):
+                output = connection.send_command(command, read_timeout=timeout)
+            metrics.add(host, "bytes_received", len(output))
+            capture_raw_output(host, command, output, hostname)
+            received.append(output)
+            return output
+
+        def pull(command, vrf):
+            output = run(command)
+            with metrics.stage(host, "parse"):
+                routes = parser(platform=device_type, command=command, data=output)
+            # IOS per-vrf output has no vrf column, fill it in so the routes land in the right vrf
+            for route in routes:
+                if not route.get("vrf"):
+                    route["vrf"] = vrf
+            return routes
+
+        store = SnapshotStore(hostname, self.root)
+
+        if not store.snapshots:
+            logging.info(f"No previous snapshot for {hostname}, pulling the full table")
+            command = RunCommand.show_routes()
+            return parser(platform=device_type, command=command, data=run(command)), received
+
+        with store.load() as snapshot:
+            previous = list(snapshot.routes())
+
+        if self.prefixes:
+            routes = self._refresh_prefixes(previous, device_type, pull)
+            self._log(hostname, received, f"refreshed {len(self.prefixes)} prefixes")
+            return routes, received
+
+        previous_vrfs = {}
+        for route in previous:
+            previous_vrfs.setdefault(route.vrf, []).append(route)
+
+        # Only the vrfs already in the previous snapshot are collected.  The first snapshot is a plain show
+        # ip route, which on IOS and NX-OS alike is the default vrf only, so pulling every vrf the device
+        # has would add whole vrfs the baseline never had and the diff would report them as new routes.
+        # vrfs that have since been deleted on the device are dropped
+        device_vrfs = parse_vrf_names(run(ScopedCommand.show_vrfs(device_type))) | {"default"}
+        tracked_vrfs = (set(previous_vrfs) | {"default"}) & device_vrfs
+
+        untracked = device_vrfs - set(previous_vrfs) - {"default"}
+        if untracked:
+            logging.info(f"{hostname} has vrfs that are not in its previous snapshot and are not collected: {', '.join(sorted(untracked))}")
+
+        routes = []
+        pulled = 0
+        failed = 0
+
+        for vrf in sorted(tracked_vrfs):
+            kept = previous_vrfs.get(vrf)
+            count = None
+
+            if kept is not None:
+                count = parse_route_count(run(ScopedCommand.show_routes_summary(device_type, vrf)))
+                if count == len({(route.network_int, route.prefixlen) for route in kept}):
+                    routes.extend(kept)
+                    continue
+
+            fresh = pull(ScopedCommand.show_routes_vrf(device_type, vrf), vrf)
+            prefixes = len({(route.get("network"), route.get("mask")) for route in fresh})
+
+            # A pull that came back empty when the summary could not be read, or that does not agree with
+            # the summary, is more likely a rejected command or a parse failure than the vrf's real table.
+            # Saving it would have the diff report the vrf's routes as removed, so the previous routes stay
+            if kept is not None and (prefixes != count if count is not None else not fresh):
+                logging.error(f"Pulled {prefixes} prefixes from vrf {vrf} on {hostname} but its route summary "
+                              f"reported {'none that could be read' if count is None else count}.  Keeping the "
+                              f"{len(kept)} routes from the previous snapshot for this vrf")
+                routes.extend(kept)
+                failed += 1
+                continue
+
+            routes.extend(fresh)
+            pulled += 1
+
+        self._log(hostname, received, f"pulled {pulled} of {len(tracked_vrfs)} vrfs"
+                                      + (f", kept the previous routes of {failed} that could not be pulled" if failed else ""))
+
+        return routes, received
+
+    def _refresh_prefixes(self, previous: list, device_type: str, pull):
+        # Drop every previous route inside a scope and replace it with what the device reports now
+        def in_scope(route):
+            for vrf, network, prefixlen in self.prefixes:
+                netmask = (0xFFFFFFFF << (32 - prefixlen)) & 0xFFFFFFFF
+                if route.vrf == vrf and route.prefixlen >= prefixlen and route.network_int & netmask == network:
+                    return True
+            return False
+
+        routes = [route for route in previous if not in_scope(route)]
+
+        for vrf, network, prefixlen in self.prefixes:
+            mask = int_to_ip((0xFFFFFFFF << (32 - prefixlen)) & 0xFFFFFFFF)
+            command = ScopedCommand.show_routes_prefix(device_type, vrf, int_to_ip(network), prefixlen, mask)
+            routes.extend(pull(command, vrf))
+
+        return routes
+
+    @staticmethod
+    def _log(hostname: str, received: list, detail: str):
+        logging.info(f"Scoped collection from {hostname}: {detail}, {sum(len(output) for output in received)} bytes received")
@@ -0,0 +1,230 @@
+import contextlib
+import threading
+import time
+
+from netmiko import ConnectHandler
+
+from helpers.logs import logging, capture_raw_output
+from helpers.metrics import metrics
+from utilities.collector import DeviceResult, connection_profile, failed_result
+
+"""
+    Keeps Netmiko sessions open between collection rounds.  During a migration the routes are pulled
+    every few minutes and, without a pool, every poll pays for the SSH handshake, authentication and
+    enable() on every device.  With the sessions kept open a repeat poll costs only the command round trip
+"""
+
+
+class _Session():
+
+    __slots__ = ("connection", "hostname", "lock", "created", "uses")
+
+    def __init__(self):
+        self.connection = None
+        self.hostname = None
+        self.lock = threading.Lock()
+        self.created = 0.0
+        self.uses = 0
+
+
+class SessionPool():
+    """
+    SessionPool Netmiko sessions keyed by host.  A session is health checked before it is used and
+    transparently reconnected if the device dropped it.  Safe to use from the collector's worker threads,
+    each host's session is only ever used by one thread at a time
+
+    Use as a context manager so every session is disconnected:
+
+        with SessionPool() as pool:
+            collector.collect(devices, command, worker=pool.collect)
+
+        Methods:
+
+            collect - A DeviceCollector worker that runs the command over a pooled session
+
+            send_command - Runs a command on a host over its pooled session
+
+            connection - Lends out a host's pooled session for several commands
+
+            close - Disconnects one host
+
+            close_all - Disconnects every host
+    """
+
+    def __init__(self, timeout: float = 60, max_age: float = None):
+        """
+        Args:
+            timeout (float): Connection timeout used when (re)connecting, unless the caller gives its own
+            max_age (float): Seconds after which a session is replaced even if healthy.  None keeps
+            sessions for as long as they stay up
+        """
+
+        self.timeout = timeout
+        self.max_age = max_age
+        self.connects = 0
+        self.reconnects = 0
+
+        self._sessions = {}
+        # Guards the session dictionary and the connection counters, which every worker thread updates
+        self._lock = threading.Lock()
+
+    def collect(self, host: str, device_type: str, command: str, timeout: float = 60, parser=None, profile: str = None):
+        """
+        collect Same signature and result as collect_device, but the session is taken from the pool
+        and left open afterwards
+        """
+
+        start = time.monotonic()
+
+        try:
+            hostname, raw_output = self.send_command(host, device_type, command, timeout, profile)
+
+            parsed_output = None
+            if parser is not None:
+                with metrics.stage(host, "parse"):
+                    parsed_output = parser(platform=device_type, command=command, data=raw_output)
+
+        except Exception as e:
+            return failed_result(host, device_type, command, e, start)
+
+        return DeviceResult(host, device_type, DeviceResult.SUCCESS, hostname=hostname, command=command,
+                            raw_output=raw_output, parsed_output=parsed_output, elapsed=time.monotonic() - start)
+
+    def send_command(self, host: str, device_type: str, command: str, timeout: float = 60, profile: str = None):
+        """
+        send_command Runs a command over the host's pooled session.  If the session turns out to be
+        dead part way through, it is reconnected and the command is tried once more.  Any other failure
+        drops the session, as the rest of the output may still be on its way and would otherwise be read
+        as the output of the next command.  A new session is connected with the given timeout, so a slow
+        device's adaptive timeout applies to the connect as well
+
+        Returns:
+            tuple: (hostname, raw output)
+        """
+
+        session = self._session(host)
+
+        with session.lock:
+            for attempt in range(2):
+                self._ensure_connected(session, host, device_type, profile, timeout)
+
+                try:
+                    with metrics.stage(host, "send_command"):
+                        raw_output = session.connection.send_command(command, read_timeout=timeout)
+                except (OSError, EOFError) as e:
+                    self._disconnect(session)
+                    if attempt:
+                        raise
+                    logging.info(f"Session to {host} dropped ({e}), reconnecting")
+                    with self._lock:
+                        self.reconnects += 1
+                    continue
+                except Exception:
+                    # e.g. a read timeout, with the rest of the output still to come
+                    self._disconnect(session)
+                    raise
+
+                session.uses += 1
+                metrics.add(host, "bytes_received", len(raw_output))
+                capture_raw_output(host, command, raw_output, session.hostname)
+                return session.hostname, raw_output
+
+    @contextlib.contextmanager
+    def connection(self, host: str, device_type: str, profile: str = None, timeout: float = None):
+        """
+        connection Lends out the host's session for running several commands.  No other thread can use
+        the session until the with block ends
+
+            with pool.connection(host, device_type) as (hostname, connection):
+                connection.send_command(...)
+
+        Args:
+            timeout (float): Connect timeout if the session has to be connected.  Defaults to the pool's
+
+        Yields:
+            tuple: (hostname, Netmiko connection)
+        """
+
+        session = self._session(host)
+
+        with session.lock:
+            self._ensure_connected(session, host, device_type, profile, timeout)
+            session.uses += 1
+            yield session.hostname, session.connection
+
+    def close(self, host: str):
+
+        with self._lock:
+            session = self._sessions.pop(host, None)
+
+        if session is not None:
+            with session.lock:
+                self._disconnect(session)
+
+    def close_all(self):
+
+        with self._lock:
+            hosts = list(self._sessions)
+
+        for host in hosts:
+            self.close(host)
+
+        logging.info(f"Session pool closed.  {self.connects} connections made, {self.reconnects} of them reconnects")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close_all()
+
+    def _session(self, host: str):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = self._sessions[host] = _Session()
+            return session
+
+    def _ensure_connected(self, session: _Session, host: str, device_type: str, profile: str = None, timeout: float = None):
+        # Called with the session lock held
+        if session.connection is not None:
+            expired = self.max_age is not None and time.monotonic() - session.created > self.max_age
+
+            try:
+                healthy = not expired and session.connection.is_alive()
+            except Exception:
+                healthy = False
+
+            if healthy:
+                return
+
+            logging.info(f"Session to {host} is {'too old' if expired else 'no longer alive'}, reconnecting")
+            self._disconnect(session)
+            with self._lock:
+                self.reconnects += 1
+
+        with metrics.stage(host, "connect"):
+            connection = ConnectHandler(**connection_profile(host, device_type, timeout or self.timeout, profile))
+
+        try:
+            # Activate enable mode
+            with metrics.stage(host, "enable"):
+                connection.enable()
+            # Grab the hostname.  Assumes the name at the command prompt is the hostname
+            session.hostname = connection.find_prompt()[:-1]
+        except Exception:
+            connection.disconnect()
+            raise
+
+        session.connection = connection
+        session.created = time.monotonic()
+        with self._lock:
+            self.connects += 1
+
+    @staticmethod
+    def _disconnect(session: _Session):
+        if session.connection is not None:
+            try:
+                session.connection.disconnect()
+            except Exception:
+                pass
+            session.connection = None
@@ -0,0 +1,398 @@
+import array
+import hashlib
+import json
+import mmap
+import os
+import pathlib
+import struct
+import sys
+from datetime import datetime
+
+from helpers.logs import logging
+from utilities.route_table import Route, RouteTable
+
+"""
+    A versioned store of routing table snapshots per host.  Each host directory under routes/ gets a
+    manifest.json listing every snapshot (id, name, timestamp, route count, checksum and the number of
+    entries that are only in the CSV, see add) so finding the next
+    snapshot name or the latest snapshot is a lookup in the manifest rather than probing the filesystem.
+
+    Snapshots are saved in a compact columnar binary format (.rts):
+
+        header      magic, version, byte order, route count, string count
+        strings     uint32 offsets followed by one utf-8 blob.  Every vrf, protocol, type and next hop
+                    string is stored once
+        columns     network (uint32), prefixlen (uint8), distance (int32), metric (int64) and uint32
+                    string table indexes for vrf, protocol, type, nexthop_ip and nexthop_if
+
+    Every section starts on an 8 byte boundary so the columns can be read straight out of a memory map
+    without copying
+"""
+
+MAGIC = b"RTS1"
+VERSION = 1
+HEADER = struct.Struct("=4sHBxIII")
+
+# (column name, array typecode), in file order
+COLUMNS = (
+    ("network", "I"),
+    ("prefixlen", "B"),
+    ("distance", "i"),
+    ("metric", "q"),
+    ("vrf", "I"),
+    ("protocol", "I"),
+    ("type", "I"),
+    ("nexthop_ip", "I"),
+    ("nexthop_if", "I"),
+)
+
+STRING_COLUMNS = ("vrf", "protocol", "type", "nexthop_ip", "nexthop_if")
+
+_LITTLE, _BIG = 0, 1
+
+
+def _pad(length: int):
+    return -length % 8
+
+
+def encode_routes(routes):
+    """
+    encode_routes Packs routes into the .rts binary format
+
+    Args:
+        routes (iterable): Route objects, e.g. a RouteTable
+
+    Returns:
+        bytes: The encoded snapshot
+    """
+
+    strings = {"": 0}
+    columns = {name: array.array(typecode) for name, typecode in COLUMNS}
+
+    def string_id(value):
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    for route in routes:
+        columns["network"].append(route.network_int)
+        columns["prefixlen"].append(route.prefixlen)
+        columns["distance"].append(-1 if route.distance_int is None else route.distance_int)
+        columns["metric"].append(-1 if route.metric_int is None else route.metric_int)
+        for name in STRING_COLUMNS:
+            columns[name].append(string_id(getattr(route, name)))
+
+    encoded = [value.encode("utf-8") for value in strings]
+    offsets = array.array("I", [0])
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+
+    byteorder = _LITTLE if sys.byteorder == "little" else _BIG
+    parts = [HEADER.pack(MAGIC, VERSION, byteorder, len(columns["network"]), len(encoded), offsets[-1])]
+
+    def section(data: bytes):
+        parts.append(data)
+        parts.append(b"\0" * _pad(len(data)))
+
+    # The header is 20 bytes, pad it so the sections that follow are aligned
+    parts.append(b"\0" * _pad(HEADER.size))
+    section(offsets.tobytes())
+    section(b"".join(encoded))
+
+    for name, _ in COLUMNS:
+        section(columns[name].tobytes())
+
+    return b"".join(parts)
+
+
+class Snapshot():
+    """
+    Snapshot A decoded .rts snapshot.  The columns are memoryviews over a memory map of the file (or
+    arrays, when the file was written on a machine with the other byte order), so loading a snapshot
+    does not read or copy the routes until they are used
+
+        Methods:
+
+            routes - Yields a Route per row
+
+            table - Builds a RouteTable
+
+            close - Releases the memory map
+    """
+
+    def __init__(self, path):
+
+        self.path = pathlib.Path(path)
+
+        if self.path.stat().st_size < HEADER.size:
+            raise ValueError(f"{self.path} is not a route snapshot")
+
+        with open(self.path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._buffer = buffer = memoryview(self._mmap)
+        magic, version, byteorder, count, string_count, blob_size = HEADER.unpack_from(buffer)
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path} is not a version {VERSION} route snapshot")
+
+        swap = byteorder != (_LITTLE if sys.byteorder == "little" else _BIG)
+        offset = HEADER.size + _pad(HEADER.size)
+
+        def take(typecode, length):
+            nonlocal offset
+            size = array.array(typecode).itemsize * length
+            view = buffer[offset:offset + size]
+            offset += size + _pad(size)
+
+            if swap:
+                values = array.array(typecode, view.tobytes())
+                values.byteswap()
+                return values
+            return view.cast(typecode)
+
+        offsets = take("I", string_count + 1)
+        blob = buffer[offset:offset + blob_size]
+        offset += blob_size + _pad(blob_size)
+
+        self.strings = [bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8") for i in range(string_count)]
+        self.columns = {name: take(typecode, count) for name, typecode in COLUMNS}
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def routes(self):
+        strings = self.strings
+        columns = [self.columns[name] for name, _ in COLUMNS]
+
+        for network, prefixlen, distance, metric, vrf, protocol, type, nexthop_ip, nexthop_if in zip(*columns):
+            yield Route(network, prefixlen, vrf=strings[vrf], protocol=strings[protocol], type=strings[type],
+                        distance=None if distance < 0 else distance, metric=None if metric < 0 else metric,
+                        nexthop_ip=strings[nexthop_ip], nexthop_if=strings[nexthop_if])
+
+    def table(self):
+        return RouteTable(self.routes())
+
+    def close(self):
+        # The column views have to be released before the map can be closed
+        for view in self.columns.values():
+            if isinstance(view, memoryview):
+                view.release()
+        self.columns = {}
+        self._buffer.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _probe_next_name(directory: pathlib.Path, hostname: str):
+    # The next snapshot name for a host collected before the store existed, worked out from the CSV files of
+    # its earlier runs.  The first is original_routes, after that each run gets the next migrated_xxx
+    # number.  Compressed and uncompressed files count the same
+
+    def exists(name):
+        stem = f"{hostname}_{name}"
+        return (directory / f"{stem}.csv").is_file() or (directory / f"{stem}.csv.gz").is_file()
+
+    if not exists("original_routes"):
+        return "original_routes"
+
+    i = 1
+    while exists(f"migrated_{i:03d}"):
+        i += 1
+
+    return f"migrated_{i:03d}"
+
+
+class SnapshotStore():
+    """
+    SnapshotStore The snapshots for one host, numbered from 0 in the order they were taken.  The first
+    is the original table and every later snapshot is a migrated one
+
+        Methods:
+
+            next_name - Name the next snapshot will be saved under
+
+            add - Saves a new snapshot and records it in the manifest
+
+            latest - Manifest entry of the newest snapshot
+
+            get - Manifest entry by id
+
+            load - Opens a snapshot by id
+
+            verify - Checks a snapshot file against its manifest checksum
+    """
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, hostname: str, root=None):
+        """
+        Args:
+            hostname (str): The device hostname
+            root (str|Path): The directory holding one subdirectory per host.  Defaults to routes/ in the
+            working directory
+        """
+
+        self.hostname = hostname
+        self.directory = (pathlib.Path(root) if root else pathlib.Path.cwd() / "routes") / hostname
+        self.manifest_path = self.directory / SnapshotStore.MANIFEST
+        self.snapshots = self._read_manifest()
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def next_name(self):
+        """
+        next_name The name of the next snapshot, e.g. original_routes or migrated_004.  Hosts collected
+        before the store existed have no manifest, so for those the directory is probed once for the
+        CSV files of earlier runs to keep the numbering going
+        """
+
+        if not self.snapshots:
+            return _probe_next_name(self.directory, self.hostname)
+
+        last = self.snapshots[-1]["name"]
+        number = int(last.rsplit("_", 1)[1]) if last.startswith("migrated_") else 0
+
+        return f"migrated_{number + 1:03d}"
+
+    def add(self, routes, name: str = None, skipped=None):
+        """
+        add Encodes the routes, writes the .rts file and appends it to the manifest.  The binary format
+        holds IPv4 routes only.  Entries that are not, which the CSV still carries, are counted in the
+        manifest entry so readers know to go to the CSV for them
+
+        Args:
+            routes (iterable): Route objects, e.g. a RouteTable
+            name (str): Snapshot name.  Defaults to next_name()
+            skipped (list): The entries left out of the binary snapshot.  Defaults to the RouteTable's
+            skipped list.  Counted once the routes are encoded, so a list filled while they are read works
+
+        Returns:
+            dict: The new manifest entry
+        """
+
+        name = name or self.next_name()
+        data = encode_routes(routes)
+        skipped = getattr(routes, "skipped", ()) if skipped is None else skipped
+        filename = f"{self.hostname}_{name}.rts"
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._write_atomic(self.directory / filename, data)
+
+        entry = {
+            "id": len(self.snapshots),
+            "name": name,
+            "file": filename,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "routes": HEADER.unpack_from(data)[3],
+            "checksum": hashlib.sha256(data).hexdigest(),
+            "skipped": len(skipped),
+        }
+
+        self.snapshots.append(entry)
+        self._write_atomic(self.manifest_path, json.dumps({"hostname": self.hostname, "snapshots": self.snapshots}, indent=2).encode())
+
+        logging.info(f"Saved snapshot {entry['id']} ({name}) for {self.hostname} with {entry['routes']} routes")
+
+        return entry
+
+    def latest(self):
+        return self.snapshots[-1] if self.snapshots else None
+
+    def get(self, snapshot_id: int):
+        """
+        get Manifest entry by id.  Negative ids count back from the latest like list indexes
+
+        Raises:
+            KeyError: If there is no such snapshot
+        """
+
+        try:
+            return self.snapshots[snapshot_id]
+        except IndexError:
+            raise KeyError(f"{self.hostname} has no snapshot {snapshot_id}")
+
+    def load(self, snapshot_id: int = -1):
+        """
+        load Opens a snapshot by id, the latest by default
+
+        Returns:
+            Snapshot: The memory mapped snapshot
+        """
+
+        return Snapshot(self.directory / self.get(snapshot_id)["file"])
+
+    def verify(self, snapshot_id: int):
+        """
+        verify Recomputes a snapshot's checksum
+
+        Returns:
+            bool: True if the file matches the manifest
+        """
+
+        entry = self.get(snapshot_id)
+        with open(self.directory / entry["file"], "rb") as file:
+            return hashlib.sha256(file.read()).hexdigest() == entry["checksum"]
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, "r") as file:
+                return json.load(file)["snapshots"]
+        except FileNotFoundError:
+            return []
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            # Starting an empty manifest would lose every earlier snapshot as soon as the next one is added
+            logging.error(f"{self.manifest_path} could not be read ({e}), rebuilding it from the snapshot files")
+            return self._rebuild_manifest()
+
+    def _rebuild_manifest(self):
+        # Lists the .rts files in the host directory in snapshot order, original_routes first and then the
+        # migrated_xxx numbers.  The timestamp is the file's modification time.  How many entries were left
+        # out of each file is not known, so the count is left out too.  The rebuilt manifest is written out
+        # with the next snapshot that is added
+        prefix = f"{self.hostname}_"
+
+        def order(path):
+            name = path.stem[len(prefix):]
+            number = name.rsplit("_", 1)[1] if name.startswith("migrated_") else ""
+            return (name != "original_routes", int(number) if number.isdigit() else sys.maxsize, path.stat().st_mtime)
+
+        snapshots = []
+
+        for path in sorted(self.directory.glob(f"{prefix}*.rts"), key=order):
+            try:
+                data = path.read_bytes()
+                magic, version, _, count, _, _ = HEADER.unpack_from(data)
+                if magic != MAGIC or version != VERSION:
+                    raise ValueError(f"not a version {VERSION} route snapshot")
+            except (OSError, struct.error, ValueError) as e:
+                logging.error(f"Leaving {path.name} out of the rebuilt manifest, it could not be read: {e}")
+                continue
+
+            snapshots.append({
+                "id": len(snapshots),
+                "name": path.stem[len(prefix):],
+                "file": path.name,
+                "timestamp": datetime.fromtimestamp(path.stat().st_mtime).isoformat(timespec="seconds"),
+                "routes": count,
+                "checksum": hashlib.sha256(data).hexdigest(),
+            })
+
+        logging.warning(f"Rebuilt the manifest for {self.hostname} with {len(snapshots)} snapshots")
+
+        return snapshots
+
+    @staticmethod
+    def _write_atomic(path: pathlib.Path, data: bytes):
+        temp_path = path.with_name(path.name + ".tmp")
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
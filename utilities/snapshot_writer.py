@@ -0,0 +1,148 @@
+import csv
+import gzip
+import pathlib
+
+"""
+    Writes routing table snapshots to CSV.  One header per file, rows buffered and handed to the csv
+    module in bulk, and the columns chosen from a schema registry keyed on the Netmiko platform so new
+    platforms only need a registry entry instead of another branch in get_routes.py
+"""
+
+# Columns written for each platform.  IOS has no vrf column in its show ip route output.  Scoped collection
+# stays within the vrfs of a host's first snapshot, which on IOS is the global table only, so IOS
+# snapshots never hold another vrf either
+SCHEMAS = {
+    "cisco_nxos": ("vrf", "protocol", "type", "network", "mask", "distance", "metric", "nexthop_ip", "nexthop_if"),
+    "cisco_ios": ("protocol", "type", "network", "mask", "distance", "metric", "nexthop_ip", "nexthop_if"),
+}
+
+# Used for any platform without a registry entry
+DEFAULT_SCHEMA = SCHEMAS["cisco_nxos"]
+
+
+def register_schema(platform: str, fields):
+    """
+    register_schema Adds or replaces the columns written for a platform
+
+    Args:
+        platform (str): The Netmiko device type, e.g. cisco_xe
+        fields (iterable): The route fields to write, in column order
+    """
+
+    SCHEMAS[platform] = tuple(fields)
+
+
+def schema_for(platform: str):
+    """
+    schema_for The columns written for a platform, falling back to DEFAULT_SCHEMA
+
+    Returns:
+        tuple: Field names
+    """
+
+    return SCHEMAS.get(platform, DEFAULT_SCHEMA)
+
+
+class SnapshotWriter():
+    """
+    SnapshotWriter Streams routes to a CSV (optionally gzip compressed) snapshot.  The header is written
+    once when the file is opened and rows are collected into a buffer that is written in one call once it
+    fills, so large tables are not written a row at a time
+
+    Use as a context manager so the buffer is always flushed:
+
+        with SnapshotWriter(path, "cisco_nxos") as writer:
+            writer.write_many(routes)
+
+        Methods:
+
+            write - Adds a single route
+
+            write_many - Adds every route from an iterable
+
+            flush - Writes out any buffered rows
+
+            close - Flushes and closes the file
+    """
+
+    def __init__(self, path, platform: str, compress: bool = False, buffer_size: int = 5000):
+        """
+        Args:
+            path (str|Path): Where to write.  .gz is appended when compressing if not already there
+            platform (str): The Netmiko device type, used to pick the columns from SCHEMAS
+            compress (bool): gzip the snapshot
+            buffer_size (int): Rows held before they are written out
+        """
+
+        path = pathlib.Path(path)
+        if compress and path.suffix != ".gz":
+            path = path.with_name(path.name + ".gz")
+
+        self.path = path
+        self.platform = platform
+        self.fields = schema_for(platform)
+        self.compress = compress
+        self.buffer_size = buffer_size
+        self.count = 0
+
+        self._buffer = []
+
+        if compress:
+            self._file = gzip.open(path, "wt", newline="", compresslevel=6)
+        else:
+            self._file = open(path, "w", newline="")
+
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.fields)
+
+    def write(self, route):
+        """
+        write Adds a route.  Accepts parse_output dictionaries or anything with a dictionary style get(),
+        such as a Route from a RouteTable.  Fields missing from the route are left blank
+        """
+
+        self._buffer.append([route.get(field, "") for field in self.fields])
+
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def write_many(self, routes):
+        for route in routes:
+            self.write(route)
+
+    def flush(self):
+        if self._buffer:
+            self._writer.writerows(self._buffer)
+            self.count += len(self._buffer)
+            self._buffer = []
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_snapshot(path):
+    """
+    read_snapshot Reads a snapshot written by SnapshotWriter back as route dictionaries, the same shape
+    parse_output produces.  gzip compressed snapshots are detected by their .gz suffix
+
+    Args:
+        path (str|Path): The snapshot file
+
+    Yields:
+        dict: One route per row
+    """
+
+    path = pathlib.Path(path)
+    opener = gzip.open if path.suffix == ".gz" else open
+
+    with opener(path, "rt", newline="") as file:
+        yield from csv.DictReader(file)
@@ -0,0 +1,227 @@
+import contextlib
+import pathlib
+import time
+
+from netmiko import ConnectHandler, NetmikoTimeoutException
+
+from helpers.logs import logging
+from helpers.metrics import metrics
+from utilities.collector import DeviceResult, collect_device, connection_profile, failed_result
+from utilities.route_table import Route
+from utilities.snapshot_store import SnapshotStore
+from utilities.snapshot_writer import SnapshotWriter
+from utilities.stream_parser import iter_lines, parser_for
+
+"""
+    Streaming collection for very large routing tables.  send_command returns the output as one string,
+    parse_output turns all of it into a list of dictionaries and the RouteTable is built from that list,
+    so a large Nexus table is in memory several times over before anything is written.  Here the output
+    is read off the channel in pieces as the device sends it, each route is parsed as soon as its line
+    arrives and goes straight into the CSV and the binary snapshot.  The only thing that grows with the
+    table is the snapshot's columns, a few dozen bytes a route
+"""
+
+
+class ChannelReader():
+    """
+    ChannelReader Runs a command and reads its output off the Netmiko channel in pieces, stopping at the
+    device prompt.  Nothing is kept once it has been handed on
+
+        reader = ChannelReader(connection, "show ip route", timeout=60)
+        for line in reader.lines():
+            ...
+
+        Methods:
+
+            chunks - Yields the output as it is read off the channel
+
+            lines - Yields the output a line at a time, without the echoed command or the prompt
+    """
+
+    def __init__(self, connection, command: str, timeout: float = 60, poll_interval: float = 0.01):
+        """
+        Args:
+            connection: A Netmiko connection, in enable mode
+            command (str): The command to run
+            timeout (float): Seconds allowed for the whole output, as send_command's read_timeout
+            poll_interval (float): Seconds to wait when the channel has nothing to read
+        """
+
+        self.connection = connection
+        self.command = command
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.bytes_received = 0
+        self.prompt = None
+
+    def chunks(self):
+        """
+        chunks Sends the command and yields whatever the channel has as it arrives, the echoed command and
+        the closing prompt included
+
+        Raises:
+            NetmikoTimeoutException: If the prompt has not come back within the timeout
+        """
+
+        prompt = self.prompt = self.connection.find_prompt()
+        self.connection.write_channel(self.command + self.connection.RETURN)
+
+        deadline = time.monotonic() + self.timeout
+        # Only the end of the output is kept to look for the prompt, which may be split across reads
+        tail = ""
+
+        while True:
+            chunk = self.connection.read_channel()
+
+            if chunk:
+                self.bytes_received += len(chunk)
+                yield chunk
+
+                tail = (tail + chunk)[-(len(prompt) + 8):]
+                if tail.rstrip().endswith(prompt):
+                    return
+
+            if time.monotonic() > deadline:
+                raise NetmikoTimeoutException(f"Timed out after {self.timeout} seconds waiting for the output of {self.command}")
+
+            if not chunk:
+                time.sleep(self.poll_interval)
+
+    def lines(self):
+
+        lines = iter_lines(self.chunks())
+
+        # The device echoes the command back ahead of the output
+        previous = next(lines, None)
+        if previous is not None and previous.strip().endswith(self.command):
+            previous = next(lines, None)
+
+        # Each line is held back until the next one arrives, so the last, the prompt, can be left out
+        for line in lines:
+            yield previous
+            previous = line
+
+        if previous is not None and previous.strip() != self.prompt:
+            yield previous
+
+
+class StreamingCollection():
+    """
+    StreamingCollection A DeviceCollector worker that parses the output while it is still being read and
+    saves the snapshot as it goes, rather than handing the output back to be parsed.  The result it
+    returns carries the saved snapshot's manifest entry in place of the output, and the parsing stage
+    and collect_round pass it straight through.
+
+    Routes are written in the order the device prints them rather than sorted by vrf and prefix, which the
+    diff tooling does not mind.  Platforms without an incremental parser (see stream_parser.STREAM_PARSERS)
+    are collected the usual way.  The raw output is not captured for streamed devices, holding on to it is
+    what streaming avoids
+
+        collector.collect(devices, command, worker=StreamingCollection().collect)
+
+        Methods:
+
+            collect - Worker with the same signature as collect_device
+    """
+
+    def __init__(self, session_pool=None, root=None, compress: bool = False):
+        """
+        Args:
+            session_pool (SessionPool): Borrow sessions from this pool instead of connecting each time
+            root (str|Path): The directory holding one subdirectory per host.  routes/ by default
+            compress (bool): gzip the CSV snapshot
+        """
+
+        self.session_pool = session_pool
+        self.root = pathlib.Path(root) if root else None
+        self.compress = compress
+
+    def collect(self, host: str, device_type: str, command: str, timeout: float = 60, parser=None, profile: str = None):
+
+        start = time.monotonic()
+
+        if parser_for(device_type) is None:
+            logging.info(f"No incremental parser for {device_type}, collecting {host} without streaming")
+            worker = self.session_pool.collect if self.session_pool is not None else collect_device
+            return worker(host, device_type, command, timeout, parser, profile)
+
+        try:
+            with self._connection(host, device_type, timeout, profile) as (hostname, connection):
+                snapshot = self._stream_to_snapshot(connection, host, hostname, device_type, command, timeout)
+
+        except Exception as e:
+            return failed_result(host, device_type, command, e, start, "Streaming collection")
+
+        return DeviceResult(host, device_type, DeviceResult.SUCCESS, hostname=hostname, command=command,
+                            snapshot=snapshot, elapsed=time.monotonic() - start)
+
+    @contextlib.contextmanager
+    def _connection(self, host: str, device_type: str, timeout: float, profile: str = None):
+
+        if self.session_pool is not None:
+            try:
+                with self.session_pool.connection(host, device_type, profile, timeout) as session:
+                    yield session
+            except Exception:
+                # A device that failed part way through may still be sending the rest of its table, which
+                # would be read as the output of the next command run over the session.  Drop the session
+                # once the pool has let go of it, so the next round connects afresh
+                self.session_pool.close(host)
+                raise
+            return
+
+        with metrics.stage(host, "connect"):
+            connection = ConnectHandler(**connection_profile(host, device_type, timeout, profile))
+
+        with connection:
+            # Activate enable mode
+            with metrics.stage(host, "enable"):
+                connection.enable()
+            # Grab the hostname.  Assumes the name at the command prompt is the hostname
+            yield connection.find_prompt()[:-1], connection
+
+    def _stream_to_snapshot(self, connection, host: str, hostname: str, device_type: str, command: str, timeout: float):
+        # Reads, parses and writes in one pass.  Each route is written to the CSV and handed to the snapshot
+        # store as it is parsed, so neither the output nor the parsed routes are ever held as a whole
+
+        store = SnapshotStore(hostname, self.root)
+        snapshot_name = store.next_name()
+        store.directory.mkdir(parents=True, exist_ok=True)
+
+        reader = ChannelReader(connection, command, timeout)
+        parse = parser_for(device_type)
+        # Entries that are not IPv4 routes still go in the CSV but not the binary snapshot
+        skipped = []
+        writer = None
+
+        def routes():
+            for entry in parse(reader.lines()):
+                writer.write(entry)
+                try:
+                    yield Route.from_dict(entry)
+                except (KeyError, ValueError, OSError):
+                    skipped.append(entry)
+
+        try:
+            with metrics.stage(host, "stream"):
+                with SnapshotWriter(store.directory / f"{hostname}_{snapshot_name}.csv", device_type, compress=self.compress) as writer:
+                    # The binary snapshot is only written once the last route is in, so a device that
+                    # drops part way through leaves no snapshot behind
+                    snapshot = store.add(routes(), snapshot_name, skipped=skipped)
+
+        except Exception:
+            # Do not leave a partial CSV to be mistaken for a complete snapshot
+            if writer is not None:
+                writer.path.unlink(missing_ok=True)
+            raise
+
+        metrics.add(host, "bytes_received", reader.bytes_received)
+        metrics.set(host, "routes", snapshot["routes"])
+
+        if skipped:
+            prefixes = ", ".join(f"{entry.get('network', '?')}/{entry.get('mask', '?')}" for entry in skipped)
+            logging.warning(f"{len(skipped)} entries from {hostname} could not be read as IPv4 routes and are only in the CSV: {prefixes}")
+
+        logging.info(f"Streamed {reader.bytes_received} bytes from {hostname} into {writer.path.name} with {writer.count} routes")
+
+        return snapshot
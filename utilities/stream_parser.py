@@ -0,0 +1,237 @@
+import re
+
+"""
+    Incremental parsers for show ip route.  parse_output needs the whole output as one string and hands
+    back the whole table as a list of dictionaries, so a large Nexus table is held in memory several times
+    over before the first route is written.  The parsers here take the output a line at a time and yield
+    each route as soon as its line has been read, with the same keys and values the NTC templates produce,
+    so routes can go straight to a SnapshotWriter while the device is still sending the rest of the table.
+
+    They follow the cisco_nxos_show_ip_route and cisco_ios_show_ip_route templates rule for rule, including
+    the filldown of the prefix onto the extra next hop lines of ECMP routes
+"""
+
+_IP = r"\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}"
+
+# The values each template records, in template order.  Every route dictionary has all of them, unset
+# values are empty strings just as they are from parse_output
+NXOS_FIELDS = ("vrf", "protocol", "type", "network", "mask", "distance", "metric", "nexthop_ip", "nexthop_if",
+               "uptime", "nexthop_vrf", "tag", "segid", "tunnelid", "encap")
+IOS_FIELDS = ("protocol", "type", "network", "mask", "distance", "metric", "nexthop_ip", "nexthop_if", "uptime")
+
+_NXOS_VRF = re.compile(r'^IP\s+Route\s+Table\s+for\s+VRF\s+"(?P<vrf>\S+)"\s*$')
+_NXOS_PREFIX = re.compile(rf"^\s*(?P<network>{_IP})/(?P<mask>\d{{1,2}}), ubest/mbest:")
+
+# One expression for every *via line the template knows: with or without the next hop address, the
+# outgoing interface, the route type, the tag and the VXLAN fields.  The type is never the word tag, which
+# is how the template tells "ospf-1, intra" from "static, tag 100"
+_NXOS_VIA = re.compile(
+    rf"^\s+\*+via (?:(?P<nexthop_ip>{_IP})(?:%(?P<nexthop_vrf>\S+))?, )?(?:(?P<nexthop_if>[\w./]+), )?"
+    r"\[(?P<distance>\d+)/(?P<metric>\d+)\], (?P<uptime>[\w:.]+), (?P<protocol>[\w-]+)"
+    r"(?:, (?!tag )(?P<type>[\w-]+))?(?:, tag (?P<tag>\d+(?: \(\w+\))?))?"
+    r"(?:\s+segid: (?P<segid>\d+)\s+tunnelid: (?P<tunnelid>0x[a-f\d]+)\s+encap: (?P<encap>\w+))?"
+)
+
+_IOS_GATEWAY = re.compile(r"^Gateway")
+_IOS_SUBNETTED = re.compile(rf"^\s+{_IP}/(?P<mask>\d{{1,2}})\sis")
+_IOS_ROUTE = re.compile(rf"^(?P<protocol>\w)[\s*](?P<type>\w{{0,2}})\s+(?P<network>{_IP})(?:/(?P<mask>\d{{1,2}}))?")
+
+# What can follow the prefix on a route line, tried in the template's order.  A route line matching none
+# of them has its next hops on the lines below
+_IOS_ROUTE_REST = (
+    re.compile(r"\sis\sdirectly\sconnected,\s(?P<nexthop_if>[A-Z][\w\-.:/]+)"),
+    re.compile(rf"\s\[(?P<distance>\d+)/(?P<metric>\d+)\]\svia\s(?P<nexthop_ip>{_IP})"
+               r"(?:,\s(?P<uptime>\d[\w:.]+))?(?:,\s(?P<nexthop_if>[A-Z][\w\-.:/]+))?"),
+    re.compile(r"\s\[(?P<distance>\d+)/(?P<metric>\d+)\],\s(?P<uptime>\d[\w:.]+),\s(?P<nexthop_if>[A-Z][\w\-.:/]+)"),
+    re.compile(r"\sis\sa\ssummary,\s(?P<uptime>\d[\w:.]+),\s(?P<nexthop_if>[A-Z][\w\-.:/]+)"),
+)
+
+# Next hops on the lines below the prefix, ECMP routes have one line per extra path
+_IOS_NEXTHOP = re.compile(rf"^\s+\[(?P<distance>\d+)/(?P<metric>\d+)\]\svia\s(?P<nexthop_ip>{_IP})"
+                          r"(?:,\s(?P<uptime>\d[\w:.]+))?(?:,\s(?P<nexthop_if>[A-Z][\w\-.:/]+))?")
+
+
+def iter_lines(chunks):
+    """
+    iter_lines Reassembles lines from output read in arbitrary pieces.  Only the line currently being
+    assembled is held, never the whole output.  Carriage returns are stripped
+
+    Args:
+        chunks (iterable): Strings as they were read from the channel
+
+    Yields:
+        str: One line at a time, the last one even without a newline
+    """
+
+    partial = ""
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+
+        lines = (partial + chunk).split("\n")
+        partial = lines.pop()
+
+        for line in lines:
+            yield line.rstrip("\r")
+
+    if partial:
+        yield partial.rstrip("\r")
+
+
+def _route(fields, values: dict, match):
+    # A route dictionary in template order from the filled down values and the groups of the line matched
+    route = dict.fromkeys(fields, "")
+    route.update(values)
+    for name, value in match.groupdict().items():
+        if value is not None:
+            route[name] = value
+    return route
+
+
+def parse_nxos_routes(lines):
+    """
+    parse_nxos_routes Yields routes from cisco_nxos show ip route output.  The vrf comes from the table
+    heading and the prefix from the ubest/mbest line, and both are filled down onto every *via line below
+    them, so an ECMP route gives one dictionary per next hop just like parse_output
+
+    Args:
+        lines (iterable): The output a line at a time, see iter_lines
+
+    Yields:
+        dict: One route per next hop
+    """
+
+    filldown = {"vrf": "", "network": "", "mask": ""}
+
+    for line in lines:
+
+        match = _NXOS_VIA.match(line)
+        if match:
+            route = _route(NXOS_FIELDS, filldown, match)
+
+            # The template only reads the VXLAN fields on routes without an outgoing interface, and on
+            # those (recursive BGP next hops, most often) it only reads a type for VXLAN routes.  Do the
+            # same so a snapshot taken with either parser compares cleanly with one taken with the other
+            if route["nexthop_if"]:
+                route["segid"] = route["tunnelid"] = route["encap"] = ""
+            elif route["type"] and not route["segid"]:
+                route["type"] = route["tag"] = ""
+
+            yield route
+            continue
+
+        match = _NXOS_PREFIX.match(line)
+        if match:
+            filldown["network"], filldown["mask"] = match.group("network", "mask")
+            continue
+
+        match = _NXOS_VRF.match(line)
+        if match:
+            filldown["vrf"] = match.group("vrf")
+
+        # Anything else is the heading's legend, a blank line or "Route not found" for an empty vrf, none
+        # of which is a route
+
+
+def parse_ios_routes(lines):
+    """
+    parse_ios_routes Yields routes from cisco_ios show ip route output.  The protocol, type, prefix and
+    mask are filled down from the route line onto the next hop lines that follow it, which covers ECMP
+    routes as well as routes whose first next hop is printed on the line below the prefix.  The mask
+    from an "is subnetted" line is used for routes printed without one
+
+    Args:
+        lines (iterable): The output a line at a time, see iter_lines
+
+    Yields:
+        dict: One route per next hop
+    """
+
+    lines = iter(lines)
+
+    # Nothing before the gateway of last resort is a route
+    for line in lines:
+        if _IOS_GATEWAY.match(line):
+            break
+
+    filldown = {}
+
+    for line in lines:
+
+        match = _IOS_SUBNETTED.match(line)
+        if match:
+            filldown["mask"] = match.group("mask")
+            continue
+
+        match = _IOS_ROUTE.match(line)
+        if match:
+            filldown.update((name, value) for name, value in match.groupdict().items() if value is not None)
+
+            for rest in _IOS_ROUTE_REST:
+                detail = rest.match(line, match.end())
+                if detail:
+                    yield _route(IOS_FIELDS, filldown, detail)
+                    break
+            continue
+
+        match = _IOS_NEXTHOP.match(line)
+        if match:
+            if filldown.get("network"):
+                yield _route(IOS_FIELDS, filldown, match)
+            continue
+
+        # Blank lines and anything unrecognised end the current route
+        filldown = {}
+
+
+# Incremental parser for each platform, keyed on the Netmiko device type
+STREAM_PARSERS = {
+    "cisco_nxos": parse_nxos_routes,
+    "cisco_ios": parse_ios_routes,
+}
+
+
+def register_parser(platform: str, parser):
+    """
+    register_parser Adds or replaces the incremental parser for a platform
+
+    Args:
+        platform (str): The Netmiko device type, e.g. cisco_xe
+        parser (callable): Takes an iterable of lines and yields route dictionaries
+    """
+
+    STREAM_PARSERS[platform] = parser
+
+
+def parser_for(platform: str):
+    """
+    parser_for The incremental parser for a platform
+
+    Returns:
+        callable: The parser, or None if the platform can only be parsed with parse_output
+    """
+
+    return STREAM_PARSERS.get(platform)
+
+
+def stream_routes(platform: str, chunks):
+    """
+    stream_routes Parses output read in pieces, yielding each route as soon as it is complete
+
+    Args:
+        platform (str): The Netmiko device type
+        chunks (iterable): The output as read from the channel, in pieces of any size
+
+    Yields:
+        dict: Route dictionaries with the same keys as parse_output
+
+    Raises:
+        KeyError: If there is no incremental parser for the platform
+    """
+
+    parser = parser_for(platform)
+    if parser is None:
+        raise KeyError(f"No incremental parser for {platform}")
+
+    yield from parser(iter_lines(chunks))